@@ -1,6 +1,10 @@
 from django.db import models
 from django.contrib.auth.models import User
 
+# Cache key of the number of published articles shown under the cursor
+# paginated listing, deleted by .signals when an article changes
+PUBLISHED_COUNT_KEY = 'articles:published-count'
+
 class Category(models.Model):
     name = models.CharField(max_length=200)
 
@@ -16,6 +20,12 @@ class Article(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # the published articles, newest first
+            models.Index(fields=['published', '-created_at', '-id'], name='article_published_created'),
+        ]
+
     def __str__(self):
         return self.title
 
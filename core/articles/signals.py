@@ -0,0 +1,15 @@
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+
+from .models import PUBLISHED_COUNT_KEY, Article
+
+
+# Publishing, unpublishing or deleting an article changes the count; the
+# cache timeout bounds how stale it gets after a queryset update().
+
+def article_changed(sender, instance, **kwargs):
+    cache.delete(PUBLISHED_COUNT_KEY)
+
+
+post_save.connect(article_changed, sender=Article, dispatch_uid='article_saved')
+post_delete.connect(article_changed, sender=Article, dispatch_uid='article_deleted')
@@ -1,3 +1,34 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
 
-# Create your tests here.
+from .models import Article, Category
+
+
+class ArticleListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('alice', password='secret')
+        self.category = Category.objects.create(name='News')
+        for i in range(7):
+            self.create_article(f'Article {i}')
+
+    def create_article(self, title, published=True):
+        return Article.objects.create(title=title, content='...', published=published, category=self.category, author=self.author)
+
+    def test_pages_by_number(self):
+        response = self.client.get(reverse('all_articles'), {'page': 2})
+        self.assertEqual(response.context['articles'].number, 2)
+        self.assertEqual([article.title for article in response.context['articles']], ['Article 1', 'Article 0'])
+
+    @override_settings(CURSOR_PAGINATION=True)
+    def test_count_follows_changes(self):
+        self.assertEqual(self.client.get(reverse('all_articles')).context['articles'].count, 7)
+        article = self.create_article('Article 7')
+        self.assertEqual(self.client.get(reverse('all_articles')).context['articles'].count, 8)
+        article.published = False
+        article.save()
+        self.assertEqual(self.client.get(reverse('all_articles')).context['articles'].count, 7)
+        Article.objects.first().delete()
+        self.assertEqual(self.client.get(reverse('all_articles')).context['articles'].count, 6)
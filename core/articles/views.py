@@ -1,26 +1,16 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from .models import Article, Comment
+from .models import PUBLISHED_COUNT_KEY, Article, Comment
 
 # def all_articles(request):
 #     articles = Article.objects.filter(published=True)
 #     return render(request, 'articles/articles_list.html', {'articles': articles})
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from core.pagination import paginate
 
 def all_articles(request):
-    articles = Article.objects.filter(published=True).order_by('-created_at')
+    articles = Article.objects.filter(published=True)
 
-    # Pagination
-    page = request.GET.get('page', 1)
-    paginator = Paginator(articles, 5) 
-    try:
-        articles_page = paginator.page(page)
-    except PageNotAnInteger:
-        articles_page = paginator.page(1)
-    except EmptyPage:
-        articles_page = paginator.page(paginator.num_pages)
-
-    # Create a range of page numbers for numeric pagination
-    page_range = range(max(1, articles_page.number - 2), min(articles_page.number + 3, paginator.num_pages + 1))
+    # Newest first
+    articles_page, page_range = paginate(request, articles, 5, salt='articles.all_articles', count_cache_key=PUBLISHED_COUNT_KEY)
 
     return render(request, 'articles/articles_list.html', {'articles': articles_page, 'page_range': page_range})
 
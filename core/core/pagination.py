@@ -0,0 +1,126 @@
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+
+class CursorPage:
+    """One page of a CursorPaginator, iterable like a Paginator page."""
+
+    def __init__(self, object_list, next_token, previous_token, count=None):
+        self.object_list = object_list
+        self.next_token = next_token
+        self.previous_token = previous_token
+        self.count = count  # approximate total, None when not counted
+
+    @property
+    def has_next(self):
+        return self.next_token is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_token is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class CursorPaginator:
+    """Keyset pagination over a queryset, newest first by `key_fields`.
+
+    Instead of a COUNT(*) and an OFFSET, each page continues from the key of
+    the last (or first) row of the page before, so every page costs one
+    indexed range query however deep it is. The cursors handed to clients
+    are signed, so they are opaque and cannot be forged.
+
+    The last key field must be unique (the primary key by default) so rows
+    with equal values of the others are neither skipped nor repeated.
+    """
+
+    def __init__(self, queryset, per_page, key_fields=('created_at', 'id'), salt='core.pagination',
+                 count_cache_key=None, count_timeout=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.key_fields = list(key_fields)
+        self.salt = salt
+        # With a cache key the total is counted once per count_timeout
+        self.count_cache_key = count_cache_key
+        self.count_timeout = count_timeout or getattr(settings, 'CURSOR_PAGINATION_COUNT_TIMEOUT', 5 * 60)
+
+    def page(self, token=None):
+        # An invalid or missing token gives the first page
+        direction, key = self.decode(token)
+        if direction == 'previous':
+            rows = list(self.queryset.filter(self.beyond(key, newer=True)).order_by(*self.key_fields)[:self.per_page + 1])
+            has_more = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            has_next, has_previous = True, has_more
+        else:
+            queryset = self.queryset if key is None else self.queryset.filter(self.beyond(key, newer=False))
+            rows = list(queryset.order_by(*[f'-{field}' for field in self.key_fields])[:self.per_page + 1])
+            has_more = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_next, has_previous = has_more, key is not None
+
+        next_token = self.encode('next', rows[-1]) if rows and has_next else None
+        previous_token = self.encode('previous', rows[0]) if rows and has_previous else None
+        return CursorPage(rows, next_token, previous_token, self.count())
+
+    def count(self):
+        if self.count_cache_key is None:
+            return None
+        return cache.get_or_set(self.count_cache_key, self.queryset.count, self.count_timeout)
+
+    def beyond(self, key, newer):
+        # Rows after `key` in the page order: (a, b) < (x, y) is written as
+        # a < x OR (a = x AND b < y), which databases can answer from an
+        # index on the key fields.
+        lookup = 'gt' if newer else 'lt'
+        condition = Q()
+        for i, field in enumerate(self.key_fields):
+            equal = {name: value for name, value in zip(self.key_fields[:i], key[:i])}
+            condition |= Q(**equal, **{f'{field}__{lookup}': key[i]})
+        return condition
+
+    def encode(self, direction, row):
+        values = [self.queryset.model._meta.get_field(field).value_to_string(row) for field in self.key_fields]
+        return signing.dumps([direction, values], salt=self.salt, compress=True)
+
+    def decode(self, token):
+        if not token:
+            return 'next', None
+        try:
+            direction, values = signing.loads(token, salt=self.salt)
+            key = [
+                self.queryset.model._meta.get_field(field).to_python(value)
+                for field, value in zip(self.key_fields, values)
+            ]
+        except (signing.BadSignature, TypeError, ValueError, ValidationError):
+            return 'next', None
+        if direction not in ('next', 'previous') or len(key) != len(self.key_fields):
+            return 'next', None
+        return direction, key
+
+
+def paginate(request, queryset, per_page, **options):
+    """The page of `queryset` a listing request asks for, and the page
+    numbers to link to around it.
+
+    Pages are numbered (?page=) unless the CURSOR_PAGINATION setting is on;
+    then they are CursorPaginator pages (?cursor=), built with `options`,
+    and there are no page numbers.
+    """
+    paginator = CursorPaginator(queryset, per_page, **options)
+    if getattr(settings, 'CURSOR_PAGINATION', False):
+        return paginator.page(request.GET.get('cursor')), None
+    # In the same order as the cursor pages; invalid numbers give the first
+    # page and numbers past the end the last
+    numbered = Paginator(queryset.order_by(*[f'-{field}' for field in paginator.key_fields]), per_page)
+    page = numbered.get_page(request.GET.get('page'))
+    page_range = range(max(1, page.number - 2), min(page.number + 3, numbered.num_pages + 1))
+    return page, page_range
@@ -89,6 +89,20 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/ref/settings/#caches
+# The local memory cache is per process. When analyses run in separate
+# worker processes, use a cache they share with the web process (e.g.
+# FileBasedCache) so new reports invalidate the rendered charts.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'reports',
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -125,10 +139,143 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Where the copy_plotly_js command puts plotly.js, under a file name that
+# changes with its version. Serve STATIC_URL/plotly/ with
+# Cache-Control: public, max-age=31536000, immutable; a gzipped copy sits
+# next to each file for web servers that serve pre-compressed files.
+
+PLOTLY_JS_DIR = BASE_DIR / 'vendor' / 'plotly'
+
 STATICFILES_DIRS = [
     BASE_DIR / 'static',
+    ('plotly', PLOTLY_JS_DIR),
 ]
 
+# Scraper
+# Concurrency bounds for sizing page resources, see scraper.sizing
+
+SCRAPER_MAX_WORKERS = 16
+
+SCRAPER_PER_HOST_CONNECTIONS = 6
+
+SCRAPER_REQUEST_TIMEOUT = 10  # seconds
+
+# Bytes read at most when a resource has to be sized by downloading it
+
+SCRAPER_STREAM_SIZE_LIMIT = 50 * 1024 * 1024
+
+# Site crawl mode, see scraper.crawl
+
+SCRAPER_CRAWL_MAX_PAGES = 10
+
+SCRAPER_CRAWL_MAX_DEPTH = 2  # link hops from the start page
+
+SCRAPER_CRAWL_WORKERS = 4  # pages fetched concurrently
+
+SCRAPER_CRAWL_DELAY = 0.5  # seconds between page requests to the same host
+
+SCRAPER_CRAWL_MAX_PAGE_SIZE = 5 * 1024 * 1024  # bytes of HTML read at most; larger pages are skipped
+
+# Bulk analysis (analyze_urls command and batch endpoint), see scraper.bulk
+
+SCRAPER_BULK_WORKERS = 8  # URLs analyzed at the same time
+
+SCRAPER_BULK_MAX_WORKERS = 16  # upper bound for the batch endpoint
+
+SCRAPER_BULK_BATCH_SIZE = 50  # analyses saved per bulk insert
+
+SCRAPER_BULK_MAX_URLS = 5000  # per request to the batch endpoint
+
+# Persistent URL -> size cache, see scraper.cache
+
+SCRAPER_SIZE_CACHE = True
+
+SCRAPER_SIZE_CACHE_TTL = 7 * 24 * 60 * 60  # seconds before an entry is revalidated
+
+SCRAPER_SIZE_CACHE_MAX_ENTRIES = 100000
+
+# HTML parser backend, see scraper.parsers: 'stream', 'lxml-stream',
+# 'html.parser', 'lxml' or 'auto' (lxml-stream when lxml is installed)
+
+SCRAPER_HTML_PARSER = 'stream'
+
+# Stylesheet stage, see scraper.css: linked stylesheets and their @imports
+# are read for the background images and fonts they load
+
+SCRAPER_CSS_MAX_IMPORT_DEPTH = 4  # levels of @import followed
+
+SCRAPER_CSS_MAX_STYLESHEETS = 50  # read per page
+
+SCRAPER_CSS_MAX_SIZE = 2 * 1024 * 1024  # bytes; larger stylesheets are only sized
+
+SCRAPER_CSS_CACHE_TIMEOUT = 7 * 24 * 60 * 60  # seconds parsed stylesheets are cached, by content hash
+
+# Shared keep-alive HTTP session, see scraper.client
+
+SCRAPER_HTTP_POOL_HOSTS = 32  # hosts with a cached connection pool
+
+SCRAPER_HTTP_POOL_MAXSIZE = SCRAPER_PER_HOST_CONNECTIONS  # connections per host
+
+SCRAPER_HTTP_RETRIES = 2
+
+SCRAPER_HTTP_BACKOFF_FACTOR = 0.5  # seconds, doubled on each retry
+
+SCRAPER_HTTP_MAX_RETRY_AFTER = 5  # seconds waited at most when a server sends Retry-After
+
+# Async analysis. When served by core.asgi, turn SCRAPER_ASYNC_ANALYZE on to
+# analyze on the event loop with httpx (scraper.views.AsyncWebParser)
+# instead of queueing jobs; keep it off under WSGI.
+
+SCRAPER_ASYNC_ANALYZE = False
+
+SCRAPER_ASYNC_MAX_CONNECTIONS = 200  # open connections of the async client, all hosts
+
+SCRAPER_ASYNC_MAX_KEEPALIVE = 50  # idle connections kept for reuse
+
+# Analysis jobs, see scraper.jobs. When SCRAPER_JOBS_IN_PROCESS is off,
+# queued jobs are only run by `manage.py run_analysis_workers`.
+
+SCRAPER_JOBS_IN_PROCESS = True
+
+SCRAPER_JOB_WORKERS = 2
+
+SCRAPER_JOBS_POLL_INTERVAL = 2  # seconds
+
+# A running job not finished within its lease lost its worker (a restart or
+# a crash): the next claim queues it again, or fails it after the last attempt
+
+SCRAPER_JOB_LEASE_TIMEOUT = 15 * 60  # seconds
+
+SCRAPER_JOB_MAX_ATTEMPTS = 2
+
+# Reports
+# Seconds a rendered report chart spec is cached, see reports.charts. New or
+# deleted reports invalidate the specs, so the timeout only bounds how long
+# unused specs stay in the cache.
+
+REPORT_CHART_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Seconds the hosting provider ids are cached for sampling, see reports.hosting
+
+REPORT_HOSTING_PROVIDER_TTL = 5 * 60
+
+# Version of the reports.carbon model new reports are scored with. After
+# changing it, run `manage.py rescore_carbon_footprints` to rescore older
+# reports.
+
+CARBON_MODEL_VERSION = 1
+
+# Page the report and article listings by cursor (?cursor=) rather than by
+# page number (?page=). Cursor pages cost the same at any depth but cannot
+# be linked to by number. See core.pagination.
+
+CURSOR_PAGINATION = False
+
+# Seconds the approximate totals shown under cursor paginated listings are
+# cached
+
+CURSOR_PAGINATION_COUNT_TIMEOUT = 5 * 60
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
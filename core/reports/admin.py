@@ -1,5 +1,10 @@
 from django.contrib import admin
-from .models import WebsiteReport, PageReport, ImageReport, VideoReport, CarbonFootprintReport, Recommendation, HostingProvider
+from .models import WebsiteReport, PageReport, ImageReport, VideoReport, CarbonFootprintReport, Recommendation, HostingProvider, DailyCarbonRollup
+
+class ReportAdmin(admin.ModelAdmin):
+    # The changelist shows each report's __str__, which follows its relations
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_related()
 
 admin.site.register([
     WebsiteReport, 
@@ -8,5 +13,7 @@ admin.site.register([
     VideoReport, 
     CarbonFootprintReport, 
     Recommendation, 
-    HostingProvider
-])
\ No newline at end of file
+    DailyCarbonRollup,
+], ReportAdmin)
+
+admin.site.register(HostingProvider)
@@ -0,0 +1,131 @@
+from itertools import islice, repeat
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .charts import bump_data_version
+from .models import CarbonFootprintReport, ImageReport, VideoReport
+from .rollups import rebuild_rollups
+from .stats import CARBON_FOOTPRINT_STATS, refresh_summaries
+
+GIGABYTE_TO_BYTES = 1073741824
+
+
+class CarbonModel:
+    """Estimates the energy and CO2e of transferring data.
+
+    A model is identified by its version, which is stored on every
+    CarbonFootprintReport it scores, so reports can be re-scored when the
+    coefficients change. score() works on whole arrays of sizes at once.
+    """
+
+    def __init__(self, version, carbon_intensity, kilowatt_hours_per_gigabyte):
+        self.version = version
+        self.carbon_intensity = carbon_intensity  # estimated grams of CO2e per kilowatt-hour
+        self.kilowatt_hours_per_gigabyte = kilowatt_hours_per_gigabyte
+
+    def energy(self, sizes_in_kb):
+        # in kilowatt-hours
+        sizes_in_bytes = np.asarray(sizes_in_kb, dtype=np.float64) * 1024
+        return sizes_in_bytes * (self.kilowatt_hours_per_gigabyte / GIGABYTE_TO_BYTES)
+
+    def carbon_footprint(self, sizes_in_kb):
+        return self.energy(sizes_in_kb) * self.carbon_intensity
+
+    def score(self, page_sizes, image_sizes, video_sizes):
+        """The CarbonFootprintReport fields for arrays of page, image and
+        video sizes, as a dict of arrays."""
+        page_sizes = np.asarray(page_sizes, dtype=np.float64)
+        image_sizes = np.asarray(image_sizes, dtype=np.float64)
+        video_sizes = np.asarray(video_sizes, dtype=np.float64)
+        energy = self.energy(page_sizes)
+        return {
+            'total_energy_usage': energy,
+            # The score has always been the page's energy usage
+            'carbon_footprint_score': energy,
+            'carbon_footprint_images': self.carbon_footprint(image_sizes),
+            'carbon_footprint_videos': self.carbon_footprint(video_sizes),
+            'carbon_footprint_other': self.carbon_footprint(page_sizes - image_sizes - video_sizes),
+        }
+
+    def score_page(self, page_size, image_size, video_size):
+        # score() for a single page, as floats
+        return {field: float(values[0]) for field, values in self.score([page_size], [image_size], [video_size]).items()}
+
+
+# Every model reports may have been scored with, by version. Add a new
+# version rather than changing the coefficients of an existing one.
+MODELS = {
+    1: CarbonModel(1, carbon_intensity=441.3, kilowatt_hours_per_gigabyte=1.805),
+}
+
+
+def get_carbon_model(version=None):
+    # The given version, or the one new reports are scored with
+    if version is None:
+        version = getattr(settings, 'CARBON_MODEL_VERSION', max(MODELS))
+    try:
+        return MODELS[version]
+    except KeyError:
+        raise ValueError(f'Unknown carbon model version {version}') from None
+
+
+def total_size(model):
+    # Summed total_size of a page's image or video reports, 0 without any
+    sizes = model.objects.filter(page=OuterRef('page')).order_by().values('page').annotate(total=Sum('total_size'))
+    return Coalesce(Subquery(sizes.values('total')), Value(0.0), output_field=FloatField())
+
+
+def write_scores(ids, version, scores):
+    # bulk_update builds a CASE expression per row and field in Python, which
+    # takes far longer than the scoring; one prepared UPDATE executed for
+    # every row is written as fast as the database can take it.
+    meta = CarbonFootprintReport._meta
+    columns = [meta.get_field(field).column for field in CARBON_FOOTPRINT_STATS + ['model_version']]
+    quote_name = connection.ops.quote_name
+    sql = (
+        f'UPDATE {quote_name(meta.db_table)} '
+        f'SET {", ".join(f"{quote_name(column)} = %s" for column in columns)} '
+        f'WHERE {quote_name(meta.pk.column)} = %s'
+    )
+    values = [scores[field].tolist() for field in CARBON_FOOTPRINT_STATS]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, zip(*values, repeat(version), ids))
+
+
+def rescore_carbon_footprints(carbon_model, reports=None, chunk_size=2000):
+    """Recompute carbon footprint reports with `carbon_model`.
+
+    The page, image and video sizes are streamed from the database in
+    chunks and each chunk is scored in one call and written back in one
+    batch. `reports` defaults to the reports scored with another
+    version. Returns the number of reports rescored.
+    """
+    if reports is None:
+        reports = CarbonFootprintReport.objects.exclude(model_version=carbon_model.version)
+    rows = reports.annotate(
+        image_size=total_size(ImageReport),
+        video_size=total_size(VideoReport),
+    ).order_by('id').values_list(
+        'id', 'user_id', 'page__website_id', 'page__page_size', 'image_size', 'video_size',
+    ).iterator(chunk_size=chunk_size)
+
+    count = 0
+    user_ids = set()
+    while chunk := list(islice(rows, chunk_size)):
+        ids, chunk_user_ids, website_ids, page_sizes, image_sizes, video_sizes = zip(*chunk)
+        scores = carbon_model.score(page_sizes, image_sizes, video_sizes)
+        with transaction.atomic():
+            write_scores(ids, carbon_model.version, scores)
+            # The writes send no signals, so keep the website totals here
+            refresh_summaries(set(website_ids), fields=CARBON_FOOTPRINT_STATS)
+        user_ids.update(chunk_user_ids)
+        count += len(chunk)
+
+    for user_id in user_ids:
+        rebuild_rollups(user=user_id)
+        bump_data_version(user_id)
+    return count
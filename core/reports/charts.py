@@ -0,0 +1,75 @@
+import importlib.util
+import json
+import uuid
+from functools import lru_cache
+from pathlib import Path
+
+import plotly.io as pio
+from plotly.offline import get_plotlyjs_version
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# plotly.js as installed with the plotly package. The copy_plotly_js command
+# copies just this file into settings.PLOTLY_JS_DIR, so collectstatic does not
+# pick up the rest of the package data (datasets, ...) along with it.
+PLOTLY_JS = Path(importlib.util.find_spec('plotly').origin).parent / 'package_data' / 'plotly.min.js'
+# Every chart uses this layout template; it is sent once per page
+CHART_TEMPLATE = 'plotly_dark'
+
+VERSION_KEY = 'reports:data-version:{user_id}'
+DATA_KEY = 'reports:data:{report_id}:{name}:{version}'
+
+
+def plotly_js_name():
+    """File name of the copied plotly.js, which changes with its version."""
+    return f'plotly-{get_plotlyjs_version()}.min.js'
+
+
+def data_version(user_id):
+    """Current version of a user's report data.
+
+    A report's page also charts the user's other reports (top three, last
+    30 days), so any report the user creates or deletes changes it. The
+    version is a random token rather than a counter, so an evicted version
+    can never come back and revive stale charts.
+    """
+    key = VERSION_KEY.format(user_id=user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_data_version(user_id):
+    # Deferred until commit, so a view running in between cannot cache
+    # charts of data that is about to change under the new version.
+    transaction.on_commit(
+        lambda: cache.set(VERSION_KEY.format(user_id=user_id), uuid.uuid4().hex, timeout=None)
+    )
+
+
+def cached_report_data(website, name, build):
+    # `build()` computes the data called `name` of a website report (a chart
+    # spec, the totals); it is reused until the user's report data changes.
+    key = DATA_KEY.format(report_id=website.id, name=name, version=data_version(website.user_id))
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, timeout=getattr(settings, 'REPORT_CHART_CACHE_TIMEOUT', 24 * 60 * 60))
+    return data
+
+
+def figure_spec(figure):
+    # A figure as the {data, layout} JSON Plotly.newPlot takes. Plotly's own
+    # encoder turns dates and arrays into JSON; the layout template is left
+    # out and sent once per page by chart_template().
+    spec = json.loads(figure.to_json())
+    spec['layout'].pop('template', None)
+    return spec
+
+
+@lru_cache(maxsize=None)
+def chart_template():
+    return pio.templates[CHART_TEMPLATE].to_plotly_json()
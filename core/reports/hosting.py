@@ -0,0 +1,47 @@
+import random
+import threading
+import time
+
+from django.conf import settings
+
+from .models import HostingProvider
+
+
+class HostingProviderSampler:
+    """Picks random hosting providers without ORDER BY RANDOM().
+
+    The provider ids are cached in the process for `ttl` seconds; a sample
+    draws ids from that list and loads just those rows by primary key, so
+    the cost of a sample does not grow with the provider table.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl if ttl is not None else getattr(settings, 'REPORT_HOSTING_PROVIDER_TTL', 300)
+        self._ids = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def ids(self):
+        with self._lock:
+            if self._ids is None or time.monotonic() - self._loaded_at >= self.ttl:
+                self._ids = list(HostingProvider.objects.values_list('id', flat=True))
+                self._loaded_at = time.monotonic()
+            return self._ids
+
+    def invalidate(self):
+        with self._lock:
+            self._ids = None
+
+    def sample(self, count=5):
+        ids = self.ids()
+        chosen = random.sample(ids, min(count, len(ids)))
+        providers = HostingProvider.objects.in_bulk(chosen)
+        # A provider deleted since the ids were cached is skipped
+        return [providers[id] for id in chosen if id in providers]
+
+
+sampler = HostingProviderSampler()
+
+
+def recommend_hosting_providers(count=5):
+    return sampler.sample(count)
@@ -0,0 +1,146 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.pagination import CursorPaginator
+from reports.models import CarbonFootprintReport, PageReport, WebsiteReport
+from reports.rollups import daily_history, rebuild_rollups
+from reports.stats import SUMMARY_FIELDS
+
+USERNAME_PREFIX = 'benchmark-user-'
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed synthetic users and reports, then time the queries behind the report views and show '
+        'their query plans. The seeded data is rolled back unless --keep is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help='Number of users to seed.')
+        parser.add_argument('--reports', type=int, default=100, help='Website reports per user.')
+        parser.add_argument('--repeat', type=int, default=20, help='Runs per query, the best and mean are reported.')
+        parser.add_argument('--analyze', action='store_true',
+                            help='Run EXPLAIN ANALYZE (PostgreSQL only) instead of EXPLAIN.')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded data.')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['reports'] < 1 or options['repeat'] < 1:
+            raise CommandError('--users, --reports and --repeat must be at least 1.')
+        if options['analyze'] and connection.vendor != 'postgresql':
+            raise CommandError('--analyze needs PostgreSQL.')
+        if User.objects.filter(username__startswith=USERNAME_PREFIX).exists():
+            raise CommandError(f'Users named {USERNAME_PREFIX}* already exist, delete them first.')
+
+        self.stdout.write(f"Database: {connection.vendor}")
+        with transaction.atomic():
+            started = time.perf_counter()
+            users = self.seed(options['users'], options['reports'])
+            self.stdout.write(
+                f"Seeded {options['users']} users with {options['reports']} reports each "
+                f'in {time.perf_counter() - started:.1f}s.'
+            )
+            # Fresh planner statistics, as a real database would have
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+            # A user in the middle of the seeded data and one of their websites
+            user = users[len(users) // 2]
+            website = WebsiteReport.objects.filter(user=user).order_by('-created_at').first()
+            for name, run in self.queries(user, website):
+                self.benchmark(name, run, options)
+
+            if not options['keep']:
+                transaction.set_rollback(True)
+
+    def seed(self, num_users, num_reports):
+        now = timezone.now()
+        users = User.objects.bulk_create([User(username=f'{USERNAME_PREFIX}{i}') for i in range(num_users)])
+        websites = WebsiteReport.objects.bulk_create([
+            WebsiteReport(user=user, url=f'https://site-{i % 50}.example.com', pages=1)
+            for user in users for i in range(num_reports)
+        ], batch_size=1000)
+        # created_at is auto_now_add, so spread the reports over a year afterwards
+        for website in websites:
+            website.created_at = now - timedelta(minutes=random.randrange(365 * 24 * 60))
+        WebsiteReport.objects.bulk_update(websites, ['created_at'], batch_size=1000)
+
+        pages = PageReport.objects.bulk_create([
+            PageReport(
+                user_id=website.user_id,
+                website=website,
+                url=website.url,
+                page_size=random.uniform(100, 5000),
+                num_images=random.randrange(50),
+                num_videos=random.randrange(3),
+                num_external_resources=random.randrange(30),
+                num_internal_links=random.randrange(100),
+                num_external_links=random.randrange(50),
+                num_social_media_links=random.randrange(10),
+            )
+            for website in websites
+        ], batch_size=1000)
+        carbon_footprint_reports = []
+        for page in pages:
+            energy = random.uniform(0.0001, 0.01)
+            carbon_footprint_reports.append(CarbonFootprintReport(
+                user_id=page.user_id,
+                page=page,
+                total_energy_usage=energy,
+                carbon_footprint_score=energy,
+                carbon_footprint_images=energy * 0.5,
+                carbon_footprint_videos=energy * 0.2,
+                carbon_footprint_other=energy * 0.3,
+            ))
+        carbon_footprint_reports = CarbonFootprintReport.objects.bulk_create(carbon_footprint_reports, batch_size=1000)
+        for report, page in zip(carbon_footprint_reports, pages):
+            report.created_at = page.website.created_at
+        CarbonFootprintReport.objects.bulk_update(carbon_footprint_reports, ['created_at'], batch_size=1000)
+
+        # bulk_create skipped the signals that keep the rollups
+        for user in users:
+            rebuild_rollups(user=user)
+        return users
+
+    def queries(self, user, website):
+        # (name, queryset) for each query the report views run
+        paginator = CursorPaginator(WebsiteReport.objects.for_user(user), 5)
+        middle = WebsiteReport.objects.for_user(user).order_by('-created_at', '-id')[WebsiteReport.objects.for_user(user).count() // 2]
+        return [
+            ('list_website_reports first page',
+             WebsiteReport.objects.for_user(user).order_by('-created_at', '-id')[:6]),
+            ('list_website_reports page in the middle',
+             WebsiteReport.objects.for_user(user).filter(
+                 paginator.beyond([middle.created_at, middle.id], newer=False),
+             ).order_by('-created_at', '-id')[:6]),
+            ('top three by energy usage',
+             CarbonFootprintReport.objects.for_user(user).top_by_energy_usage(3)),
+            ('carbon reports of a website',
+             CarbonFootprintReport.objects.filter(page__website=website)),
+            ('website statistics from the summary columns',
+             WebsiteReport.objects.filter(pk=website.pk).values(*SUMMARY_FIELDS)),
+            ('daily CO2 history, 30 days',
+             daily_history(user, 30)),
+            ('daily CO2 history, 365 days',
+             daily_history(user, 365)),
+        ]
+
+    def benchmark(self, name, queryset, options):
+        timings = []
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            rows = len(queryset.all())  # .all() copies the queryset, so nothing is cached between runs
+            timings.append((time.perf_counter() - started) * 1000)
+
+        self.stdout.write('')
+        self.stdout.write(self.style.MIGRATE_HEADING(name))
+        self.stdout.write(f'  {rows} rows, best {min(timings):.3f} ms, mean {statistics.mean(timings):.3f} ms')
+        explain = queryset.explain(analyze=True) if options['analyze'] else queryset.explain()
+        for line in explain.splitlines():
+            self.stdout.write(f'  {line}')
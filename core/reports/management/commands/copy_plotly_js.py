@@ -0,0 +1,25 @@
+import gzip
+import shutil
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from reports.charts import PLOTLY_JS, plotly_js_name
+
+
+class Command(BaseCommand):
+    help = "Copy plotly.min.js from the plotly package into PLOTLY_JS_DIR so it is served as a static file."
+
+    def handle(self, *args, **options):
+        target = Path(getattr(settings, 'PLOTLY_JS_DIR', settings.BASE_DIR / 'vendor' / 'plotly'))
+        target.mkdir(parents=True, exist_ok=True)
+        name = plotly_js_name()
+        # Copies of other plotly versions are no longer referenced
+        for path in target.glob('plotly-*.min.js*'):
+            if path.name not in (name, f'{name}.gz'):
+                path.unlink()
+        shutil.copyfile(PLOTLY_JS, target / name)
+        with open(PLOTLY_JS, 'rb') as src, gzip.open(target / f'{name}.gz', 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        self.stdout.write(self.style.SUCCESS(f'Copied {name} to {target}.'))
@@ -0,0 +1,21 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from reports.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily carbon footprint rollups from the carbon footprint reports.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only rebuild the rollups of this username.')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['user']!r} does not exist.")
+        count = rebuild_rollups(user=user)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} daily rollup row(s).'))
@@ -0,0 +1,44 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from reports.carbon import get_carbon_model, rescore_carbon_footprints
+from reports.models import CarbonFootprintReport
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the carbon footprint reports with the current carbon model, or the one given by '
+        '--model-version. Only reports scored with another version are recomputed unless --all is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model-version', type=int, help='Carbon model version to score with.')
+        parser.add_argument('--all', action='store_true', help='Also recompute reports already on that version.')
+        parser.add_argument('--user', help='Only recompute the reports of this username.')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Reports read and written per batch.')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1.')
+        try:
+            carbon_model = get_carbon_model(options['model_version'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        reports = CarbonFootprintReport.objects.all()
+        if not options['all']:
+            reports = reports.exclude(model_version=carbon_model.version)
+        if options['user']:
+            try:
+                reports = reports.filter(user=User.objects.get(username=options['user']))
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['user']!r} does not exist.")
+
+        started = time.perf_counter()
+        count = rescore_carbon_footprints(carbon_model, reports, chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Rescored {count} carbon footprint report(s) with model version {carbon_model.version} '
+            f'in {time.perf_counter() - started:.1f}s.'
+        ))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0007_hostingprovider_url'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='hostingprovider',
+            name='sustainability_info',
+            field=models.TextField(default='No sustainability information available.'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0008_alter_hostingprovider_sustainability_info'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pagereport',
+            name='url',
+            field=models.URLField(blank=True, max_length=2048),
+        ),
+    ]
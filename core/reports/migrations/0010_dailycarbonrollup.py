@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0009_pagereport_url'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCarbonRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('website_url', models.URLField(blank=True, max_length=2048)),
+                ('day', models.DateField()),
+                ('count', models.IntegerField(default=0)),
+                ('total_energy_usage', models.FloatField(default=0.0)),
+                ('carbon_footprint_score', models.FloatField(default=0.0)),
+                ('carbon_footprint_images', models.FloatField(default=0.0)),
+                ('carbon_footprint_videos', models.FloatField(default=0.0)),
+                ('carbon_footprint_other', models.FloatField(default=0.0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'website_url', 'day'), name='unique_daily_carbon_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+ROLLUP_FIELDS = [
+    'total_energy_usage',
+    'carbon_footprint_score',
+    'carbon_footprint_images',
+    'carbon_footprint_videos',
+    'carbon_footprint_other',
+]
+
+
+def backfill(apps, schema_editor):
+    # Same as reports.rollups.rebuild_rollups, with the historical models
+    CarbonFootprintReport = apps.get_model('reports', 'CarbonFootprintReport')
+    DailyCarbonRollup = apps.get_model('reports', 'DailyCarbonRollup')
+
+    reports = CarbonFootprintReport.objects.annotate(day=TruncDate('created_at'))
+    totals = {field: Sum(field) for field in ROLLUP_FIELDS}
+    per_website = reports.values('user_id', 'day', website_url=F('page__website__url')).annotate(count=Count('id'), **totals)
+    per_user = reports.values('user_id', 'day').annotate(count=Count('id'), **totals)
+    rows = [DailyCarbonRollup(**values) for values in per_website]
+    rows += [DailyCarbonRollup(website_url='', **values) for values in per_user]
+    DailyCarbonRollup.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0010_dailycarbonrollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
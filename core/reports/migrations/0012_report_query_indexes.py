@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0011_backfill_dailycarbonrollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='carbonfootprintreport',
+            index=models.Index(fields=['user', '-total_energy_usage'], name='carbonreport_user_energy'),
+        ),
+        migrations.AddIndex(
+            model_name='carbonfootprintreport',
+            index=models.Index(fields=['user', 'created_at'], name='carbonreport_user_created'),
+        ),
+        migrations.AddIndex(
+            model_name='websitereport',
+            index=models.Index(fields=['user', '-created_at'], name='websitereport_user_created'),
+        ),
+    ]
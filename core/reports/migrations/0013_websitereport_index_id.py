@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0012_report_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='websitereport',
+            name='websitereport_user_created',
+        ),
+        migrations.AddIndex(
+            model_name='websitereport',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='websitereport_user_created'),
+        ),
+    ]
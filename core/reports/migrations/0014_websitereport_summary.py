@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0013_websitereport_index_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='websitereport',
+            name='carbon_footprint_images',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='websitereport',
+            name='carbon_footprint_other',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='websitereport',
+            name='carbon_footprint_score',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='websitereport',
+            name='carbon_footprint_videos',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='websitereport',
+            name='num_external_links',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='websitereport',
+            name='num_external_resources',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='websitereport',
+            name='num_images',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='websitereport',
+            name='num_internal_links',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='websitereport',
+            name='num_social_media_links',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='websitereport',
+            name='num_videos',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='websitereport',
+            name='page_size',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='websitereport',
+            name='total_energy_usage',
+            field=models.FloatField(default=0.0),
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+from django.db.models import Sum
+
+PAGE_SUMMARY_FIELDS = [
+    'page_size',
+    'num_internal_links',
+    'num_external_links',
+    'num_external_resources',
+    'num_social_media_links',
+    'num_images',
+    'num_videos',
+]
+
+CARBON_FOOTPRINT_STATS = [
+    'total_energy_usage',
+    'carbon_footprint_score',
+    'carbon_footprint_images',
+    'carbon_footprint_videos',
+    'carbon_footprint_other',
+]
+
+
+def backfill(apps, schema_editor):
+    # Same as reports.stats.refresh_summaries, with the historical models
+    PageReport = apps.get_model('reports', 'PageReport')
+    WebsiteReport = apps.get_model('reports', 'WebsiteReport')
+
+    totals = {field: Sum(field, default=0) for field in PAGE_SUMMARY_FIELDS}
+    totals.update({field: Sum(f'carbonfootprintreport__{field}', default=0) for field in CARBON_FOOTPRINT_STATS})
+    websites = []
+    for row in PageReport.objects.values('website').annotate(**totals).iterator():
+        websites.append(WebsiteReport(id=row.pop('website'), **row))
+    WebsiteReport.objects.bulk_update(websites, PAGE_SUMMARY_FIELDS + CARBON_FOOTPRINT_STATS, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0014_websitereport_summary'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
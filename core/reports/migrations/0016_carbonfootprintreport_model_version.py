@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0015_backfill_websitereport_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carbonfootprintreport',
+            name='model_version',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+    ]
@@ -1,19 +1,70 @@
 from django.db import models
 from django.contrib.auth.models import User
 
+class ReportQuerySet(models.QuerySet):
+    # Relations followed by the model's __str__, loaded by with_related()
+    related_fields = ['user']
+
+    def for_user(self, user):
+        return self.filter(user=user)
+
+    def with_related(self):
+        return self.select_related(*self.related_fields)
+
+class PageReportQuerySet(ReportQuerySet):
+    related_fields = ['user', 'website']
+
+class PageDetailQuerySet(ReportQuerySet):
+    # Reports about a page describe themselves with the page's __str__
+    related_fields = ['user', 'page__user', 'page__website']
+
+class CarbonFootprintReportQuerySet(PageDetailQuerySet):
+    def top_by_energy_usage(self, limit):
+        # Charts label these reports with their website's URL
+        return self.select_related('page__website').order_by('-total_energy_usage')[:limit]
+
 class WebsiteReport(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     url = models.URLField()
     pages = models.IntegerField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Totals over the website's page and carbon footprint reports, kept by
+    # reports.stats so listings need no joins
+    page_size = models.FloatField(default=0.0)  # in kilobytes
+    num_images = models.IntegerField(default=0)
+    num_videos = models.IntegerField(default=0)
+    num_external_resources = models.IntegerField(default=0)
+    num_internal_links = models.IntegerField(default=0)
+    num_external_links = models.IntegerField(default=0)
+    num_social_media_links = models.IntegerField(default=0)
+    total_energy_usage = models.FloatField(default=0.0)  # in kilowatt-hours
+    carbon_footprint_score = models.FloatField(default=0.0)  # the energy usage again, in kilowatt-hours
+    carbon_footprint_images = models.FloatField(default=0.0)  # in grams of CO2e
+    carbon_footprint_videos = models.FloatField(default=0.0)  # in grams of CO2e
+    carbon_footprint_other = models.FloatField(default=0.0)  # in grams of CO2e
+
+    objects = ReportQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # a user's reports, newest first; the id breaks ties for keyset pagination
+            models.Index(fields=['user', '-created_at', '-id'], name='websitereport_user_created'),
+        ]
+
+    @property
+    def carbon_footprint(self):
+        # in grams of CO2e
+        return self.carbon_footprint_images + self.carbon_footprint_videos + self.carbon_footprint_other
+
     def __str__(self):
         return f"{self.url} - {self.id} - {self.user.username}"
 
 class PageReport(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     website = models.ForeignKey(WebsiteReport, on_delete=models.CASCADE)
-    page_size = models.FloatField()  # in megabytes
+    url = models.URLField(max_length=2048, blank=True)
+    page_size = models.FloatField()  # in kilobytes
     num_images = models.IntegerField()
     num_videos = models.IntegerField()
     num_external_resources = models.IntegerField()
@@ -22,6 +73,8 @@ class PageReport(models.Model):
     num_social_media_links = models.IntegerField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = PageReportQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.website.url} - {self.user.username} - Page {self.id}"
 
@@ -32,6 +85,8 @@ class ImageReport(models.Model):
     format = models.CharField(max_length=20)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = PageDetailQuerySet.as_manager()
+
     def __str__(self):
         return f"Image {self.id} - {self.page}"
 
@@ -42,6 +97,8 @@ class VideoReport(models.Model):
     format = models.CharField(max_length=20)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = PageDetailQuerySet.as_manager()
+
     def __str__(self):
         return f"Video {self.id} - {self.page}"
 
@@ -49,12 +106,24 @@ class CarbonFootprintReport(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     page = models.ForeignKey(PageReport, on_delete=models.CASCADE)
     total_energy_usage = models.FloatField()  # in kilowatt-hours
-    carbon_footprint_score = models.FloatField(default=0.0)
-    carbon_footprint_images = models.FloatField()  # in kilograms of CO2e
-    carbon_footprint_videos = models.FloatField()  # in kilograms of CO2e
-    carbon_footprint_other = models.FloatField()  # in kilograms of CO2e
+    carbon_footprint_score = models.FloatField(default=0.0)  # the energy usage again, in kilowatt-hours
+    carbon_footprint_images = models.FloatField()  # in grams of CO2e
+    carbon_footprint_videos = models.FloatField()  # in grams of CO2e
+    carbon_footprint_other = models.FloatField()  # in grams of CO2e
+    # Version of the reports.carbon model that computed the figures above
+    model_version = models.PositiveSmallIntegerField(default=1)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = CarbonFootprintReportQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # top_by_energy_usage()
+            models.Index(fields=['user', '-total_energy_usage'], name='carbonreport_user_energy'),
+            # a user's reports since a date
+            models.Index(fields=['user', 'created_at'], name='carbonreport_user_created'),
+        ]
+
     def __str__(self):
         return f"CarbonFootprint {self.id} - {self.page}"
 
@@ -64,6 +133,8 @@ class Recommendation(models.Model):
     recommendation_text = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = PageDetailQuerySet.as_manager()
+
     def __str__(self):
         return f"Recommendation {self.id} - {self.page}"
 
@@ -75,3 +146,35 @@ class HostingProvider(models.Model):
 
     def __str__(self):
         return f"HostingProvider {self.id} - {self.name}"
+
+class DailyCarbonRollup(models.Model):
+    # Daily totals of a user's carbon footprint reports, kept up to date by
+    # reports.rollups. website_url is '' on the row for all of the user's
+    # websites together.
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    website_url = models.URLField(max_length=2048, blank=True)
+    day = models.DateField()
+    count = models.IntegerField(default=0)
+    total_energy_usage = models.FloatField(default=0.0)  # in kilowatt-hours
+    carbon_footprint_score = models.FloatField(default=0.0)  # the energy usage again, in kilowatt-hours
+    carbon_footprint_images = models.FloatField(default=0.0)  # in grams of CO2e
+    carbon_footprint_videos = models.FloatField(default=0.0)  # in grams of CO2e
+    carbon_footprint_other = models.FloatField(default=0.0)  # in grams of CO2e
+
+    objects = ReportQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'website_url', 'day'], name='unique_daily_carbon_rollup'),
+        ]
+
+    @property
+    def average_energy_usage(self):
+        return self.total_energy_usage / self.count if self.count else 0.0
+
+    @property
+    def average_carbon_footprint_score(self):
+        return self.carbon_footprint_score / self.count if self.count else 0.0
+
+    def __str__(self):
+        return f"{self.user.username} - {self.website_url or 'all websites'} - {self.day}"
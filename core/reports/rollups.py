@@ -0,0 +1,82 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import CarbonFootprintReport, DailyCarbonRollup
+
+# CarbonFootprintReport fields summed per day
+ROLLUP_FIELDS = [
+    'total_energy_usage',
+    'carbon_footprint_score',
+    'carbon_footprint_images',
+    'carbon_footprint_videos',
+    'carbon_footprint_other',
+]
+
+
+def rollup_keys(report):
+    # Each report counts towards the user's total and its website's row
+    day = timezone.localdate(report.created_at)
+    return [(report.user_id, '', day), (report.user_id, report.page.website.url, day)]
+
+
+def apply_to_rollups(reports, sign=1):
+    """Add carbon footprint reports to the daily rollups, or take them out
+    again with sign=-1, with one UPDATE per affected row."""
+    deltas = defaultdict(lambda: dict(count=0, **{field: 0.0 for field in ROLLUP_FIELDS}))
+    for report in reports:
+        for key in rollup_keys(report):
+            deltas[key]['count'] += sign
+            for field in ROLLUP_FIELDS:
+                deltas[key][field] += sign * getattr(report, field)
+
+    for (user_id, website_url, day), delta in deltas.items():
+        rows = DailyCarbonRollup.objects.filter(user_id=user_id, website_url=website_url, day=day)
+        changes = {field: F(field) + value for field, value in delta.items()}
+        if rows.update(**changes):
+            if sign < 0:
+                rows.filter(count__lte=0).delete()
+            continue
+        if sign < 0:
+            # Nothing to take the report out of (e.g. the user is being deleted)
+            continue
+        try:
+            with transaction.atomic():
+                DailyCarbonRollup.objects.create(user_id=user_id, website_url=website_url, day=day, **delta)
+        except IntegrityError:
+            # Created by a concurrent writer in the meantime
+            rows.update(**changes)
+
+
+def rebuild_rollups(user=None, day=None):
+    """Recompute the daily rollups from the carbon footprint reports, for
+    everyone or only one user and/or day. Returns the number of rows."""
+    reports = CarbonFootprintReport.objects.annotate(day=TruncDate('created_at'))
+    rollups = DailyCarbonRollup.objects.all()
+    if user is not None:
+        reports = reports.filter(user=user)
+        rollups = rollups.filter(user=user)
+    if day is not None:
+        reports = reports.filter(day=day)
+        rollups = rollups.filter(day=day)
+
+    totals = {field: Sum(field) for field in ROLLUP_FIELDS}
+    per_website = reports.values('user_id', 'day', website_url=F('page__website__url')).annotate(count=Count('id'), **totals)
+    per_user = reports.values('user_id', 'day').annotate(count=Count('id'), **totals)
+    rows = [DailyCarbonRollup(**values) for values in per_website]
+    rows += [DailyCarbonRollup(website_url='', **values) for values in per_user]
+
+    with transaction.atomic():
+        rollups.delete()
+        DailyCarbonRollup.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def daily_history(user, days, website_url=''):
+    # The last `days` days of rollups, oldest first
+    since = timezone.localdate() - timedelta(days=days - 1)
+    return DailyCarbonRollup.objects.filter(user=user, website_url=website_url, day__gte=since).order_by('day')
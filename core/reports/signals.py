@@ -0,0 +1,77 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from .charts import bump_data_version
+from .hosting import sampler
+from .models import CarbonFootprintReport, HostingProvider, ImageReport, PageReport, VideoReport, WebsiteReport
+from .rollups import apply_to_rollups, rebuild_rollups
+from .stats import refresh_summaries
+
+# Everything shown on a report's page. bulk_create sends no signals, so bulk
+# writers call bump_data_version themselves.
+CHARTED_MODELS = [WebsiteReport, PageReport, ImageReport, VideoReport, CarbonFootprintReport]
+
+
+def report_changed(sender, instance, **kwargs):
+    bump_data_version(instance.user_id)
+
+
+for model in CHARTED_MODELS:
+    post_save.connect(report_changed, sender=model, dispatch_uid=f'report_saved_{model.__name__}')
+    post_delete.connect(report_changed, sender=model, dispatch_uid=f'report_deleted_{model.__name__}')
+
+
+# Keep the daily rollups in step with the carbon footprint reports; bulk
+# writers call apply_to_rollups themselves.
+
+def carbon_footprint_saved(sender, instance, created, **kwargs):
+    if created:
+        apply_to_rollups([instance])
+    else:
+        # The old values are gone, so recount the report's day
+        rebuild_rollups(user=instance.user_id, day=timezone.localdate(instance.created_at))
+
+
+def carbon_footprint_deleted(sender, instance, **kwargs):
+    apply_to_rollups([instance], sign=-1)
+
+
+post_save.connect(carbon_footprint_saved, sender=CarbonFootprintReport, dispatch_uid='carbon_footprint_rollup_saved')
+post_delete.connect(carbon_footprint_deleted, sender=CarbonFootprintReport, dispatch_uid='carbon_footprint_rollup_deleted')
+
+
+# Keep the website reports' summary columns in step with reports saved or
+# deleted one by one; the scraper fills them in before saving in bulk.
+
+def deleted_with(origin, models):
+    # Whether a delete cascaded from one of `models`, which takes the
+    # summarized website report with it
+    return isinstance(origin, tuple(models)) or getattr(origin, 'model', None) in models
+
+
+def page_report_changed(sender, instance, origin=None, **kwargs):
+    if not deleted_with(origin, [User, WebsiteReport]):
+        refresh_summaries([instance.website_id])
+
+
+def carbon_footprint_changed(sender, instance, origin=None, **kwargs):
+    if not deleted_with(origin, [User, WebsiteReport, PageReport]):
+        refresh_summaries(list(PageReport.objects.filter(id=instance.page_id).values_list('website_id', flat=True)))
+
+
+post_save.connect(page_report_changed, sender=PageReport, dispatch_uid='page_report_summary_saved')
+post_delete.connect(page_report_changed, sender=PageReport, dispatch_uid='page_report_summary_deleted')
+post_save.connect(carbon_footprint_changed, sender=CarbonFootprintReport, dispatch_uid='carbon_footprint_summary_saved')
+post_delete.connect(carbon_footprint_changed, sender=CarbonFootprintReport, dispatch_uid='carbon_footprint_summary_deleted')
+
+
+# Providers added or removed in this process show up right away; other
+# processes pick them up within REPORT_HOSTING_PROVIDER_TTL.
+
+def hosting_providers_changed(sender, **kwargs):
+    sampler.invalidate()
+
+
+post_save.connect(hosting_providers_changed, sender=HostingProvider, dispatch_uid='hosting_providers_saved')
+post_delete.connect(hosting_providers_changed, sender=HostingProvider, dispatch_uid='hosting_providers_deleted')
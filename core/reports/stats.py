@@ -0,0 +1,81 @@
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .models import CarbonFootprintReport, PageReport, WebsiteReport
+
+# Page counters shown in the page statistics charts, in chart order
+PAGE_STATS = [
+    ('num_internal_links', 'Internal Links'),
+    ('num_external_links', 'External Links'),
+    ('num_external_resources', 'External Resources'),
+    ('num_social_media_links', 'Social Media Links'),
+    ('num_images', 'Images'),
+    ('num_videos', 'Videos'),
+]
+
+CARBON_FOOTPRINT_STATS = [
+    'total_energy_usage',
+    'carbon_footprint_score',
+    'carbon_footprint_images',
+    'carbon_footprint_videos',
+    'carbon_footprint_other',
+]
+
+
+# Page report fields summed into the website report, then the carbon
+# footprint ones
+PAGE_SUMMARY_FIELDS = ['page_size'] + [field for field, _ in PAGE_STATS]
+SUMMARY_FIELDS = PAGE_SUMMARY_FIELDS + CARBON_FOOTPRINT_STATS
+
+
+def summarize(website_report, page_reports):
+    """Set the totals of an unsaved website report from its page reports.
+
+    `page_reports` are the (page, image, video, carbon footprint) tuples of
+    WebParser.build_reports, so the totals are saved with the website row.
+    """
+    for field in SUMMARY_FIELDS:
+        setattr(website_report, field, 0)
+    for page_report, *_, carbon_footprint_report in page_reports:
+        for field in PAGE_SUMMARY_FIELDS:
+            setattr(website_report, field, getattr(website_report, field) + getattr(page_report, field))
+        for field in CARBON_FOOTPRINT_STATS:
+            setattr(website_report, field, getattr(website_report, field) + getattr(carbon_footprint_report, field))
+    return website_report
+
+
+def summary_total(field):
+    # Correlated subquery summing `field` over the pages of the outer website.
+    # The carbon footprint is joined in from each page's report; the scraper
+    # saves exactly one per page, so the page counters are not repeated.
+    if field in CARBON_FOOTPRINT_STATS:
+        field = f'carbonfootprintreport__{field}'
+    pages = PageReport.objects.filter(website=OuterRef('pk')).order_by().values('website')
+    return Coalesce(Subquery(pages.annotate(total=Sum(field)).values('total')), 0)
+
+
+def refresh_summaries(website_ids, fields=None):
+    # Recount the totals (or only `fields`) of saved websites after their
+    # reports changed, with one UPDATE
+    fields = fields or SUMMARY_FIELDS
+    WebsiteReport.objects.filter(id__in=website_ids).update(**{field: summary_total(field) for field in fields})
+
+
+def website_stats(website):
+    """Page counters and carbon footprint totals of a website.
+
+    Read from the summary columns of the website report, so no query is run.
+    """
+    return {field: getattr(website, field) for field in SUMMARY_FIELDS}
+
+
+def page_stat_labels():
+    return [label for _, label in PAGE_STATS]
+
+
+def page_stat_values(stats):
+    return [stats[field] for field, _ in PAGE_STATS]
+
+
+def top_carbon_footprint_reports(user, limit=3):
+    return CarbonFootprintReport.objects.for_user(user).top_by_energy_usage(limit)
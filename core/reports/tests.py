@@ -1,3 +1,603 @@
-from django.test import TestCase
+import gzip
+import re
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest.mock import patch
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.staticfiles import finders
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.templatetags.static import static
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from plotly.offline import get_plotlyjs_version
+
+from core.pagination import CursorPaginator
+from scraper.instrumentation import AnalysisRecorder
+from scraper.models import AnalysisMetrics
+
+from .carbon import MODELS, get_carbon_model, rescore_carbon_footprints
+from .charts import PLOTLY_JS
+from .hosting import HostingProviderSampler, sampler
+from .models import CarbonFootprintReport, DailyCarbonRollup, HostingProvider, ImageReport, PageReport, Recommendation, VideoReport, WebsiteReport
+from .rollups import daily_history
+from .stats import summarize, top_carbon_footprint_reports, website_stats
+from .views import generate_top_websites_bar_chart_data
+
+
+def create_page(website, **counters):
+    page = PageReport.objects.create(
+        user=website.user,
+        website=website,
+        page_size=counters.get('page_size', 100.0),
+        num_images=counters.get('num_images', 1),
+        num_videos=counters.get('num_videos', 0),
+        num_external_resources=counters.get('num_external_resources', 2),
+        num_internal_links=counters.get('num_internal_links', 3),
+        num_external_links=counters.get('num_external_links', 4),
+        num_social_media_links=counters.get('num_social_media_links', 5),
+    )
+    ImageReport.objects.create(user=website.user, page=page, total_size=10.0, format='jpeg')
+    VideoReport.objects.create(user=website.user, page=page, total_size=0.0, format='mp4')
+    Recommendation.objects.create(user=website.user, page=page, recommendation_text='Compress images')
+    CarbonFootprintReport.objects.create(
+        user=website.user,
+        page=page,
+        total_energy_usage=0.5,
+        carbon_footprint_score=0.5,
+        carbon_footprint_images=0.1,
+        carbon_footprint_videos=0.2,
+        carbon_footprint_other=0.3,
+    )
+    return page
+
+
+class WebsiteStatsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        self.website = WebsiteReport.objects.create(user=self.user, url='https://example.com', pages=2)
+
+    def test_totals_over_pages(self):
+        create_page(self.website, num_images=2, num_videos=1)
+        create_page(self.website, num_images=3)
+        self.website.refresh_from_db()
+
+        with self.assertNumQueries(0):
+            stats = website_stats(self.website)
+
+        self.assertEqual(stats['num_images'], 5)
+        self.assertEqual(stats['num_videos'], 1)
+        self.assertEqual(stats['num_internal_links'], 6)
+        self.assertAlmostEqual(stats['carbon_footprint_score'], 1.0)
+        self.assertAlmostEqual(stats['carbon_footprint_other'], 0.6)
+
+    def test_website_without_pages(self):
+        stats = website_stats(self.website)
+        self.assertEqual(stats['num_images'], 0)
+        self.assertEqual(stats['carbon_footprint_score'], 0)
+
+    def test_summary_follows_changes_and_deletes(self):
+        page = create_page(self.website, num_images=2)
+        create_page(self.website, num_images=3)
+        carbon_footprint_report = CarbonFootprintReport.objects.get(page=page)
+        carbon_footprint_report.carbon_footprint_score = 2.0
+        carbon_footprint_report.save()
+        self.website.refresh_from_db()
+        self.assertAlmostEqual(self.website.carbon_footprint_score, 2.5)
+
+        page.delete()
+        self.website.refresh_from_db()
+        self.assertEqual(self.website.num_images, 3)
+        self.assertAlmostEqual(self.website.carbon_footprint_score, 0.5)
+
+    def test_listing_units(self):
+        create_page(self.website)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('list_website_reports'))
+        self.assertContains(response, '<th>Page Size (KB)</th>')
+        self.assertContains(response, '<th>Energy (kWh)</th>')
+        self.assertContains(response, '<th>CO2e (g)</th>')
+        # images + videos + other, not the energy in carbon_footprint_score
+        self.assertContains(response, '<td>0.600</td>')
+        self.assertContains(response, '<td>0.500000</td>')
+
+    def test_website_delete_skips_the_summary(self):
+        for _ in range(3):
+            create_page(self.website)
+        with CaptureQueriesContext(connection) as context:
+            self.website.delete()
+        self.assertFalse(any(query['sql'].startswith('UPDATE "reports_websitereport"') for query in context))
+
+    def test_summarize(self):
+        website = WebsiteReport(user=self.user, url='https://example.com', pages=2)
+        page_reports = []
+        for num_images in [2, 3]:
+            page = PageReport(
+                website=website, page_size=1.5, num_images=num_images, num_videos=0, num_external_resources=0,
+                num_internal_links=1, num_external_links=0, num_social_media_links=0,
+            )
+            carbon_footprint_report = CarbonFootprintReport(
+                page=page, total_energy_usage=0.1, carbon_footprint_score=0.5,
+                carbon_footprint_images=0.1, carbon_footprint_videos=0.2, carbon_footprint_other=0.2,
+            )
+            page_reports.append((page, None, None, carbon_footprint_report))
+        summarize(website, page_reports)
+        self.assertEqual(website.page_size, 3.0)
+        self.assertEqual(website.num_images, 5)
+        self.assertAlmostEqual(website.carbon_footprint_score, 1.0)
+
+
+class ShowWebsiteReportQueryTests(TestCase):
+    # session, user, website with its totals, hosting provider ids and the
+    # sampled providers; the charts are fetched separately
+    EXPECTED_QUERIES = 5
+    # the provider ids are cached
+    EXPECTED_CACHED_QUERIES = 4
+
+    def setUp(self):
+        cache.clear()
+        for i in range(10):
+            HostingProvider.objects.create(name=f'Provider {i}')
+        sampler.invalidate()
+        self.user = User.objects.create_user('alice', password='secret')
+        self.website = WebsiteReport.objects.create(user=self.user, url='https://example.com', pages=1)
+        self.client.force_login(self.user)
+
+    def assertViewQueries(self, expected):
+        with self.assertNumQueries(expected):
+            response = self.client.get(reverse('show_website_report', args=[self.website.id]))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_constant_queries(self):
+        create_page(self.website)
+        self.assertViewQueries(self.EXPECTED_QUERIES)
+        self.assertViewQueries(self.EXPECTED_CACHED_QUERIES)
+
+    def test_queries_do_not_grow_with_pages_or_reports(self):
+        for _ in range(5):
+            create_page(self.website)
+        for _ in range(3):
+            other = WebsiteReport.objects.create(user=self.user, url='https://example.org', pages=1)
+            create_page(other)
+        self.assertViewQueries(self.EXPECTED_QUERIES)
+
+
+class ReportChartApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('alice', password='secret')
+        self.website = WebsiteReport.objects.create(user=self.user, url='https://example.com', pages=1)
+        create_page(self.website, num_images=7)
+        self.client.force_login(self.user)
+
+    def get_chart(self, chart, **headers):
+        return self.client.get(reverse('report_chart', args=[self.website.id, chart]), headers=headers)
+
+    def test_chart_spec(self):
+        response = self.get_chart('page-statistics')
+        self.assertEqual(response.status_code, 200)
+        spec = response.json()
+        self.assertEqual(spec['data'][0]['type'], 'bar')
+        self.assertEqual(spec['data'][0]['y'][4], 7)
+        self.assertNotIn('template', spec['layout'])
+
+    def test_every_chart(self):
+        for chart in ['page-statistics', 'link-distribution', 'top-websites', 'carbon-footprint', 'co2-history']:
+            with self.subTest(chart=chart):
+                self.assertEqual(self.get_chart(chart).status_code, 200)
+
+    def test_conditional_requests(self):
+        response = self.get_chart('carbon-footprint')
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertEqual(self.get_chart('carbon-footprint', if_none_match=response['ETag']).status_code, 304)
+        self.assertEqual(self.get_chart('carbon-footprint', if_modified_since=response['Last-Modified']).status_code, 304)
+
+    def test_user_wide_charts_have_no_last_modified(self):
+        response = self.get_chart('top-websites')
+        self.assertIn('ETag', response)
+        self.assertNotIn('Last-Modified', response)
+
+    def test_new_report_changes_user_wide_charts(self):
+        etag = self.get_chart('top-websites')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            other = WebsiteReport.objects.create(user=self.user, url='https://example.org', pages=1)
+            create_page(other)
+        response = self.get_chart('top-websites', if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('https://example.org', response.json()['data'][0]['x'])
+
+    def test_deleted_report_changes_user_wide_charts(self):
+        other = WebsiteReport.objects.create(user=self.user, url='https://example.org', pages=1)
+        create_page(other)
+        self.assertIn('https://example.org', self.get_chart('top-websites').json()['data'][0]['x'])
+        with self.captureOnCommitCallbacks(execute=True):
+            other.delete()
+        self.assertNotIn('https://example.org', self.get_chart('top-websites').json()['data'][0]['x'])
+
+    def test_not_found(self):
+        self.assertEqual(self.get_chart('no-such-chart').status_code, 404)
+        other_user = User.objects.create_user('bob', password='secret')
+        other = WebsiteReport.objects.create(user=other_user, url='https://example.org', pages=1)
+        response = self.client.get(reverse('report_chart', args=[other.id, 'page-statistics']))
+        self.assertEqual(response.status_code, 404)
+
+
+class ConstantQueryTests(TestCase):
+    # Pages that list reports must not run a query per report
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', password='secret')
+        self.client.force_login(self.user)
+
+    def add_websites(self, count):
+        for _ in range(count):
+            website = WebsiteReport.objects.create(user=self.user, url='https://example.com', pages=1)
+            create_page(website)
+
+    def count_queries(self, url):
+        cache.clear()  # compare cold caches
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def assertConstantQueries(self, url):
+        self.add_websites(1)
+        few = self.count_queries(url)
+        self.add_websites(10)
+        self.assertEqual(self.count_queries(url), few)
+
+    def test_list_website_reports(self):
+        self.assertConstantQueries(reverse('list_website_reports'))
+
+    def test_top_websites_chart(self):
+        self.add_websites(5)
+        with self.assertNumQueries(1):
+            generate_top_websites_bar_chart_data(top_carbon_footprint_reports(self.user, 3))
+
+    def test_admin_changelists(self):
+        for model in [WebsiteReport, PageReport, ImageReport, VideoReport, CarbonFootprintReport, Recommendation]:
+            with self.subTest(model=model.__name__):
+                self.assertConstantQueries(reverse(f'admin:reports_{model._meta.model_name}_changelist'))
+
+
+class ChartAssetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        self.client.force_login(self.user)
+
+    def test_report_page_references_plotly_js_once(self):
+        website = WebsiteReport.objects.create(user=self.user, url='https://example.com', pages=1)
+        create_page(website)
+        response = self.client.get(reverse('show_website_report', args=[website.id]))
+        self.assertContains(response, static(f'plotly/plotly-{get_plotlyjs_version()}.min.js'), count=1)
+        self.assertContains(response, 'data-chart=', count=5)
+        self.assertLess(len(response.content), 100 * 1024)
+
+    def test_copy_plotly_js(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(PLOTLY_JS_DIR=Path(directory)):
+            stale = Path(directory) / 'plotly-0.0.0.min.js'
+            stale.write_text('old')
+            call_command('copy_plotly_js', stdout=StringIO())
+            name = f'plotly-{get_plotlyjs_version()}.min.js'
+            self.assertEqual(sorted(path.name for path in Path(directory).iterdir()), [name, f'{name}.gz'])
+            self.assertEqual((Path(directory) / name).read_bytes(), PLOTLY_JS.read_bytes())
+            with gzip.open(Path(directory) / f'{name}.gz') as f:
+                self.assertEqual(f.read(), PLOTLY_JS.read_bytes())
+
+    def test_plotly_package_data_is_not_collected(self):
+        # Only the copied plotly.js is a static file, the rest of the package
+        # stays out of the static files
+        self.assertTrue(PLOTLY_JS.is_file())
+        self.assertIsNone(finders.find('plotly/plotly.min.js'))
+        paths = [path for finder in finders.get_finders() for path, _ in finder.list(['.*'])]
+        self.assertFalse([path for path in paths if path.startswith('plotly') and not re.fullmatch(r'plotly/plotly-[\w.]+\.min\.js(\.gz)?', path)])
+
+
+class DailyCarbonRollupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('alice', password='secret')
+        self.website = WebsiteReport.objects.create(user=self.user, url='https://example.com', pages=2)
+        self.client.force_login(self.user)
+
+    def rollups(self):
+        return {
+            (rollup.website_url, rollup.count, round(rollup.carbon_footprint_score, 6))
+            for rollup in DailyCarbonRollup.objects.filter(user=self.user)
+        }
+
+    def test_maintained_on_create_and_delete(self):
+        create_page(self.website)
+        create_page(self.website)
+        other = WebsiteReport.objects.create(user=self.user, url='https://example.org', pages=1)
+        create_page(other)
+        self.assertEqual(self.rollups(), {('', 3, 1.5), ('https://example.com', 2, 1.0), ('https://example.org', 1, 0.5)})
+
+        other.delete()
+        self.assertEqual(self.rollups(), {('', 2, 1.0), ('https://example.com', 2, 1.0)})
+
+    def test_updated_report_recounts_its_day(self):
+        create_page(self.website)
+        report = CarbonFootprintReport.objects.get()
+        report.carbon_footprint_score = 2.0
+        report.save()
+        self.assertEqual(self.rollups(), {('', 1, 2.0), ('https://example.com', 1, 2.0)})
+
+    def test_rebuild_matches_incremental_rollups(self):
+        for _ in range(3):
+            create_page(self.website)
+        incremental = self.rollups()
+        DailyCarbonRollup.objects.all().delete()
+        call_command('rebuild_carbon_rollups', stdout=StringIO())
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_history_windows(self):
+        create_page(self.website)
+        url = reverse('report_chart', args=[self.website.id, 'co2-history'])
+        for days in [7, 30, 365]:
+            with self.subTest(days=days):
+                response = self.client.get(url, {'days': days})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()['data'][0]['y'], [0.5])
+        self.assertEqual(self.client.get(url, {'days': 12}).status_code, 404)
+
+    def test_history_moves_with_the_day(self):
+        create_page(self.website)
+        url = reverse('report_chart', args=[self.website.id, 'co2-history'])
+        response = self.client.get(url, {'days': 7})
+        self.assertEqual(response.json()['data'][0]['y'], [0.5])
+
+        # A week later the cached chart and its ETag are stale
+        with patch('django.utils.timezone.localdate', return_value=timezone.localdate() + timedelta(days=7)):
+            later = self.client.get(url, {'days': 7}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(later.status_code, 200)
+        self.assertNotEqual(later['ETag'], response['ETag'])
+        self.assertEqual(later.json()['data'][0]['y'], [])
+
+    def test_history_reads_one_row_per_day(self):
+        for _ in range(20):
+            create_page(self.website)
+        with self.assertNumQueries(1):
+            rollups = list(daily_history(self.user, 365))
+        self.assertEqual([rollup.count for rollup in rollups], [20])
+
+
+class HostingProviderSamplerTests(TestCase):
+    def setUp(self):
+        self.providers = [HostingProvider.objects.create(name=f'Provider {i}') for i in range(20)]
+        self.sampler = HostingProviderSampler(ttl=60)
+
+    def test_sample(self):
+        sample = self.sampler.sample(5)
+        self.assertEqual(len(sample), 5)
+        self.assertEqual(len({provider.id for provider in sample}), 5)
+
+    def test_sample_larger_than_table(self):
+        self.assertEqual(len(self.sampler.sample(50)), 20)
+
+    def test_ids_are_cached_and_rows_loaded_by_key(self):
+        self.sampler.sample(5)
+        with CaptureQueriesContext(connection) as context:
+            self.sampler.sample(5)
+        self.assertEqual(len(context), 1)
+        self.assertNotIn('RANDOM', context[0]['sql'].upper())
+
+    def test_ids_refresh_after_ttl(self):
+        self.sampler.ttl = 0
+        self.sampler.sample(5)
+        with self.assertNumQueries(2):
+            self.sampler.sample(5)
+
+    def test_deleted_provider_is_skipped(self):
+        self.sampler.sample(5)
+        HostingProvider.objects.exclude(id=self.providers[0].id).delete()
+        self.assertEqual(self.sampler.sample(20), [self.providers[0]])
+
+    def test_changes_invalidate_the_shared_sampler(self):
+        sampler.sample(5)
+        provider = HostingProvider.objects.create(name='New provider')
+        self.assertIn(provider.id, sampler.ids())
+
+
+class CursorPaginatorTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        self.websites = [
+            WebsiteReport.objects.create(user=self.user, url=f'https://example.com/{i}', pages=1) for i in range(12)
+        ]
+        # Ties in created_at must be broken by the id
+        WebsiteReport.objects.filter(id__in=[w.id for w in self.websites[3:8]]).update(created_at=timezone.now())
+        self.paginator = CursorPaginator(WebsiteReport.objects.for_user(self.user), 5)
+
+    def walk(self):
+        pages = [self.paginator.page()]
+        while pages[-1].has_next:
+            pages.append(self.paginator.page(pages[-1].next_token))
+        return pages
+
+    def test_next_pages_cover_every_row_once(self):
+        pages = self.walk()
+        self.assertEqual([len(page) for page in pages], [5, 5, 2])
+        expected = list(WebsiteReport.objects.for_user(self.user).order_by('-created_at', '-id'))
+        self.assertEqual([website for page in pages for website in page], expected)
+        self.assertFalse(pages[0].has_previous)
+
+    def test_previous_pages_walk_back(self):
+        pages = self.walk()
+        page = pages[-1]
+        for expected in reversed(pages[:-1]):
+            page = self.paginator.page(page.previous_token)
+            self.assertEqual(list(page), list(expected))
+        self.assertFalse(page.has_previous)
+        self.assertTrue(page.has_next)
+
+    def test_invalid_token_gives_the_first_page(self):
+        first = self.paginator.page()
+        token = self.paginator.page(first.next_token).next_token
+        for bad in ['garbage', token[:-1] + ('A' if token[-1] != 'A' else 'B')]:
+            with self.subTest(token=bad):
+                self.assertEqual(list(self.paginator.page(bad)), list(first))
+        other = CursorPaginator(WebsiteReport.objects.for_user(self.user), 5, salt='other')
+        self.assertEqual(list(other.page(token)), list(first))
+
+    def test_deep_page_costs_as_much_as_the_first(self):
+        with CaptureQueriesContext(connection) as first:
+            self.paginator.page()
+        last_token = self.walk()[-2].next_token
+        with CaptureQueriesContext(connection) as last:
+            self.paginator.page(last_token)
+        self.assertEqual(len(first), len(last))
+        self.assertNotIn('OFFSET', last[0]['sql'].upper())
+
+    def test_count_is_cached(self):
+        cache.clear()
+        paginator = CursorPaginator(WebsiteReport.objects.for_user(self.user), 5, count_cache_key='test:count')
+        self.assertEqual(paginator.page().count, 12)
+        with self.assertNumQueries(1):
+            self.assertEqual(paginator.page().count, 12)
+
+    def test_listing_pages_by_number(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('list_website_reports'), {'page': 2})
+        page = response.context['website_reports']
+        self.assertEqual(page.number, 2)
+        self.assertEqual([website.id for website in page], [website.id for website in self.walk()[1]])
+        self.assertContains(response, 'href="?page=3"')
+        self.assertEqual(self.client.get(reverse('list_website_reports'), {'page': 'x'}).context['website_reports'].number, 1)
+        self.assertEqual(self.client.get(reverse('list_website_reports'), {'page': 9}).context['website_reports'].number, 3)
+
+    @override_settings(CURSOR_PAGINATION=True)
+    def test_listing_view(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('list_website_reports'))
+        self.assertEqual(len(response.context['website_reports']), 5)
+        response = self.client.get(reverse('list_website_reports'), {'cursor': response.context['website_reports'].next_token})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['website_reports'].has_previous)
+        self.assertEqual(response.context['website_reports'].count, 12)
+
+
+class CarbonModelTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        self.website = WebsiteReport.objects.create(user=self.user, url='https://example.com', pages=2)
+        self.model = get_carbon_model()
+
+    def test_score_matches_the_scalar_formula(self):
+        scores = self.model.score([1000.0, 250.0], [400.0, 0.0], [100.0, 50.0])
+        energy_per_kb = 1024 * 1.805 / 1073741824
+        self.assertAlmostEqual(scores['total_energy_usage'][0], 1000 * energy_per_kb)
+        self.assertAlmostEqual(scores['carbon_footprint_score'][1], 250 * energy_per_kb)
+        self.assertAlmostEqual(scores['carbon_footprint_images'][0], 400 * energy_per_kb * 441.3)
+        self.assertAlmostEqual(scores['carbon_footprint_other'][0], 500 * energy_per_kb * 441.3)
+        self.assertEqual(self.model.score_page(1000.0, 400.0, 100.0)['carbon_footprint_videos'], scores['carbon_footprint_videos'][0])
+
+    def test_unknown_version(self):
+        with self.assertRaises(ValueError):
+            get_carbon_model(max(MODELS) + 1)
+
+    def test_rescore(self):
+        for page_size in [1000.0, 2000.0, 3000.0]:
+            create_page(self.website, page_size=page_size)
+        create_page(WebsiteReport.objects.create(user=self.user, url='https://example.org', pages=1))
+        CarbonFootprintReport.objects.filter(page__website=self.website).update(model_version=0)
+
+        # One streamed read; per chunk of two, the batched UPDATE and the
+        # website totals in a savepoint; then rebuilding the rollups
+        with self.assertNumQueries(1 + 2 * 4 + 6):
+            count = rescore_carbon_footprints(self.model, chunk_size=2)
+        self.assertEqual(count, 3)
+
+        report = CarbonFootprintReport.objects.get(page__page_size=2000.0)
+        self.assertEqual(report.model_version, self.model.version)
+        self.assertAlmostEqual(report.carbon_footprint_images, self.model.score_page(2000.0, 10.0, 0.0)['carbon_footprint_images'])
+        self.website.refresh_from_db()
+        expected = sum(self.model.score_page(size, 10.0, 0.0)['carbon_footprint_score'] for size in [1000.0, 2000.0, 3000.0])
+        self.assertAlmostEqual(self.website.carbon_footprint_score, expected)
+        history = daily_history(self.user, 1)
+        self.assertAlmostEqual(history[0].carbon_footprint_score, expected + 0.5)
+
+        self.assertEqual(rescore_carbon_footprints(self.model), 0)
+
+    def test_command(self):
+        create_page(self.website)
+        out = StringIO()
+        call_command('rescore_carbon_footprints', '--all', stdout=out)
+        self.assertIn('Rescored 1 carbon footprint report(s)', out.getvalue())
+
+
+class AnalysisMetricsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        self.website = WebsiteReport.objects.create(user=self.user, url='https://example.com', pages=1)
+        self.client.force_login(self.user)
+
+    def add_metrics(self, website, **fields):
+        fields = dict(dict(fetch_ms=10.0, parse_ms=5.0, sizing_ms=40.0, save_ms=3.0, total_ms=58.0, requests=4, queries=6), **fields)
+        return AnalysisMetrics.objects.create(website=website, **fields)
+
+    def test_recorder(self):
+        recorder = AnalysisRecorder()
+        with recorder.phase('save'):
+            WebsiteReport.objects.count()
+            User.objects.count()
+        with recorder.phase('parse'):
+            pass
+        fields = recorder.as_fields()
+        self.assertEqual(fields['queries'], 2)
+        self.assertGreater(fields['save_ms'], 0)
+        self.assertEqual(fields['crawl_ms'], 0)
+        self.assertAlmostEqual(fields['total_ms'], fields['save_ms'] + fields['parse_ms'], places=2)
+
+    def test_server_timing_on_the_report_page(self):
+        self.add_metrics(self.website)
+        response = self.client.get(reverse('show_website_report', args=[self.website.id]))
+        self.assertIn('analysis-sizing;dur=40.0', response['Server-Timing'])
+        self.assertIn('analysis-total;dur=58.0;desc="4 requests, 6 queries"', response['Server-Timing'])
+
+    def test_report_without_metrics(self):
+        response = self.client.get(reverse('show_website_report', args=[self.website.id]))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(self.client.get(reverse('report_metrics', args=[self.website.id])).status_code, 404)
+
+    def test_report_metrics(self):
+        self.add_metrics(self.website)
+        response = self.client.get(reverse('report_metrics', args=[self.website.id]))
+        self.assertEqual(response.json()['sizing_ms'], 40.0)
+        self.assertIn('Server-Timing', response)
+
+        other = WebsiteReport.objects.create(user=User.objects.create_user('bob'), url='https://example.org', pages=1)
+        self.add_metrics(other)
+        self.assertEqual(self.client.get(reverse('report_metrics', args=[other.id])).status_code, 404)
+
+    def test_analysis_stats(self):
+        self.add_metrics(self.website)
+        self.add_metrics(WebsiteReport.objects.create(user=self.user, url='https://example.com', pages=1), sizing_ms=80.0)
+        old = self.add_metrics(WebsiteReport.objects.create(user=self.user, url='https://example.com', pages=1))
+        AnalysisMetrics.objects.filter(id=old.id).update(created_at=timezone.now() - timedelta(days=10))
+        other = WebsiteReport.objects.create(user=User.objects.create_user('bob'), url='https://example.org', pages=1)
+        self.add_metrics(other, sizing_ms=1000.0)
+
+        stats = self.client.get(reverse('analysis_stats')).json()
+        self.assertEqual(stats['current']['count'], 2)
+        self.assertEqual(stats['current']['sizing_ms'], {'avg': 60.0, 'max': 80.0})
+        self.assertEqual(stats['previous']['count'], 1)
+        self.assertEqual(stats['hot_phase'], 'sizing')
+        self.assertEqual(self.client.get(reverse('analysis_stats'), {'days': '0'}).status_code, 400)
+        self.assertNotIn('process', stats)
+
+    def test_analysis_stats_process_counters(self):
+        self.user.is_staff = True
+        self.user.save()
+        process = self.client.get(reverse('analysis_stats')).json()['process']
+        self.assertEqual(set(process), {'connections', 'size_cache', 'css_cache'})
+        self.assertIn('connections_reused', process['connections'])
+        self.assertIn('hit_ratio', process['size_cache'])
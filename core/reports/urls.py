@@ -5,4 +5,7 @@ urlpatterns = [
     path('', views.list_website_reports, name='list_website_reports'),
     path('show-website-report/<int:report_id>/', views.show_website_report, name='show_website_report'),
     path('delete-website-report/<int:report_id>/', views.delete_website_report, name='delete_website_report'),
+    path('api/<int:report_id>/charts/<slug:chart>/', views.report_chart, name='report_chart'),
+    path('api/<int:report_id>/metrics/', views.report_metrics, name='report_metrics'),
+    path('api/analysis-stats/', views.analysis_stats, name='analysis_stats'),
 ]
\ No newline at end of file
@@ -1,35 +1,61 @@
-from datetime import datetime, timedelta
-from django.http import HttpResponse
+from datetime import timedelta
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.db.models import Sum
+from django.db.models import Avg, Count, Max
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
 
 # Plotly for graphing
-from plotly.offline import plot
 import plotly.graph_objs as go
 
-from .models import WebsiteReport, PageReport,CarbonFootprintReport, HostingProvider
+from core.pagination import paginate
+from scraper.cache import cache_stats
+from scraper.client import connection_stats
+from scraper.css import css_cache_stats
+from scraper.instrumentation import PHASES
+from scraper.jobs import lease_expiry
+from scraper.models import AnalysisJob, AnalysisMetrics
+from .charts import cached_report_data, chart_template, data_version, figure_spec, plotly_js_name
+from .hosting import recommend_hosting_providers
+from .models import WebsiteReport
+from .rollups import daily_history
+from .stats import page_stat_labels, page_stat_values, top_carbon_footprint_reports, website_stats
+
+# AnalysisMetrics fields reported by the metrics endpoints
+METRIC_FIELDS = [f'{name}_ms' for name in PHASES] + ['total_ms', 'requests', 'bytes_fetched', 'queries']
 
 @login_required
 def list_website_reports(request):
     user = request.user
-    website_reports = WebsiteReport.objects.filter(user=user).order_by('-created_at')
-
-    # Pagination
-    page = request.GET.get('page', 1)
-    paginator = Paginator(website_reports, 5) 
-    try:
-        website_reports_page = paginator.page(page)
-    except PageNotAnInteger:
-        website_reports_page = paginator.page(1)
-    except EmptyPage:
-        website_reports_page = paginator.page(paginator.num_pages)
-
-    # Create a range of page numbers for numeric pagination
-    page_range = range(max(1, website_reports_page.number - 2), min(website_reports_page.number + 3, paginator.num_pages + 1))
+    website_reports = WebsiteReport.objects.for_user(user)
+
+    # With cursor pagination the total is counted again only when the
+    # user's reports change
+    website_reports_page, page_range = paginate(
+        request, website_reports, 5,
+        salt='reports.website_reports',
+        count_cache_key=f'reports:website-report-count:{user.id}:{data_version(user.id)}',
+    )
 
-    return render(request, 'reports/list_website_reports.html', {'website_reports': website_reports_page, 'page_range': page_range})
+    # Analyses that are still queued or running, and recent failures
+    jobs = AnalysisJob.objects.filter(
+        user=user,
+        status__in=[AnalysisJob.QUEUED, AnalysisJob.RUNNING, AnalysisJob.FAILED],
+        created_at__gte=timezone.now() - timedelta(days=1),
+    ).order_by('-created_at')
+    # Running jobs whose lease expired are not coming back until a worker
+    # releases them, so they do not keep the page refreshing
+    expiry = lease_expiry()
+    has_active_jobs = any(job.is_active(expiry) for job in jobs)
+
+    return render(request, 'reports/list_website_reports.html', {
+        'website_reports': website_reports_page,
+        'page_range': page_range,
+        'jobs': jobs,
+        'has_active_jobs': has_active_jobs,
+    })
 
 @login_required
 def delete_website_report(request, report_id):
@@ -53,51 +79,184 @@ def show_website_report(request, report_id):
 
     # Get the website report by ID
     try:
-        website = WebsiteReport.objects.get(id=report_id, user=user)
+        website = WebsiteReport.objects.select_related('metrics').get(id=report_id, user=user)
     except WebsiteReport.DoesNotExist:
         return HttpResponse('Website report not found', status=404)
 
-    # Get the CarbonFootprintReport for the website
-    carbon_footprint_report = CarbonFootprintReport.objects.get(page__website=website)
-
-    bar_chart_data = generate_bar_chart_data(website)
-    bar_chart_layout = generate_bar_chart_layout()
-
-    pie_chart_data = generate_pie_chart_data(website)
-    pie_chart_layout = generate_pie_chart_layout()
-
-    carbon_footprint_chart_data = generate_carbon_footprint_chart_data(carbon_footprint_report)
-    carbon_footprint_chart_layout = generate_carbon_footprint_chart_layout()
-
-    # Get the top 3 websites with the highest total energy usage
-    top_three_websites = CarbonFootprintReport.objects.filter(user=user).order_by('-total_energy_usage')[:3]
-
-    # Generate the bar chart for the top 3 websites
-    top_websites_bar_chart_data = generate_top_websites_bar_chart_data(top_three_websites)
-    top_websites_bar_chart_layout = generate_top_websites_bar_chart_layout()
-
-
-    # Get the CO2 scores for all the user's websites over the last 30 days
-    thirty_days_ago = datetime.now() - timedelta(days=30)
-    co2_reports = CarbonFootprintReport.objects.filter(user=user, created_at__gte=thirty_days_ago)
-
-    # Generate the line chart for the CO2 scores
-    co2_line_chart_data = generate_co2_line_chart_data(co2_reports)
-    co2_line_chart_layout = generate_co2_line_chart_layout()
+    # The totals shown with the score come from the website report's summary
+    # columns; the charts are fetched from report_chart
+    carbon_footprint_report = website_stats(website)
 
     # Get 5 random hosting providers
-    hosting_providers = HostingProvider.objects.order_by('?')[:5]
+    hosting_providers = recommend_hosting_providers(5)
 
-    return render(request, 'reports/show_website_report.html', {
+    response = render(request, 'reports/show_website_report.html', {
         'website': website,
         'carbon_footprint_report': carbon_footprint_report,
-        'bar_chart_data': plot(go.Figure(data=[bar_chart_data], layout=bar_chart_layout), output_type='div'),
-        'carbon_footprint_chart_data': plot(go.Figure(data=[carbon_footprint_chart_data], layout=carbon_footprint_chart_layout), output_type='div'),
-        'pie_chart_data': plot(go.Figure(data=[pie_chart_data], layout=pie_chart_layout), output_type='div'),
-        'top_websites_bar_chart_data': plot(go.Figure(data=[top_websites_bar_chart_data], layout=top_websites_bar_chart_layout), output_type='div'),
-        'co2_line_chart_data': plot(go.Figure(data=[co2_line_chart_data], layout=co2_line_chart_layout), output_type='div'),
+        'chart_template': chart_template(),
+        'plotly_js': f'plotly/{plotly_js_name()}',
+        'history_windows': HISTORY_WINDOWS,
         'hosting_providers': hosting_providers,
     })
+    # Where the analysis spent its time, for the browser's developer tools;
+    # reports saved before the metrics were recorded have none
+    metrics = getattr(website, 'metrics', None)
+    if metrics is not None:
+        response['Server-Timing'] = metrics.server_timing()
+    return response
+
+# Metrics of one analysis, see scraper.instrumentation
+@login_required(login_url='login')
+def report_metrics(request, report_id):
+    metrics = AnalysisMetrics.objects.filter(website_id=report_id, website__user=request.user).first()
+    if metrics is None:
+        return JsonResponse({'error': 'Metrics not found'}, status=404)
+    response = JsonResponse({
+        'website': report_id,
+        'created_at': metrics.created_at,
+        **{field: getattr(metrics, field) for field in METRIC_FIELDS},
+    })
+    response['Server-Timing'] = metrics.server_timing()
+    return response
+
+# Average and worst metrics of the analyses of the last `days` days and of
+# the days before, to spot regressions and the phase most time goes to.
+# Staff see everyone's analyses with ?all=1, and the connection reuse and
+# cache counters of the process serving the request.
+@login_required(login_url='login')
+def analysis_stats(request):
+    days = request.GET.get('days', '7')
+    if not days.isdigit() or not 1 <= int(days) <= 365:
+        return JsonResponse({'error': 'days must be between 1 and 365'}, status=400)
+    days = int(days)
+
+    metrics = AnalysisMetrics.objects.all()
+    if not (request.user.is_staff and request.GET.get('all')):
+        metrics = metrics.filter(website__user=request.user)
+    now = timezone.now()
+    current = metric_stats(metrics.filter(created_at__gte=now - timedelta(days=days)))
+    previous = metric_stats(metrics.filter(created_at__gte=now - timedelta(days=2 * days), created_at__lt=now - timedelta(days=days)))
+    stats = {
+        'days': days,
+        'current': current,
+        'previous': previous,
+        'hot_phase': max(PHASES, key=lambda name: current[f'{name}_ms']['avg'] or 0) if current['count'] else None,
+    }
+    if request.user.is_staff:
+        # Counted since the process started
+        stats['process'] = {
+            'connections': connection_stats(),
+            'size_cache': cache_stats(),
+            'css_cache': css_cache_stats(),
+        }
+    return JsonResponse(stats)
+
+def metric_stats(metrics):
+    totals = {'count': Count('id')}
+    for field in METRIC_FIELDS:
+        totals[f'{field}__avg'] = Avg(field)
+        totals[f'{field}__max'] = Max(field)
+    totals = metrics.aggregate(**totals)
+    stats = {'count': totals['count']}
+    for field in METRIC_FIELDS:
+        stats[field] = {'avg': totals[f'{field}__avg'], 'max': totals[f'{field}__max']}
+    return stats
+
+def page_statistics_figure(website, user):
+    stats = website_stats(website)
+    return go.Figure(data=[generate_bar_chart_data(stats)], layout=generate_bar_chart_layout())
+
+def link_distribution_figure(website, user):
+    stats = website_stats(website)
+    return go.Figure(data=[generate_pie_chart_data(stats)], layout=generate_pie_chart_layout())
+
+def carbon_footprint_figure(website, user):
+    stats = website_stats(website)
+    return go.Figure(data=[generate_carbon_footprint_chart_data(stats)], layout=generate_carbon_footprint_chart_layout())
+
+def top_websites_figure(website, user):
+    # Get the top 3 websites with the highest total energy usage
+    top_three_websites = top_carbon_footprint_reports(user, 3)
+    return go.Figure(data=[generate_top_websites_bar_chart_data(top_three_websites)], layout=generate_top_websites_bar_chart_layout())
+
+def co2_history_figure(website, user, days=30):
+    # Daily CO2 totals of all the user's websites, from the rollup table
+    rollups = daily_history(user, days)
+    return go.Figure(data=[generate_co2_line_chart_data(rollups)], layout=generate_co2_line_chart_layout())
+
+# Charts of a report page by API name, in page order. The first three only
+# use the report itself, the others all of the user's reports.
+REPORT_CHARTS = {
+    'page-statistics': page_statistics_figure,
+    'link-distribution': link_distribution_figure,
+    'top-websites': top_websites_figure,
+    'carbon-footprint': carbon_footprint_figure,
+    'co2-history': co2_history_figure,
+}
+USER_WIDE_CHARTS = {'top-websites', 'co2-history'}
+# Days the CO2 history can cover, picked with ?days=
+HISTORY_WINDOWS = [7, 30, 365]
+
+def chart_options(request, chart):
+    # Keyword arguments for the chart's figure function from the query
+    # string, None if they are invalid
+    if chart != 'co2-history':
+        return {}
+    days = request.GET.get('days', '30')
+    if not days.isdigit() or int(days) not in HISTORY_WINDOWS:
+        return None
+    return {'days': int(days)}
+
+def chart_cache_name(chart, options):
+    # Names the chart's data in the cache and its ETag
+    parts = [chart] + [f'{key}{value}' for key, value in sorted(options.items())]
+    if chart == 'co2-history':
+        # The window ends today, so it moves every day
+        parts.append(str(timezone.localdate()))
+    return '-'.join(parts)
+
+def chart_report(request, report_id, chart):
+    # The report a chart request is for, None if it is not the user's, the
+    # chart does not exist or its options are invalid; looked up once for the
+    # validators and the view.
+    if not hasattr(request, '_chart_report'):
+        request._chart_report = None
+        if chart in REPORT_CHARTS and chart_options(request, chart) is not None:
+            request._chart_report = WebsiteReport.objects.filter(id=report_id, user=request.user).first()
+    return request._chart_report
+
+def chart_etag(request, report_id, chart):
+    website = chart_report(request, report_id, chart)
+    if website is None:
+        return None
+    return f'{website.id}-{chart_cache_name(chart, chart_options(request, chart))}-{data_version(website.user_id)}'
+
+def chart_last_modified(request, report_id, chart):
+    # A report's own numbers never change after it is saved. The user wide
+    # charts have no single date, they rely on the ETag.
+    website = chart_report(request, report_id, chart)
+    if website is None or chart in USER_WIDE_CHARTS:
+        return None
+    return website.created_at
+
+# Read-only chart API: the {data, layout} spec of one chart of a report,
+# with validators so an unchanged chart is answered with a 304
+@login_required(login_url='login')
+@condition(etag_func=chart_etag, last_modified_func=chart_last_modified)
+def report_chart(request, report_id, chart):
+    website = chart_report(request, report_id, chart)
+    if website is None:
+        return JsonResponse({'error': 'Chart not found'}, status=404)
+    options = chart_options(request, chart)
+    spec = cached_report_data(
+        website,
+        chart_cache_name(chart, options),
+        lambda: figure_spec(REPORT_CHARTS[chart](website, request.user, **options)),
+    )
+    response = JsonResponse(spec)
+    # Cache, but always revalidate with the ETag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 def generate_top_websites_bar_chart_data(carbon_footprint_reports):
     return go.Bar(
@@ -114,17 +273,10 @@ def generate_top_websites_bar_chart_layout():
         template='plotly_dark'
     )
 
-def generate_bar_chart_data(website):
+def generate_bar_chart_data(stats):
     return go.Bar(
-        x=['Internal Links', 'External Links', 'External Resources', 'Social Media Links', 'Images', 'Videos'],
-        y=[
-            PageReport.objects.filter(website=website).aggregate(Sum('num_internal_links'))['num_internal_links__sum'],
-            PageReport.objects.filter(website=website).aggregate(Sum('num_external_links'))['num_external_links__sum'],
-            PageReport.objects.filter(website=website).aggregate(Sum('num_external_resources'))['num_external_resources__sum'],
-            PageReport.objects.filter(website=website).aggregate(Sum('num_social_media_links'))['num_social_media_links__sum'],
-            PageReport.objects.filter(website=website).aggregate(Sum('num_images'))['num_images__sum'],
-            PageReport.objects.filter(website=website).aggregate(Sum('num_videos'))['num_videos__sum'],
-        ],
+        x=page_stat_labels(),
+        y=page_stat_values(stats),
         name='Page Statistics'
     )
 
@@ -136,17 +288,10 @@ def generate_bar_chart_layout():
         template='plotly_dark'
     )
 
-def generate_pie_chart_data(website):
+def generate_pie_chart_data(stats):
     return go.Pie(
-        labels=['Internal Links', 'External Links', 'External Resources', 'Social Media Links', 'Images', 'Videos'],
-        values=[
-            PageReport.objects.filter(website=website).aggregate(Sum('num_internal_links'))['num_internal_links__sum'],
-            PageReport.objects.filter(website=website).aggregate(Sum('num_external_links'))['num_external_links__sum'],
-            PageReport.objects.filter(website=website).aggregate(Sum('num_external_resources'))['num_external_resources__sum'],
-            PageReport.objects.filter(website=website).aggregate(Sum('num_social_media_links'))['num_social_media_links__sum'],
-            PageReport.objects.filter(website=website).aggregate(Sum('num_images'))['num_images__sum'],
-            PageReport.objects.filter(website=website).aggregate(Sum('num_videos'))['num_videos__sum'],
-        ]
+        labels=page_stat_labels(),
+        values=page_stat_values(stats),
     )
 
 def generate_pie_chart_layout():
@@ -155,13 +300,13 @@ def generate_pie_chart_layout():
         template='plotly_dark'
     )
 
-def generate_carbon_footprint_chart_data(carbon_footprint_report):
+def generate_carbon_footprint_chart_data(stats):
     return go.Bar(
         x=['Images', 'Videos', 'Other'],
         y=[
-            carbon_footprint_report.carbon_footprint_images,
-            carbon_footprint_report.carbon_footprint_videos,
-            carbon_footprint_report.carbon_footprint_other
+            stats['carbon_footprint_images'],
+            stats['carbon_footprint_videos'],
+            stats['carbon_footprint_other']
         ],
         name='Carbon Footprint'
     )
@@ -174,10 +319,10 @@ def generate_carbon_footprint_chart_layout():
         template='plotly_dark'
     )
 
-def generate_co2_line_chart_data(co2_reports):
+def generate_co2_line_chart_data(rollups):
     return go.Scatter(
-        x=[report.created_at for report in co2_reports],
-        y=[report.carbon_footprint_score for report in co2_reports],
+        x=[rollup.day for rollup in rollups],
+        y=[rollup.carbon_footprint_score for rollup in rollups],
         mode='lines+markers',
         name='CO2 Scores Over Time'
     )
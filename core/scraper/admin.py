@@ -0,0 +1,8 @@
+from django.contrib import admin
+from .models import AnalysisJob, AnalysisMetrics, CachedResourceSize
+
+admin.site.register([
+    AnalysisJob,
+    AnalysisMetrics,
+    CachedResourceSize,
+])
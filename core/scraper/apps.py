@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class ScraperConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'scraper'
+
+    def ready(self):
+        from .instrumentation import install_query_counter
+
+        connection_created.connect(install_query_counter, dispatch_uid='scraper_query_counter')
@@ -0,0 +1,239 @@
+import math
+import re
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def synthetic_page(images=0, svgs=0, scripts=0, inline_scripts=0, stylesheets=0, videos=0, links=0, paragraphs=0, asset_prefix='/assets/'):
+    # Builds an HTML page with the given number of each kind of resource.
+    parts = ['<!DOCTYPE html><html><head><meta charset="utf-8"><title>Synthetic page</title>']
+    parts += [f'<link rel="stylesheet" href="{asset_prefix}style-{i}.css">' for i in range(stylesheets)]
+    parts += [f'<script src="{asset_prefix}script-{i}.js"></script>' for i in range(scripts)]
+    parts.append('</head><body>')
+    for i in range(max(images, svgs, inline_scripts, videos, links, paragraphs)):
+        if i < paragraphs:
+            parts.append(
+                f'<div class="card"><p>Paragraph {i}: Lorem ipsum dolor sit amet, consectetur '
+                'adipiscing elit, sed do eiusmod tempor incididunt ut labore et dolore magna aliqua.</p></div>'
+            )
+        if i < images:
+            parts.append(f'<img src="{asset_prefix}image-{i}.png" alt="Image {i}" width="320" height="240">')
+        if i < svgs:
+            parts.append(
+                f'<svg viewBox="0 0 24 24" width="24" height="24"><title>Icon {i}</title>'
+                '<path d="M12 2L2 7l10 5 10-5-10-5zM2 17l10 5 10-5M2 12l10 5 10-5"/></svg>'
+            )
+        if i < inline_scripts:
+            parts.append(f'<script>window.counter{i} = (window.counter{i} || 0) + {i};</script>')
+        if i < videos:
+            parts.append(f'<video src="{asset_prefix}video-{i}.mp4" controls></video>')
+        if i < links:
+            parts.append(f'<a href="/page-{i}">Page {i}</a>')
+    parts.append('</body></html>')
+    return ''.join(parts)
+
+
+def sized_page(size_in_mb):
+    # A page of roughly the given size with a realistic mix of resources.
+    block = synthetic_page(images=10, svgs=10, scripts=2, inline_scripts=3, stylesheets=1, videos=1, links=20, paragraphs=20)
+    repeats = max(1, int(size_in_mb * 1024 * 1024 / len(block)))
+    return synthetic_page(
+        images=10 * repeats,
+        svgs=10 * repeats,
+        scripts=2 * repeats,
+        inline_scripts=3 * repeats,
+        stylesheets=repeats,
+        videos=repeats,
+        links=20 * repeats,
+        paragraphs=20 * repeats,
+    )
+
+
+def percentile(values, q):
+    # Nearest-rank percentile, q in 0-100
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class _Server(ThreadingHTTPServer):
+    # The default backlog of 5 drops connections when many analyses run at
+    # once, and the retried SYN costs a second
+    request_queue_size = 1024
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hang up on bodies they do not want to read
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+# Pages of a FakeSite, as opposed to their assets under <page>/assets/
+PAGE_PATH_RE = re.compile(r'/(?:[\w-]+-)?page-\d+')
+
+
+class FakeSite:
+    """Serves synthetic pages and their assets on localhost.
+
+    /page-<n> and /<name>-page-<n> are synthetic_page()s built from
+    `page_options`; every other path is an asset of `asset_size` bytes
+    (`video_size` for .mp4, a CSS comment for .css), unless `files` maps it
+    to its own (body, content type) or (body, content type, status), or
+    `redirects` to a URL it redirects to. Each page links its own assets
+    unless `shared_assets` is set, so every analysis sizes them afresh.
+    Responses are delayed by `latency` seconds and bodies sent at
+    `bandwidth` bytes per second (None for no limit). A
+    `missing_content_length` share of the assets is sent without
+    Content-Length, which makes the sizer fall back to a Range request, or
+    to reading the body when `honor_range` is off.
+
+    Use it as a context manager; `hits` counts the requests by kind and
+    `max_in_flight` is the most requests it was answering at once.
+    """
+
+    def __init__(self, page_options=None, asset_size=20 * 1024, video_size=1024 * 1024, latency=0.0,
+                 bandwidth=None, missing_content_length=0.0, honor_range=True, shared_assets=False, files=None, redirects=None):
+        self.page_options = page_options or {}
+        self.files = files or {}
+        self.redirects = redirects or {}
+        self.asset_size = asset_size
+        self.video_size = video_size
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.missing_content_length = missing_content_length
+        self.honor_range = honor_range
+        self.shared_assets = shared_assets
+        self.hits = Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._pages = {}
+        self._server = None
+
+    def __enter__(self):
+        self._server = _Server(('127.0.0.1', 0), self.handler_class())
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def url(self, path='/'):
+        return f'http://127.0.0.1:{self._server.server_port}{path}'
+
+    def page(self, path):
+        if path not in self._pages:
+            prefix = '/assets/' if self.shared_assets else f'{path}/assets/'
+            self._pages[path] = synthetic_page(asset_prefix=prefix, **self.page_options).encode()
+        return self._pages[path]
+
+    def stylesheet(self):
+        return b'/*' + b'x' * max(self.asset_size - 4, 0) + b'*/'
+
+    def has_content_length(self, path):
+        # The same assets lack it on every run
+        return zlib.crc32(path.encode()) % 1000 >= self.missing_content_length * 1000
+
+    def record(self, kind):
+        with self._lock:
+            self.hits[kind] += 1
+
+    @contextmanager
+    def answering(self):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def handler_class(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are written separately; without this a
+            # keep-alive response can wait for a delayed ACK
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                with site.answering():
+                    self.respond(send_body=False)
+
+            def do_GET(self):
+                with site.answering():
+                    self.respond(send_body=True)
+
+            def respond(self, send_body):
+                path = self.path.split('?')[0]
+                is_range = send_body and 'Range' in self.headers
+                site.record('range' if is_range else self.command)
+                if path in site.redirects:
+                    self.send_response(301)
+                    self.send_header('Location', site.redirects[path])
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                if site.latency:
+                    time.sleep(site.latency)
+
+                status = 200
+                if path in site.files:
+                    body, content_type, *rest = site.files[path]
+                    status = rest[0] if rest else status
+                    with_length = True
+                elif PAGE_PATH_RE.fullmatch(path):
+                    body, content_type, with_length = site.page(path), 'text/html; charset=utf-8', True
+                elif path.endswith('.css'):
+                    body, content_type, with_length = site.stylesheet(), 'text/css', site.has_content_length(path)
+                else:
+                    size = site.video_size if path.endswith('.mp4') else site.asset_size
+                    body, content_type, with_length = b'x' * size, 'application/octet-stream', site.has_content_length(path)
+
+                if is_range and site.honor_range and status == 200:
+                    self.send_response(206)
+                    self.send_header('Content-Type', content_type)
+                    self.send_header('Content-Range', f'bytes 0-0/{len(body)}')
+                    self.send_header('Content-Length', '1')
+                    self.end_headers()
+                    self.wfile.write(body[:1])
+                    return
+
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                if with_length:
+                    self.send_header('Content-Length', str(len(body)))
+                elif send_body:
+                    # Without a length the end of the body is the end of the connection
+                    self.send_header('Connection', 'close')
+                    self.close_connection = True
+                self.end_headers()
+                if send_body:
+                    self.send_body(body)
+
+            def send_body(self, body):
+                chunk_size = 16 * 1024
+                for start in range(0, len(body), chunk_size):
+                    chunk = body[start:start + chunk_size]
+                    try:
+                        self.wfile.write(chunk)
+                    except (BrokenPipeError, ConnectionResetError):
+                        # The sizer stops reading once it has what it needs
+                        return
+                    if site.bandwidth:
+                        time.sleep(len(chunk) / site.bandwidth)
+
+        return Handler
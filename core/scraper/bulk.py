@@ -0,0 +1,123 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+
+from reports.charts import bump_data_version
+from reports.models import CarbonFootprintReport, ImageReport, PageReport, VideoReport, WebsiteReport
+from reports.rollups import apply_to_rollups
+
+from .instrumentation import AnalysisRecorder
+from .models import AnalysisMetrics
+
+
+def read_urls(lines):
+    # One URL per line; blank lines and # comments are skipped.
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+
+def build(user, url, max_pages):
+    # Imported here because the views module imports this one
+    from .views import WebParser
+
+    try:
+        web_parser = WebParser(user, url)
+        return (*web_parser.build_reports(max_pages), web_parser.metrics)
+    finally:
+        # Runs on a pool thread, which would otherwise keep its connection
+        connection.close()
+
+
+def save_in_bulk(analyses):
+    # Save [(website_report, page_reports, metrics)] with one INSERT per
+    # report table, then the metrics of each analysis.
+    batch = AnalysisRecorder()
+    with batch.phase('save'), transaction.atomic():
+        WebsiteReport.objects.bulk_create([website_report for website_report, _, _ in analyses])
+        page_reports = [reports for _, page_reports, _ in analyses for reports in page_reports]
+        PageReport.objects.bulk_create([reports[0] for reports in page_reports])
+        for position, model in enumerate([ImageReport, VideoReport, CarbonFootprintReport], 1):
+            model.objects.bulk_create([reports[position] for reports in page_reports])
+        # bulk_create sends no post_save, so update the rollups and
+        # invalidate the users' charts here
+        apply_to_rollups([reports[3] for reports in page_reports])
+        for user_id in {website_report.user_id for website_report, _, _ in analyses}:
+            bump_data_version(user_id)
+
+    # Each analysis is charged its share of the batch
+    save_seconds = batch.phases['save'] / len(analyses)
+    for _, _, metrics in analyses:
+        metrics.add('save', save_seconds, queries=batch.queries // len(analyses))
+    AnalysisMetrics.objects.bulk_create([
+        AnalysisMetrics(website=website_report, **metrics.as_fields()) for website_report, _, metrics in analyses
+    ])
+
+
+def analyze_urls(user, urls, workers=None, max_pages=1, batch_size=None):
+    """Analyze many URLs concurrently and save the reports in bulk.
+
+    `urls` may be any iterable and is consumed lazily, with at most a few
+    URLs per worker in flight. Yields a progress dict per URL: errors as
+    soon as they happen, successes once their batch has been saved.
+    """
+    # Imported here because the views module imports this one
+    from .views import clean_url
+
+    workers = workers or getattr(settings, 'SCRAPER_BULK_WORKERS', 8)
+    batch_size = batch_size or getattr(settings, 'SCRAPER_BULK_BATCH_SIZE', 50)
+    urls = iter(urls)
+    in_flight = {}
+    pending = []
+    completed = 0
+    started = time.monotonic()
+
+    def progress(url, **result):
+        return dict(url=url, completed=completed, elapsed=round(time.monotonic() - started, 3), **result)
+
+    def flush():
+        save_in_bulk([analysis for _, analysis in pending])
+        for url, (website_report, page_reports, _) in pending:
+            yield progress(
+                url,
+                status='ok',
+                website_report=website_report.id,
+                pages=len(page_reports),
+                carbon_footprint_score=website_report.carbon_footprint_score,
+            )
+        pending.clear()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bulk-analysis') as pool:
+        while True:
+            # Keep the pool busy without reading the whole URL list up front
+            while len(in_flight) < workers * 2:
+                url = next(urls, None)
+                if url is None:
+                    break
+                try:
+                    url = clean_url(url)
+                except ValidationError:
+                    completed += 1
+                    yield progress(url, status='error', error='Invalid URL')
+                    continue
+                in_flight[pool.submit(build, user, url, max_pages)] = url
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                url = in_flight.pop(future)
+                completed += 1
+                try:
+                    pending.append((url, future.result()))
+                except Exception as e:
+                    yield progress(url, status='error', error=f'{type(e).__name__}: {e}')
+            if len(pending) >= batch_size:
+                yield from flush()
+
+    if pending:
+        yield from flush()
@@ -0,0 +1,118 @@
+import hashlib
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CachedResourceSize
+
+
+def url_hash(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+class CacheStats:
+    """Thread-safe hit/miss counters for the resource size cache."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.revalidated = 0
+            self.evicted = 0
+
+    def record(self, hits=0, misses=0, revalidated=0, evicted=0):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+            self.revalidated += revalidated
+            self.evicted += evicted
+
+    def as_dict(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.revalidated
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'revalidated': self.revalidated,
+                'evicted': self.evicted,
+                'hit_ratio': (self.hits + self.revalidated) / lookups if lookups else 0.0,
+            }
+
+
+stats = CacheStats()
+
+
+class SizeCache:
+    """Persistent absolute URL -> byte size cache.
+
+    Entries younger than the TTL are used as is. Older entries are
+    revalidated with their ETag/Last-Modified, so an unchanged asset costs a
+    304 instead of a fresh lookup. The least recently used entries are
+    evicted once the table grows past `max_entries`.
+    """
+
+    def __init__(self, ttl=None, max_entries=None):
+        self.ttl = timedelta(seconds=ttl or getattr(settings, 'SCRAPER_SIZE_CACHE_TTL', 7 * 24 * 60 * 60))
+        self.max_entries = max_entries or getattr(settings, 'SCRAPER_SIZE_CACHE_MAX_ENTRIES', 100000)
+
+    def lookup(self, urls):
+        hashes = {url_hash(url): url for url in urls}
+        entries = CachedResourceSize.objects.filter(url_hash__in=hashes)
+        return {hashes[entry.url_hash]: entry for entry in entries}
+
+    def is_fresh(self, entry, now=None):
+        return (now or timezone.now()) - entry.fetched_at < self.ttl
+
+    def touch(self, entries):
+        # Record a batch of hits with one UPDATE
+        if entries:
+            CachedResourceSize.objects.filter(id__in=[entry.id for entry in entries]).update(
+                last_used_at=timezone.now(),
+                hits=F('hits') + 1,
+            )
+
+    def store(self, results):
+        # results is {url: SizeResult}; failed lookups, error statuses
+        # included, are not cached.
+        now = timezone.now()
+        rows = [
+            CachedResourceSize(
+                url_hash=url_hash(url),
+                url=url,
+                size=result.size,
+                decoded_size=result.decoded_size,
+                etag=result.etag[:255],
+                last_modified=result.last_modified[:64],
+                fetched_at=now,
+                last_used_at=now,
+            )
+            for url, result in results.items() if result.ok
+        ]
+        if rows:
+            CachedResourceSize.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['url_hash'],
+                update_fields=['size', 'decoded_size', 'etag', 'last_modified', 'fetched_at', 'last_used_at'],
+            )
+            self.evict()
+
+    def evict(self):
+        excess = CachedResourceSize.objects.count() - self.max_entries
+        if excess <= 0:
+            return 0
+        oldest = CachedResourceSize.objects.order_by('last_used_at', 'id').values_list('id', flat=True)[:excess]
+        evicted, _ = CachedResourceSize.objects.filter(id__in=list(oldest)).delete()
+        stats.record(evicted=evicted)
+        return evicted
+
+
+def cache_stats():
+    return stats.as_dict()
@@ -0,0 +1,205 @@
+import asyncio
+import threading
+import weakref
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+from .instrumentation import current_recorder
+
+
+class ConnectionStats:
+    """Thread-safe counters of requests sent and connections opened."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.connections_opened = 0
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def record_connection(self):
+        with self._lock:
+            self.connections_opened += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'connections_opened': self.connections_opened,
+                'connections_reused': max(0, self.requests - self.connections_opened),
+            }
+
+
+stats = ConnectionStats()
+
+
+# Counted when the socket is opened: a pool reconnects the connection
+# objects it already has once the server closes them.
+class CountingHTTPConnection(HTTPConnection):
+    def connect(self):
+        stats.record_connection()
+        super().connect()
+
+
+class CountingHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        stats.record_connection()
+        super().connect()
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = CountingHTTPConnection
+
+    def urlopen(self, *args, **kwargs):
+        stats.record_request()
+        return super().urlopen(*args, **kwargs)
+
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = CountingHTTPSConnection
+
+    def urlopen(self, *args, **kwargs):
+        stats.record_request()
+        return super().urlopen(*args, **kwargs)
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    # Keeps one bounded, keep-alive connection pool per host and counts how
+    # often a pooled connection is reused.
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': CountingHTTPConnectionPool,
+            'https': CountingHTTPSConnectionPool,
+        }
+
+
+class CappedRetry(Retry):
+    # Waits at most SCRAPER_HTTP_MAX_RETRY_AFTER seconds however long a
+    # server's Retry-After asks for; the request timeout does not bound it.
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, getattr(settings, 'SCRAPER_HTTP_MAX_RETRY_AFTER', 5))
+
+
+def build_retry():
+    return CappedRetry(
+        total=getattr(settings, 'SCRAPER_HTTP_RETRIES', 2),
+        backoff_factor=getattr(settings, 'SCRAPER_HTTP_BACKOFF_FACTOR', 0.5),
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['HEAD', 'GET']),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+
+def build_session():
+    adapter = PooledHTTPAdapter(
+        pool_connections=getattr(settings, 'SCRAPER_HTTP_POOL_HOSTS', 32),
+        pool_maxsize=getattr(settings, 'SCRAPER_HTTP_POOL_MAXSIZE', 6),
+        pool_block=True,
+        max_retries=build_retry(),
+    )
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = getattr(settings, 'SCRAPER_HTTP_USER_AGENT', session.headers['User-Agent'])
+    return session
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    # The session is shared by every scraper thread in the process so
+    # keep-alive connections outlive a single analysis.
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = build_session()
+    return _session
+
+
+def reset_session():
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def connection_stats():
+    return stats.as_dict()
+
+
+async def _record_response(response):
+    # Response hook of the async client: counts the request for the
+    # analysis running in the calling task, its bytes once it is closed.
+    # Not part of the ConnectionStats, which are the requests session's.
+    recorder = current_recorder()
+    if recorder is not None:
+        recorder.record_response(response, stream=True)
+
+
+def build_async_client():
+    limits = httpx.Limits(
+        max_connections=getattr(settings, 'SCRAPER_ASYNC_MAX_CONNECTIONS', 200),
+        max_keepalive_connections=getattr(settings, 'SCRAPER_ASYNC_MAX_KEEPALIVE', 50),
+    )
+    return httpx.AsyncClient(
+        # Retries connection failures only; status codes are not retried
+        transport=httpx.AsyncHTTPTransport(limits=limits, retries=getattr(settings, 'SCRAPER_HTTP_RETRIES', 2)),
+        timeout=getattr(settings, 'SCRAPER_REQUEST_TIMEOUT', 10),
+        headers={'User-Agent': getattr(settings, 'SCRAPER_HTTP_USER_AGENT', f'python-httpx/{httpx.__version__}')},
+        event_hooks={'response': [_record_response]},
+    )
+
+
+# httpx clients are bound to the event loop they were first used on, and
+# so are the per host limits
+_async_clients = weakref.WeakKeyDictionary()
+_async_host_slots = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    # The async counterpart of get_session(), shared by every analysis on
+    # the running event loop. Must be called from a coroutine.
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = _async_clients[loop] = build_async_client()
+    return client
+
+
+def async_host_slots(url):
+    # httpx only limits the connections of the whole client, so requests to
+    # one host are bounded here, across every analysis on the event loop,
+    # as the session's per host pools bound them for the threads.
+    slots = _async_host_slots.setdefault(asyncio.get_running_loop(), {})
+    host = urlsplit(url).netloc
+    if host not in slots:
+        slots[host] = asyncio.Semaphore(getattr(settings, 'SCRAPER_HTTP_POOL_MAXSIZE', 6))
+    return slots[host]
+
+
+async def close_async_client():
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,157 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urldefrag, urljoin, urlsplit, urlunsplit
+
+from django.conf import settings
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_url(url):
+    # Canonical form used to dedup the frontier: lower-case scheme and host,
+    # no default port, no fragment and '/' for an empty path.
+    url, _ = urldefrag(url)
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f'{host}:{parts.port}'
+    return urlunsplit((scheme, host, parts.path or '/', parts.query, ''))
+
+
+def origin(url):
+    parts = urlsplit(normalize_url(url))
+    return parts.scheme, parts.netloc
+
+
+class HostRateLimiter:
+    """Spaces out requests to the same host by at least `delay` seconds."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, url):
+        # Takes the host's next slot, returns the seconds until it comes
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.delay
+        return slot - now
+
+    def wait(self, url):
+        delay = self.reserve(url)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def await_slot(self, url):
+        delay = self.reserve(url)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class Crawler:
+    """Breadth-first crawl of the pages of one site.
+
+    Starting from an already parsed page, links are queued breadth first
+    and fetched concurrently, in waves of at most the pages still wanted.
+    Only links to the start page's origin are followed, every normalized
+    URL is visited once, and requests to a host are spaced out by the rate
+    limiter.
+
+    `fetch_page(url)` must return a PageInventory, or None for anything that
+    is not an HTML page. For acrawl() it is a coroutine function, and each
+    wave is fetched by up to `max_workers` tasks instead of threads.
+    """
+
+    def __init__(self, fetch_page, max_pages=None, max_depth=None, max_workers=None, delay=None):
+        self.fetch_page = fetch_page
+        self.max_pages = max_pages or getattr(settings, 'SCRAPER_CRAWL_MAX_PAGES', 10)
+        self.max_depth = max_depth if max_depth is not None else getattr(settings, 'SCRAPER_CRAWL_MAX_DEPTH', 2)
+        self.max_workers = max_workers or getattr(settings, 'SCRAPER_CRAWL_WORKERS', 4)
+        delay = delay if delay is not None else getattr(settings, 'SCRAPER_CRAWL_DELAY', 0.5)
+        self.rate_limiter = HostRateLimiter(delay)
+
+    def links(self, page_url, inventory):
+        for href in inventory.links:
+            absolute_url = urljoin(page_url, href.strip())
+            if urlsplit(absolute_url).scheme in DEFAULT_PORTS:
+                yield absolute_url
+
+    def fetch(self, url):
+        self.rate_limiter.wait(url)
+        try:
+            return self.fetch_page(url)
+        except Exception:
+            # A broken page should not end the crawl
+            return None
+
+    async def afetch(self, url):
+        await self.rate_limiter.await_slot(url)
+        try:
+            return await self.fetch_page(url)
+        except Exception:
+            return None
+
+    def queue_links(self, queue, seen, start_origin, page_url, inventory, depth):
+        # Queues the unseen same-origin links of a page `depth` hops from
+        # the start page, normalized, unless they would be too deep
+        if depth >= self.max_depth:
+            return
+        for url in self.links(page_url, inventory):
+            normalized = normalize_url(url)
+            if normalized in seen or origin(normalized) != start_origin:
+                continue
+            seen.add(normalized)
+            queue.append((normalized, depth + 1))
+
+    def next_urls(self, queue, remaining):
+        # The next wave of queued (url, depth), at most `remaining` of them.
+        # Links that turn out not to be pages do not use up the budget: the
+        # rest of the queue is fetched in the next waves.
+        return [queue.popleft() for _ in range(min(remaining, len(queue)))]
+
+    def crawl(self, start_url, start_inventory):
+        # Returns [(url, inventory)] in the order the pages were visited.
+        start_origin = origin(start_url)
+        seen = {normalize_url(start_url)}
+        pages = [(start_url, start_inventory)]
+        queue = deque()
+        self.queue_links(queue, seen, start_origin, start_url, start_inventory, 0)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while queue and len(pages) < self.max_pages:
+                wave = self.next_urls(queue, self.max_pages - len(pages))
+                inventories = pool.map(self.fetch, [url for url, _ in wave])
+                for (url, depth), inventory in zip(wave, inventories):
+                    if inventory is not None:
+                        pages.append((url, inventory))
+                        self.queue_links(queue, seen, start_origin, url, inventory, depth)
+        return pages
+
+    async def acrawl(self, start_url, start_inventory):
+        # crawl() on the event loop
+        start_origin = origin(start_url)
+        seen = {normalize_url(start_url)}
+        pages = [(start_url, start_inventory)]
+        queue = deque()
+        self.queue_links(queue, seen, start_origin, start_url, start_inventory, 0)
+        workers = asyncio.Semaphore(self.max_workers)
+
+        async def fetch(url):
+            async with workers:
+                return await self.afetch(url)
+
+        while queue and len(pages) < self.max_pages:
+            wave = self.next_urls(queue, self.max_pages - len(pages))
+            inventories = await asyncio.gather(*(fetch(url) for url, _ in wave))
+            for (url, depth), inventory in zip(wave, inventories):
+                if inventory is not None:
+                    pages.append((url, inventory))
+                    self.queue_links(queue, seen, start_origin, url, inventory, depth)
+        return pages
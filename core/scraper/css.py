@@ -0,0 +1,235 @@
+import asyncio
+import hashlib
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from urllib.parse import urljoin
+
+import cssutils
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache import CacheStats
+from .crawl import normalize_url
+
+# Part of the cache keys; bump it when ParsedStylesheet changes
+PARSED_STYLESHEET_VERSION = 1
+
+# Shorter CSS, such as most inline <style> blocks, is parsed every time
+# rather than crowding the shared stylesheets out of the cache.
+MIN_CACHED_LENGTH = 2048
+
+URL_RE = re.compile(r'''url\(\s*(['"]?)(.*?)\1\s*\)''', re.IGNORECASE | re.DOTALL)
+STYLE_TAG_RE = re.compile(r'^\s*<style[^>]*>(.*?)(?:</style\s*>)?\s*$', re.IGNORECASE | re.DOTALL)
+
+
+@dataclass
+class ParsedStylesheet:
+    # References as written in the stylesheet, relative to its URL
+    imports: list = field(default_factory=list)  # @import
+    images: list = field(default_factory=list)  # url() in style rules: backgrounds, list markers, masks, ...
+    fonts: list = field(default_factory=list)  # the first url() of each @font-face src
+
+
+stats = CacheStats()
+
+# cssutils switches its global log.raiseExceptions flag on and off around
+# every parse, so a parse running next to another one can raise on CSS it
+# would otherwise just log. Analyses run on threads, so parse one at a time.
+_cssutils_lock = threading.Lock()
+
+# cssutils would fetch every absolute @import itself, with urllib and
+# without a timeout; the crawl below fetches them instead.
+_parser = cssutils.CSSParser(fetcher=lambda url: None, validate=False)
+
+# Third-party CSS is full of hacks and newer syntax cssutils logs as errors
+cssutils.log.setLevel(logging.CRITICAL)
+
+
+def _urls(style):
+    for prop in style.getProperties(all=True):
+        for value in prop.propertyValue:
+            if value.type == value.URI and value.uri:
+                yield value.uri
+
+
+def _collect(rules, parsed):
+    for rule in rules:
+        if rule.type == rule.IMPORT_RULE:
+            parsed.imports.append(rule.href)
+        elif rule.type == rule.FONT_FACE_RULE:
+            # src lists the formats in order of preference and browsers
+            # download the first they support, which is nearly always the
+            # first one
+            font = next(_urls(rule.style), None)
+            if font:
+                parsed.fonts.append(font)
+        elif rule.type in (rule.STYLE_RULE, rule.PAGE_RULE):
+            parsed.images += _urls(rule.style)
+        elif rule.type == rule.MEDIA_RULE:
+            _collect(rule.cssRules, parsed)
+        elif rule.type == rule.UNKNOWN_RULE:
+            # At-rules cssutils does not know (@supports, @layer, ...) keep
+            # their text only
+            parsed.images += [match.group(2) for match in URL_RE.finditer(rule.cssText)]
+
+
+def parse_stylesheet(css_text):
+    with _cssutils_lock:
+        sheet = _parser.parseString(css_text)
+        parsed = ParsedStylesheet()
+        _collect(sheet.cssRules, parsed)
+    return parsed
+
+
+def parsed_stylesheet(css_text):
+    # parse_stylesheet() through the cache. Entries are keyed by a hash of
+    # the CSS itself, so a framework stylesheet is parsed once whichever
+    # site or URL it is served from.
+    if len(css_text) < MIN_CACHED_LENGTH:
+        return parse_stylesheet(css_text)
+    digest = hashlib.sha256(css_text.encode('utf-8', 'surrogatepass')).hexdigest()
+    key = f'scraper:css:{PARSED_STYLESHEET_VERSION}:{digest}'
+    parsed = cache.get(key)
+    if parsed is not None:
+        stats.record(hits=1)
+        return parsed
+    stats.record(misses=1)
+    parsed = parse_stylesheet(css_text)
+    cache.set(key, parsed, getattr(settings, 'SCRAPER_CSS_CACHE_TIMEOUT', 7 * 24 * 60 * 60))
+    return parsed
+
+
+def style_text(markup):
+    # The CSS of <style> markup
+    match = STYLE_TAG_RE.match(markup)
+    return match.group(1) if match else markup
+
+
+def absolute_urls(base_url, references):
+    # data: URLs are part of the CSS, whose size already counts them
+    for reference in references:
+        reference = reference.strip()
+        if not reference.lower().startswith('data:'):
+            yield urljoin(base_url, reference)
+
+
+class StylesheetCrawl:
+    """Follows the CSS of one page through its @imports.
+
+    The inline <style> blocks and linked stylesheets are the first level;
+    each fetched stylesheet's @imports make the next. Every stylesheet is
+    fetched once however the imports cycle, up to `max_depth` levels of
+    imports and `max_stylesheets` stylesheets. The drivers below fetch the
+    URLs of next_urls() and hand each ParsedStylesheet to add().
+    """
+
+    def __init__(self, page_url, inventory, max_depth=None, max_stylesheets=None):
+        self.page_url = page_url
+        self.max_depth = max_depth if max_depth is not None else getattr(settings, 'SCRAPER_CSS_MAX_IMPORT_DEPTH', 4)
+        self.max_stylesheets = max_stylesheets or getattr(settings, 'SCRAPER_CSS_MAX_STYLESHEETS', 50)
+        self.inline_texts = [style_text(markup) for markup in inventory.inline_styles]
+        # Dicts keep the first occurrence of each URL in order
+        self.images = {}
+        self.fonts = {}
+        self.imports = {}  # stylesheets the page does not link itself
+        self.sizes = {}  # wire size in bytes of every fetched stylesheet, by URL
+        self.seen = set()
+        self.fetched = 0
+        self.depth = 0
+        self.pending = []
+        self.queue(page_url, inventory.stylesheets)
+
+    def queue(self, base_url, references, imported=False):
+        for reference in references:
+            url = urljoin(base_url, reference.strip())
+            if not url.startswith(('http://', 'https://')):
+                continue
+            normalized = normalize_url(url)
+            if normalized not in self.seen:
+                self.seen.add(normalized)
+                self.pending.append(url)
+                if imported:
+                    # Loaded by the page even when the limits stop the crawl
+                    self.imports[url] = None
+
+    def next_urls(self):
+        # The stylesheets to fetch next, empty when the crawl is done
+        if self.depth > self.max_depth:
+            return []
+        urls = self.pending[:self.max_stylesheets - self.fetched]
+        self.pending = []
+        self.fetched += len(urls)
+        self.depth += 1
+        return urls
+
+    def add(self, base_url, parsed, size=None):
+        # A parsed stylesheet, at `base_url` (the page's for inline CSS)
+        for url in absolute_urls(base_url, parsed.images):
+            self.images.setdefault(url, None)
+        for url in absolute_urls(base_url, parsed.fonts):
+            self.fonts.setdefault(url, None)
+        if size is not None:
+            self.sizes[base_url] = size
+        self.queue(base_url, parsed.imports, imported=True)
+
+    def apply(self, inventory):
+        # Adds what the CSS pulls in to the page's inventory
+        inventory.background_images = list(self.images)
+        inventory.fonts = list(self.fonts)
+        inventory.imported_stylesheets = list(self.imports)
+
+
+def analyze_stylesheets(page_url, inventory, fetch, max_workers=None):
+    """Runs a StylesheetCrawl with `fetch(url)`, which returns the
+    stylesheet's (CSS text, wire size in bytes) or None, on a thread pool.
+    Updates the inventory and returns the crawl."""
+    crawl = StylesheetCrawl(page_url, inventory)
+    for css_text in crawl.inline_texts:
+        crawl.add(page_url, parsed_stylesheet(css_text))
+
+    def fetch_and_parse(url):
+        fetched = fetch(url)
+        if fetched is None:
+            return None
+        css_text, size = fetched
+        return parsed_stylesheet(css_text), size
+
+    max_workers = max_workers or getattr(settings, 'SCRAPER_MAX_WORKERS', 16)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while urls := crawl.next_urls():
+            for url, result in zip(urls, pool.map(fetch_and_parse, urls)):
+                if result is not None:
+                    crawl.add(url, *result)
+    crawl.apply(inventory)
+    return crawl
+
+
+async def aanalyze_stylesheets(page_url, inventory, afetch):
+    # analyze_stylesheets() on the event loop, `afetch` being a coroutine
+    # function; the parsing runs in worker threads
+    crawl = StylesheetCrawl(page_url, inventory)
+    parse = sync_to_async(parsed_stylesheet, thread_sensitive=False)
+    for css_text in crawl.inline_texts:
+        crawl.add(page_url, await parse(css_text))
+
+    async def fetch_and_parse(url):
+        fetched = await afetch(url)
+        if fetched is None:
+            return None
+        css_text, size = fetched
+        return await parse(css_text), size
+
+    while urls := crawl.next_urls():
+        for url, result in zip(urls, await asyncio.gather(*(fetch_and_parse(url) for url in urls))):
+            if result is not None:
+                crawl.add(url, *result)
+    crawl.apply(inventory)
+    return crawl
+
+
+def css_cache_stats():
+    return stats.as_dict()
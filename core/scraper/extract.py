@@ -0,0 +1,127 @@
+import html
+import re
+from dataclasses import dataclass, field
+
+from bs4.element import Tag
+
+# The elements sized by their markup. Comments are matched so the tags in
+# them are skipped, and <script> and <style> run to their end tag.
+INLINE_MARKUP_RE = re.compile(
+    r'<!--.*?(?:-->|\Z)'
+    r'|<(script|style)(?=[\s/>])([^>]*)>.*?(?:</\1\s*>|\Z)'
+    r'|<(/?)svg(?=[\s/>])[^>]*>',
+    re.IGNORECASE | re.DOTALL,
+)
+SRC_RE = re.compile(r'''(?:^|\s)src\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'=<>`]+))''', re.IGNORECASE)
+
+
+@dataclass
+class PageInventory:
+    """Everything scrape_page needs from a document, gathered in one pass."""
+
+    images: list = field(default_factory=list)  # <img> src values
+    background_images: list = field(default_factory=list)  # absolute url()s of the page's CSS, see scraper.css
+    fonts: list = field(default_factory=list)  # absolute @font-face src url()s of the page's CSS
+    imported_stylesheets: list = field(default_factory=list)  # absolute URLs of stylesheets pulled in by @import
+    svgs: list = field(default_factory=list)  # outermost inline <svg> markup
+    videos: list = field(default_factory=list)  # <video> src values
+    iframes: list = field(default_factory=list)  # <iframe> src values
+    stylesheets: list = field(default_factory=list)  # <link rel="stylesheet"> href values
+    scripts: list = field(default_factory=list)  # external <script> src values
+    inline_scripts: list = field(default_factory=list)  # inline <script> markup
+    inline_styles: list = field(default_factory=list)  # <style> markup
+    links: list = field(default_factory=list)  # <a> href values
+    num_links: int = 0  # every <a>
+    num_link_tags: int = 0  # every <link>
+    num_internal_links: int = 0
+    num_external_links: int = 0
+    num_social_media_links: int = 0
+
+    @property
+    def num_images(self):
+        return len(self.images) + len(self.background_images) + len(self.svgs)
+
+    # The add_* methods are shared by every parser backend so they all
+    # classify tags the same way.
+    def add_link_tag(self, rel, href):
+        self.num_link_tags += 1
+        if isinstance(rel, str):
+            rel = [rel]
+        if rel and 'stylesheet' in rel:
+            self.stylesheets.append(href)
+
+    def add_script(self, src, markup):
+        if src:
+            self.scripts.append(src)
+        else:
+            self.inline_scripts.append(markup)
+
+    def add_inline_markup(self, markup):
+        # Inline SVGs, scripts and styles count the bytes of their markup as
+        # written in the page, which a parse tree does not keep, so every
+        # backend reads them from the document text. An SVG counts once
+        # with everything in it, nested <svg>, <script> and <style> included.
+        svg_depth = 0
+        svg_start = 0
+        for match in INLINE_MARKUP_RE.finditer(markup):
+            name, attrs, closing = match.groups()
+            if name:
+                if svg_depth:
+                    continue
+                if name.lower() == 'style':
+                    self.inline_styles.append(match.group(0))
+                else:
+                    src = SRC_RE.search(attrs)
+                    src = html.unescape(src.group(1) or src.group(2) or src.group(3) or '') if src else ''
+                    self.add_script(src, '' if src else match.group(0))
+            elif closing is None:
+                continue  # a comment
+            elif closing:
+                if svg_depth:
+                    svg_depth -= 1
+                    if not svg_depth:
+                        self.svgs.append(markup[svg_start:match.end()])
+            elif match.group(0).endswith('/>'):
+                if not svg_depth:
+                    self.svgs.append(match.group(0))
+            else:
+                if not svg_depth:
+                    svg_start = match.start()
+                svg_depth += 1
+        if svg_depth:
+            # Left open until the end of the document
+            self.svgs.append(markup[svg_start:])
+
+    def add_link(self, href, page_url):
+        self.num_links += 1
+        if href:
+            self.links.append(href)
+        if href == page_url:
+            self.num_internal_links += 1
+        if href and page_url not in href:
+            self.num_external_links += 1
+        if href and 'social' in href:
+            self.num_social_media_links += 1
+
+
+def extract_inventory(soup, page_url):
+    # Walks the tree once for the tags; see add_inline_markup() for the rest
+    inventory = PageInventory()
+
+    for node in soup.descendants:
+        if not isinstance(node, Tag):
+            continue
+
+        name = node.name
+        if name == 'img':
+            inventory.images.append(node.get('src', ''))
+        elif name == 'video':
+            inventory.videos.append(node.get('src', ''))
+        elif name == 'iframe':
+            inventory.iframes.append(node.get('src', ''))
+        elif name == 'link':
+            inventory.add_link_tag(node.get('rel'), node.get('href', ''))
+        elif name == 'a':
+            inventory.add_link(node.get('href'), page_url)
+
+    return inventory
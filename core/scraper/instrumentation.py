@@ -0,0 +1,170 @@
+import threading
+import time
+import weakref
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Phases of an analysis, in the order they run
+PHASES = ['fetch', 'parse', 'crawl', 'css', 'sizing', 'build', 'save']
+
+# The recorder of the analysis running in this thread or asyncio task.
+# Context variables follow an analysis into sync_to_async() and
+# asyncio.to_thread(), and keep concurrent analyses on one event loop apart.
+_current = ContextVar('analysis_recorder', default=None)
+
+
+class AnalysisRecorder:
+    """Collects the metrics of one analysis.
+
+    Wall time per phase, outbound requests and the bytes they read off the
+    wire, and database queries. Requests are counted by RecordingSession, or
+    the async client's response hook, and may come from any thread; queries
+    are counted while the recorder is current (see count_query).
+    """
+
+    def __init__(self):
+        self.phases = defaultdict(float)  # in seconds
+        self.requests = 0
+        self.bytes_fetched = 0
+        self.queries = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            with recording(self):
+                yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name, seconds, queries=0):
+        with self._lock:
+            self.phases[name] += seconds
+            self.queries += queries
+
+    def count_query(self):
+        with self._lock:
+            self.queries += 1
+
+    def record_response(self, response, stream=False):
+        # Redirects and their final response each count as a request
+        with self._lock:
+            for each in [*response.history, response]:
+                self.requests += 1
+                if not stream or each is not response:
+                    self.bytes_fetched += wire_bytes(each)
+        if stream:
+            # The body is read later
+            self.count_when_closed(response)
+
+    def count_when_closed(self, response):
+        # Adds the body bytes of a streamed response once it is closed (on
+        # leaving its `with` block, or once httpx has read it), so that
+        # responses are not kept until the analysis ends. The wrappers hold
+        # the response weakly, they would keep it alive otherwise.
+        response_ref = weakref.ref(response)
+        response_class = type(response)
+
+        def count(response):
+            # Once, however often the response is closed
+            response.__dict__.pop('close', None)
+            response.__dict__.pop('aclose', None)
+            with self._lock:
+                self.bytes_fetched += wire_bytes(response)
+
+        def close():
+            response = response_ref()
+            try:
+                response_class.close(response)
+            finally:
+                count(response)
+
+        async def aclose():
+            response = response_ref()
+            try:
+                await response_class.aclose(response)
+            finally:
+                count(response)
+
+        response.close = close
+        if hasattr(response_class, 'aclose'):
+            response.aclose = aclose
+
+    def as_fields(self):
+        # The AnalysisMetrics fields, times in milliseconds
+        with self._lock:
+            fields = {f'{name}_ms': round(self.phases.get(name, 0.0) * 1000, 3) for name in PHASES}
+            fields.update(
+                total_ms=round(sum(self.phases.values()) * 1000, 3),
+                requests=self.requests,
+                bytes_fetched=self.bytes_fetched,
+                queries=self.queries,
+            )
+        return fields
+
+
+def wire_bytes(response):
+    # Body bytes read from the socket so far, before any decompression
+    if hasattr(response, 'num_bytes_downloaded'):
+        # httpx keeps count itself
+        return response.num_bytes_downloaded
+    try:
+        return response.raw.tell()
+    except AttributeError:
+        return 0
+
+
+@contextmanager
+def recording(recorder):
+    # Makes `recorder` the one count_query() reports to
+    token = _current.set(recorder)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def current_recorder():
+    return _current.get()
+
+
+def count_query(execute, sql, params, many, context):
+    # Database execute wrapper counting queries for the current recorder
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.count_query()
+    return execute(sql, params, many, context)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    # connection_created receiver. Inserted first so that the wrappers of
+    # connection.execute_wrapper() blocks, which pop the last one, still
+    # remove their own.
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, count_query)
+
+
+class RecordingSession:
+    """Wraps the shared requests session to count one analysis' requests."""
+
+    def __init__(self, session, recorder):
+        self.session = session
+        self.recorder = recorder
+
+    def request(self, method, url, **kwargs):
+        response = self.session.request(method, url, **kwargs)
+        self.recorder.record_response(response, stream=kwargs.get('stream', False))
+        return response
+
+    def get(self, url, **kwargs):
+        kwargs.setdefault('allow_redirects', True)
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        kwargs.setdefault('allow_redirects', False)
+        return self.request('HEAD', url, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
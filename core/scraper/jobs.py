@@ -0,0 +1,143 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import AnalysisJob
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_analysis(user, url, max_pages=1):
+    job = AnalysisJob.objects.create(user=user, url=url, max_pages=max_pages)
+    if getattr(settings, 'SCRAPER_JOBS_IN_PROCESS', True):
+        transaction.on_commit(lambda: get_local_pool().submit(run_pending_jobs_in_thread))
+    return job
+
+
+def lease_expiry():
+    # Running jobs started before this have lost their worker
+    return timezone.now() - timedelta(seconds=getattr(settings, 'SCRAPER_JOB_LEASE_TIMEOUT', 15 * 60))
+
+
+def release_stale_jobs():
+    # Queues the jobs whose lease expired again, or fails them once they
+    # used up their attempts, so a worker that died does not leave them
+    # running forever. Returns how many were released.
+    stale = AnalysisJob.objects.filter(status=AnalysisJob.RUNNING, started_at__lt=lease_expiry())
+    requeued = stale.filter(attempts__lt=getattr(settings, 'SCRAPER_JOB_MAX_ATTEMPTS', 2)).update(
+        status=AnalysisJob.QUEUED,
+        started_at=None,
+    )
+    failed = stale.update(
+        status=AnalysisJob.FAILED,
+        error='The analysis did not finish in time.',
+        finished_at=timezone.now(),
+    )
+    return requeued + failed
+
+
+def claim_next_job():
+    # A job is claimed by flipping it from queued to running with a
+    # conditional UPDATE, so several workers (threads or processes) can poll
+    # the same table without running a job twice. started_at is the
+    # worker's lease on the job.
+    release_stale_jobs()
+    while True:
+        job = AnalysisJob.objects.filter(status=AnalysisJob.QUEUED).order_by('created_at', 'id').first()
+        if job is None:
+            return None
+        claimed = AnalysisJob.objects.filter(id=job.id, status=AnalysisJob.QUEUED).update(
+            status=AnalysisJob.RUNNING,
+            started_at=timezone.now(),
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def run_job(job):
+    # Imported here because the views module imports this one
+    from .views import WebParser
+
+    try:
+        web_parser = WebParser(job.user, job.url)
+        if job.max_pages > 1:
+            website_report = web_parser.crawl(max_pages=job.max_pages)
+        else:
+            website_report = web_parser.scrape_page()
+    except Exception as e:
+        logger.exception('Analysis job %s for %s failed', job.id, job.url)
+        job.status = AnalysisJob.FAILED
+        job.error = f'{type(e).__name__}: {e}'
+    else:
+        job.status = AnalysisJob.DONE
+        job.website = website_report
+    job.finished_at = timezone.now()
+    # Only while this worker still holds the lease; a job released in the
+    # meantime belongs to whichever worker claimed it next
+    finished = AnalysisJob.objects.filter(id=job.id, status=AnalysisJob.RUNNING, started_at=job.started_at).update(
+        status=job.status,
+        website=job.website,
+        error=job.error,
+        finished_at=job.finished_at,
+    )
+    if not finished:
+        logger.warning('Analysis job %s finished after its lease expired', job.id)
+    return job
+
+
+def run_pending_jobs(stop_event=None):
+    # Runs queued jobs until there are none left; returns how many ran.
+    count = 0
+    while stop_event is None or not stop_event.is_set():
+        job = claim_next_job()
+        if job is None:
+            break
+        run_job(job)
+        count += 1
+    return count
+
+
+def run_pending_jobs_in_thread():
+    close_old_connections()
+    try:
+        return run_pending_jobs()
+    finally:
+        connection.close()
+
+
+def work(stop_event, poll_interval=None):
+    # Worker loop used by the run_analysis_workers command.
+    poll_interval = poll_interval or getattr(settings, 'SCRAPER_JOBS_POLL_INTERVAL', 2)
+    try:
+        while not stop_event.is_set():
+            close_old_connections()
+            if not run_pending_jobs(stop_event):
+                stop_event.wait(poll_interval)
+    finally:
+        connection.close()
+
+
+_local_pool = None
+_local_pool_lock = threading.Lock()
+
+
+def get_local_pool():
+    # Worker threads inside the web process, so analyses run without a
+    # separate worker when SCRAPER_JOBS_IN_PROCESS is on.
+    global _local_pool
+    if _local_pool is None:
+        with _local_pool_lock:
+            if _local_pool is None:
+                _local_pool = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'SCRAPER_JOB_WORKERS', 2),
+                    thread_name_prefix='analysis-job',
+                )
+    return _local_pool
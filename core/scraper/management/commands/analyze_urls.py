@@ -0,0 +1,55 @@
+import json
+import sys
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from scraper.bulk import analyze_urls, read_urls
+
+
+class Command(BaseCommand):
+    help = 'Analyze many URLs concurrently and save their reports for a user.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='*', help='URLs to analyze.')
+        parser.add_argument('--file', help="File with one URL per line, '-' for stdin.")
+        parser.add_argument('--user', required=True, help='Username that will own the reports.')
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'SCRAPER_BULK_WORKERS', 8),
+                            help='Number of URLs analyzed at the same time.')
+        parser.add_argument('--max-pages', type=int, default=1, help='Pages to crawl per URL.')
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'SCRAPER_BULK_BATCH_SIZE', 50),
+                            help='Number of analyses saved per bulk insert.')
+        parser.add_argument('--json', action='store_true', help='Write progress as one JSON object per line.')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']!r} does not exist.")
+        if options['workers'] < 1 or options['max_pages'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--workers, --max-pages and --batch-size must be at least 1.')
+
+        urls = list(options['urls'])
+        if options['file'] == '-':
+            urls += read_urls(sys.stdin)
+        elif options['file']:
+            with open(options['file']) as f:
+                urls += read_urls(f)
+        if not urls:
+            raise CommandError('No URLs given.')
+
+        ok = failed = 0
+        for result in analyze_urls(user, urls, options['workers'], options['max_pages'], options['batch_size']):
+            if result['status'] == 'ok':
+                ok += 1
+            else:
+                failed += 1
+            if options['json']:
+                self.stdout.write(json.dumps(result))
+            elif result['status'] == 'ok':
+                self.stdout.write(f"[{result['completed']}/{len(urls)}] {result['url']}: report {result['website_report']}")
+            else:
+                self.stderr.write(f"[{result['completed']}/{len(urls)}] {result['url']}: {result['error']}")
+        if not options['json']:
+            self.stdout.write(self.style.SUCCESS(f'Analyzed {ok} URL(s), {failed} failed.'))
@@ -0,0 +1,63 @@
+import logging
+import time
+import tracemalloc
+from dataclasses import asdict
+
+import cssutils
+from django.core.management.base import BaseCommand, CommandError
+
+from scraper.benchmark import sized_page
+from scraper.parsers import PARSERS, etree, get_parser
+
+
+class Command(BaseCommand):
+    help = 'Compare wall time and peak memory of the HTML parser backends on large pages.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=float, action='append', dest='sizes',
+                            help='Size in MB of a synthetic page to parse (repeatable, default 1 and 5).')
+        parser.add_argument('--file', action='append', dest='files', default=[],
+                            help='Also parse a saved HTML file (repeatable).')
+        parser.add_argument('--parser', action='append', dest='parsers', choices=list(PARSERS),
+                            help='Parser backend to include (repeatable, default all available).')
+        parser.add_argument('--repeat', type=int, default=3, help='Timed runs per page and parser.')
+
+    def handle(self, *args, **options):
+        # cssutils logs every non-CSS token it skips in the page text
+        cssutils.log.setLevel(logging.CRITICAL)
+        parsers = options['parsers'] or [name for name in PARSERS if etree is not None or not name.startswith('lxml')]
+        pages = [(f'synthetic {size:g} MB', sized_page(size).encode()) for size in options['sizes'] or [1, 5]]
+        for path in options['files']:
+            try:
+                with open(path, 'rb') as f:
+                    pages.append((path, f.read()))
+            except OSError as e:
+                raise CommandError(f'Could not read {path}: {e}')
+
+        page_url = 'https://example.com/'
+        for label, content in pages:
+            self.stdout.write(f'{label} ({len(content) / (1024 * 1024):.2f} MB)')
+            reference = None
+            for name in parsers:
+                backend = get_parser(name)
+                timings = []
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    inventory = backend.parse(content, page_url)
+                    timings.append(time.perf_counter() - start)
+
+                tracemalloc.start()
+                backend.parse(content, page_url)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+                counts = {key: value if isinstance(value, int) else len(value) for key, value in asdict(inventory).items()}
+                if reference is None:
+                    reference = counts
+                mismatches = [key for key in counts if counts[key] != reference[key]]
+                status = 'counts match' if not mismatches else f"counts differ: {', '.join(mismatches)}"
+                self.stdout.write(
+                    f'  {name:<12} best {min(timings) * 1000:8.1f} ms  '
+                    f'mean {sum(timings) / len(timings) * 1000:8.1f} ms  '
+                    f'peak {peak / (1024 * 1024):7.1f} MB  {status}'
+                )
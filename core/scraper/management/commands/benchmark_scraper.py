@@ -0,0 +1,233 @@
+import asyncio
+import json
+import logging
+import platform
+import statistics
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import ExitStack
+
+import cssutils
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from scraper.benchmark import FakeSite, percentile
+from scraper.cache import cache_stats, stats as size_cache_counters
+from scraper.client import close_async_client, connection_stats, reset_session, stats as connection_counters
+from scraper.css import css_cache_stats, stats as css_cache_counters
+from scraper.instrumentation import PHASES
+from scraper.views import AsyncWebParser, WebParser
+
+# Results compared against a baseline: (key, label, True if higher is better)
+COMPARED = [
+    ('pages_per_second', 'pages/s', True),
+    ('latency_p50_ms', 'p50 ms', False),
+    ('latency_p99_ms', 'p99 ms', False),
+    ('peak_memory_mb', 'peak MB', False),
+    ('requests_per_page', 'requests/page', False),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Run WebParser.scrape_page (or AsyncWebParser with --concurrency) against synthetic pages served '
+        'from a local fake web server and '
+        'report pages/s, latency percentiles, peak memory and outbound requests. Needs no network access; '
+        'the reports are rolled back afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=20, help='Pages to analyze after the warmup.')
+        parser.add_argument('--warmup', type=int, default=2, help='Pages analyzed first and left out of the results.')
+        parser.add_argument('--images', type=int, default=20, help='<img> tags per page.')
+        parser.add_argument('--scripts', type=int, default=5, help='External scripts per page.')
+        parser.add_argument('--stylesheets', type=int, default=3, help='External stylesheets per page.')
+        parser.add_argument('--svgs', type=int, default=10, help='Inline SVGs per page.')
+        parser.add_argument('--videos', type=int, default=1, help='<video> tags per page.')
+        parser.add_argument('--links', type=int, default=20, help='Links per page.')
+        parser.add_argument('--paragraphs', type=int, default=50, help='Text blocks per page.')
+        parser.add_argument('--asset-size', type=int, default=20 * 1024, help='Bytes per image, script and stylesheet.')
+        parser.add_argument('--video-size', type=int, default=1024 * 1024, help='Bytes per video.')
+        parser.add_argument('--latency', type=float, default=0.0, help='Milliseconds added before every response.')
+        parser.add_argument('--bandwidth', type=float, default=0.0,
+                            help='Response bodies are sent at this many KB/s (0 for no limit).')
+        parser.add_argument('--missing-content-length', type=float, default=0.0,
+                            help='Share of the assets (0-1) served without Content-Length.')
+        parser.add_argument('--no-range', action='store_true', help='Ignore Range headers, sending whole bodies.')
+        parser.add_argument('--shared-assets', action='store_true',
+                            help='Link the same assets from every page, so the size cache answers after the first.')
+        parser.add_argument('--concurrency', type=int, default=0,
+                            help='Analyze this many pages at a time with AsyncWebParser on an event loop '
+                                 '(0 analyzes them one after another with WebParser).')
+        parser.add_argument('--sites', type=int, default=1,
+                            help='Spread the pages over this many fake servers, each its own host.')
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+        parser.add_argument('--baseline', help='Compare with the JSON results of an earlier run.')
+
+    def handle(self, *args, **options):
+        if options['pages'] < 1 or options['sites'] < 1 or options['warmup'] < 0 or options['concurrency'] < 0:
+            raise CommandError('--pages and --sites must be at least 1, --warmup and --concurrency at least 0.')
+        if not 0 <= options['missing_content_length'] <= 1:
+            raise CommandError('--missing-content-length must be between 0 and 1.')
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Could not read {options['baseline']}: {e}")
+
+        # cssutils logs every token it skips
+        cssutils.log.setLevel(logging.CRITICAL)
+        config = {
+            key: options[key] for key in [
+                'pages', 'images', 'scripts', 'stylesheets', 'svgs', 'videos', 'links', 'paragraphs',
+                'asset_size', 'video_size', 'latency', 'bandwidth', 'missing_content_length', 'no_range',
+                'shared_assets', 'concurrency', 'sites',
+            ]
+        }
+        sites = [
+            FakeSite(
+                page_options={key: options[key] for key in ['images', 'scripts', 'stylesheets', 'svgs', 'videos', 'links', 'paragraphs']},
+                asset_size=options['asset_size'],
+                video_size=options['video_size'],
+                latency=options['latency'] / 1000,
+                bandwidth=options['bandwidth'] * 1024 or None,
+                missing_content_length=options['missing_content_length'],
+                honor_range=not options['no_range'],
+                shared_assets=options['shared_assets'],
+            )
+            for _ in range(options['sites'])
+        ]
+
+        def urls(name, count):
+            # Page i is served by site i
+            return [sites[i % len(sites)].url(f'/{name}-{i}') for i in range(count)]
+
+        # A fresh session, so no connection is kept from an earlier run
+        reset_session()
+        with ExitStack() as stack, transaction.atomic():
+            for site in sites:
+                stack.enter_context(site)
+            user = User.objects.create(username='benchmark-scraper')
+            concurrency = options['concurrency']
+            self.run(user, urls('warmup-page', options['warmup']), concurrency)
+            for site in sites:
+                site.hits.clear()
+            for counters in [connection_counters, size_cache_counters, css_cache_counters]:
+                counters.reset()
+
+            started = time.perf_counter()
+            latencies, metrics = self.run(user, urls('page', options['pages']), concurrency)
+            elapsed = time.perf_counter() - started
+            hits = dict(sum((site.hits for site in sites), Counter()))
+            # The process-wide counters of the measured pass; the connections
+            # are the requests session's, so all 0 with --concurrency
+            counters = {'connections': connection_stats(), 'size_cache': cache_stats(), 'css_cache': css_cache_stats()}
+
+            # Memory is traced in a separate pass, tracemalloc slows everything down
+            tracemalloc.start()
+            self.run(user, urls('traced-page', min(options['pages'], 3)), concurrency)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            transaction.set_rollback(True)
+        reset_session()
+
+        results = {
+            'config': config,
+            'python': platform.python_version(),
+            'pages_per_second': round(options['pages'] / elapsed, 3),
+            'latency_p50_ms': round(percentile(latencies, 50) * 1000, 3),
+            'latency_p90_ms': round(percentile(latencies, 90) * 1000, 3),
+            'latency_p99_ms': round(percentile(latencies, 99) * 1000, 3),
+            'latency_max_ms': round(max(latencies) * 1000, 3),
+            'peak_memory_mb': round(peak / (1024 * 1024), 3),
+            'requests_per_page': round(statistics.mean(fields['requests'] for fields in metrics), 3),
+            'bytes_fetched_per_page': round(statistics.mean(fields['bytes_fetched'] for fields in metrics)),
+            'queries_per_page': round(statistics.mean(fields['queries'] for fields in metrics), 3),
+            'server_hits': hits,
+            **counters,
+            'phases_ms': {
+                name: round(statistics.mean(fields[f'{name}_ms'] for fields in metrics), 3) for name in PHASES
+            },
+        }
+        self.report(results)
+        if baseline is not None:
+            self.compare(results, baseline)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+                f.write('\n')
+
+    def run(self, user, urls, concurrency):
+        # Analyzes the pages, returns their latencies and metrics
+        if concurrency:
+            return async_to_sync(self.run_async)(user, urls, concurrency)
+        latencies, metrics = [], []
+        for url in urls:
+            started = time.perf_counter()
+            web_parser = WebParser(user, url)
+            web_parser.scrape_page()
+            latencies.append(time.perf_counter() - started)
+            metrics.append(web_parser.metrics.as_fields())
+        return latencies, metrics
+
+    async def run_async(self, user, urls, concurrency):
+        in_flight = asyncio.Semaphore(concurrency)
+
+        async def analyze(url):
+            async with in_flight:
+                started = time.perf_counter()
+                web_parser = await AsyncWebParser.create(user, url)
+                await web_parser.ascrape_page()
+                return time.perf_counter() - started, web_parser.metrics.as_fields()
+
+        try:
+            results = await asyncio.gather(*(analyze(url) for url in urls))
+        finally:
+            await close_async_client()
+        return [latency for latency, _ in results], [fields for _, fields in results]
+
+    def report(self, results):
+        concurrency = results['config'].get('concurrency')
+        mode = f', {concurrency} at a time on the event loop' if concurrency else ''
+        self.stdout.write(f"{results['config']['pages']} pages at {results['pages_per_second']:.2f} pages/s{mode}")
+        self.stdout.write(
+            f"  latency  p50 {results['latency_p50_ms']:.1f} ms  p90 {results['latency_p90_ms']:.1f} ms  "
+            f"p99 {results['latency_p99_ms']:.1f} ms  max {results['latency_max_ms']:.1f} ms"
+        )
+        self.stdout.write(f"  peak memory {results['peak_memory_mb']:.1f} MB (traced over up to 3 pages)")
+        self.stdout.write(
+            f"  per page  {results['requests_per_page']:.1f} requests  "
+            f"{results['bytes_fetched_per_page'] / 1024:.1f} KB fetched  {results['queries_per_page']:.1f} queries"
+        )
+        self.stdout.write('  server  ' + '  '.join(f'{kind} {count}' for kind, count in sorted(results['server_hits'].items())))
+        connections = results['connections']
+        self.stdout.write(
+            f"  connections  {connections['connections_opened']} opened  {connections['connections_reused']} reused "
+            f"for {connections['requests']} requests"
+        )
+        for name in ['size_cache', 'css_cache']:
+            cache = results[name]
+            self.stdout.write(
+                f"  {name.replace('_', ' ')}  {cache['hits']} hits  {cache['misses']} misses  "
+                f"hit ratio {cache['hit_ratio']:.2f}"
+            )
+        self.stdout.write('  phases  ' + '  '.join(f'{name} {ms:.1f} ms' for name, ms in results['phases_ms'].items()))
+
+    def compare(self, results, baseline):
+        if baseline.get('config') != results['config']:
+            self.stdout.write(self.style.WARNING('The baseline was run with other options, the numbers may not compare.'))
+        self.stdout.write('Compared with the baseline:')
+        for key, label, higher_is_better in COMPARED:
+            before, after = baseline.get(key), results[key]
+            if not before:
+                continue
+            change = (after - before) / before * 100
+            better = change > 0 if higher_is_better else change < 0
+            style = self.style.SUCCESS if better else self.style.ERROR if abs(change) >= 5 else str
+            self.stdout.write(style(f'  {label:<14} {before:>10.2f} -> {after:>10.2f}  ({change:+.1f}%)'))
@@ -0,0 +1,40 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from scraper.jobs import run_pending_jobs, work
+
+
+class Command(BaseCommand):
+    help = 'Run queued website analyses on a pool of worker threads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'SCRAPER_JOB_WORKERS', 2),
+                            help='Number of worker threads.')
+        parser.add_argument('--poll-interval', type=float, default=getattr(settings, 'SCRAPER_JOBS_POLL_INTERVAL', 2),
+                            help='Seconds to wait before checking an empty queue again.')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty.')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            count = run_pending_jobs()
+            self.stdout.write(f'Ran {count} job(s).')
+            return
+
+        stop_event = threading.Event()
+        signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+        signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+
+        threads = [
+            threading.Thread(target=work, args=(stop_event, options['poll_interval']), name=f'analysis-worker-{i}')
+            for i in range(options['workers'])
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f"Started {options['workers']} analysis worker(s), press CTRL-C to stop.")
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=1)
+        self.stdout.write('Workers stopped.')
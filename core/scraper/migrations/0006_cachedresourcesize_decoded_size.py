@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0005_cachedresourcesize'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cachedresourcesize',
+            name='decoded_size',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0016_carbonfootprintreport_model_version'),
+        ('scraper', '0007_analysisjob_max_pages'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisMetrics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fetch_ms', models.FloatField(default=0.0)),
+                ('parse_ms', models.FloatField(default=0.0)),
+                ('css_ms', models.FloatField(default=0.0)),
+                ('crawl_ms', models.FloatField(default=0.0)),
+                ('sizing_ms', models.FloatField(default=0.0)),
+                ('build_ms', models.FloatField(default=0.0)),
+                ('save_ms', models.FloatField(default=0.0)),
+                ('total_ms', models.FloatField(default=0.0)),
+                ('requests', models.PositiveIntegerField(default=0)),
+                ('bytes_fetched', models.BigIntegerField(default=0)),
+                ('queries', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('website', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='metrics', to='reports.websitereport')),
+            ],
+        ),
+    ]
@@ -0,0 +1,75 @@
+from django.db import models
+from django.contrib.auth.models import User
+
+from .instrumentation import PHASES
+
+class AnalysisJob(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    url = models.URLField()
+    max_pages = models.PositiveIntegerField(default=1)  # more than 1 crawls the site
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED, db_index=True)
+    website = models.ForeignKey('reports.WebsiteReport', on_delete=models.SET_NULL, null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)  # times a worker claimed the job
+
+    def is_active(self, lease_expiry):
+        # Queued, or running on a worker whose lease has not expired
+        return self.status == self.QUEUED or (self.status == self.RUNNING and self.started_at >= lease_expiry)
+
+    def __str__(self):
+        return f"AnalysisJob {self.id} - {self.url} - {self.status}"
+
+class CachedResourceSize(models.Model):
+    url_hash = models.CharField(max_length=64, unique=True)  # sha256 of url
+    url = models.TextField()
+    size = models.BigIntegerField()  # transfer size in bytes
+    decoded_size = models.BigIntegerField(null=True, blank=True)  # in bytes, null when unknown
+    etag = models.CharField(max_length=255, blank=True)
+    last_modified = models.CharField(max_length=64, blank=True)
+    fetched_at = models.DateTimeField()  # when the size was last fetched or revalidated
+    last_used_at = models.DateTimeField(db_index=True)
+    hits = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"CachedResourceSize {self.id} - {self.url}"
+
+class AnalysisMetrics(models.Model):
+    # Where the time of one analysis went, see scraper.instrumentation.
+    # Before the stylesheet stage (scraper.css), css_ms was the cssutils
+    # time within parse_ms or crawl_ms.
+    website = models.OneToOneField('reports.WebsiteReport', on_delete=models.CASCADE, related_name='metrics')
+    fetch_ms = models.FloatField(default=0.0)
+    parse_ms = models.FloatField(default=0.0)
+    css_ms = models.FloatField(default=0.0)
+    crawl_ms = models.FloatField(default=0.0)
+    sizing_ms = models.FloatField(default=0.0)
+    build_ms = models.FloatField(default=0.0)
+    save_ms = models.FloatField(default=0.0)
+    total_ms = models.FloatField(default=0.0)
+    requests = models.PositiveIntegerField(default=0)  # outbound HTTP requests
+    bytes_fetched = models.BigIntegerField(default=0)  # as read off the wire
+    queries = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def server_timing(self):
+        # Server-Timing header value with the time of each phase
+        metrics = [f'analysis-{name};dur={getattr(self, f"{name}_ms"):.1f}' for name in PHASES]
+        metrics.append(f'analysis-total;dur={self.total_ms:.1f};desc="{self.requests} requests, {self.queries} queries"')
+        return ', '.join(metrics)
+
+    def __str__(self):
+        return f"AnalysisMetrics {self.id} - {self.website_id}"
@@ -0,0 +1,128 @@
+from html.parser import HTMLParser
+
+from bs4 import BeautifulSoup
+from bs4.dammit import UnicodeDammit
+from django.conf import settings
+
+from .extract import PageInventory, extract_inventory
+
+try:
+    from lxml import etree
+except ImportError:  # lxml is optional
+    etree = None
+
+
+def decode(content):
+    # The page as text, decoded the way Beautiful Soup would
+    return UnicodeDammit(content, is_html=True).unicode_markup if isinstance(content, bytes) else content
+
+
+class TreeParser:
+    """Builds a full Beautiful Soup tree, then walks it once."""
+
+    def __init__(self, builder='html.parser'):
+        self.builder = builder
+
+    def parse(self, content, page_url):
+        markup = decode(content)
+        inventory = extract_inventory(BeautifulSoup(markup, self.builder), page_url)
+        inventory.add_inline_markup(markup)
+        return inventory
+
+
+class _InventoryTokenizer(HTMLParser):
+    # Only remembers the tags the estimator counts; the inline markup is
+    # read from the text afterwards.
+    def __init__(self, page_url):
+        super().__init__(convert_charrefs=True)
+        self.page_url = page_url
+        self.inventory = PageInventory()
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {name: value if value is not None else '' for name, value in attrs}
+        inventory = self.inventory
+        if tag == 'img':
+            inventory.images.append(attrs.get('src', ''))
+        elif tag == 'video':
+            inventory.videos.append(attrs.get('src', ''))
+        elif tag == 'iframe':
+            inventory.iframes.append(attrs.get('src', ''))
+        elif tag == 'link':
+            inventory.add_link_tag(attrs.get('rel', '').split(), attrs.get('href', ''))
+        elif tag == 'a':
+            inventory.add_link(attrs.get('href'), self.page_url)
+
+
+class StreamParser:
+    """Tokenizes the document without building a tree.
+
+    Only the tags the estimator counts are looked at, and nothing of the
+    document is kept but the inline <svg>/<script>/<style> markup.
+    """
+
+    chunk_size = 64 * 1024
+
+    def parse(self, content, page_url):
+        markup = decode(content)
+        tokenizer = _InventoryTokenizer(page_url)
+        for start in range(0, len(markup), self.chunk_size):
+            tokenizer.feed(markup[start:start + self.chunk_size])
+        tokenizer.close()
+        tokenizer.inventory.add_inline_markup(markup)
+        return tokenizer.inventory
+
+
+class LxmlStreamParser:
+    """Event-driven parsing with lxml; finished elements are freed as we go."""
+
+    chunk_size = 64 * 1024
+
+    def parse(self, content, page_url):
+        markup = decode(content)
+        inventory = PageInventory()
+        parser = etree.HTMLPullParser(events=('start', 'end'))
+        for start in range(0, len(markup), self.chunk_size):
+            parser.feed(markup[start:start + self.chunk_size])
+            self.handle_events(parser, inventory, page_url)
+        parser.close()
+        self.handle_events(parser, inventory, page_url)
+        inventory.add_inline_markup(markup)
+        return inventory
+
+    def handle_events(self, parser, inventory, page_url):
+        for event, element in parser.read_events():
+            if event == 'end':
+                # Children have been handled, so only the element itself
+                # needs to stay in the tree.
+                del element[:]
+                continue
+            tag = element.tag if isinstance(element.tag, str) else None
+            if tag == 'img':
+                inventory.images.append(element.get('src', ''))
+            elif tag == 'video':
+                inventory.videos.append(element.get('src', ''))
+            elif tag == 'iframe':
+                inventory.iframes.append(element.get('src', ''))
+            elif tag == 'link':
+                inventory.add_link_tag(element.get('rel', '').split(), element.get('href', ''))
+            elif tag == 'a':
+                inventory.add_link(element.get('href'), page_url)
+
+
+PARSERS = {
+    'html.parser': lambda: TreeParser('html.parser'),
+    'lxml': lambda: TreeParser('lxml'),
+    'stream': StreamParser,
+    'lxml-stream': LxmlStreamParser,
+}
+
+
+def get_parser(name=None):
+    name = name or getattr(settings, 'SCRAPER_HTML_PARSER', 'stream')
+    if name == 'auto':
+        name = 'lxml-stream' if etree is not None else 'stream'
+    if name not in PARSERS:
+        raise ValueError(f"Unknown HTML parser {name!r}. Choose one of: {', '.join(PARSERS)}.")
+    if name.startswith('lxml') and etree is None:
+        raise ValueError(f"The {name!r} parser requires lxml to be installed.")
+    return PARSERS[name]()
@@ -0,0 +1,56 @@
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urljoin, urlsplit
+
+IMAGE = 'image'
+VIDEO = 'video'
+CSS = 'css'
+JS = 'js'
+FONT = 'font'
+
+
+@dataclass
+class Resource:
+    category: str  # IMAGE, VIDEO, CSS, JS or FONT
+    url: str = ''  # absolute URL of an external resource
+    inline_size: Optional[int] = None  # in bytes, for resources already in the HTML
+
+    @property
+    def is_inline(self):
+        return self.inline_size is not None
+
+
+def encoded_size(markup):
+    return len(markup.encode('utf-8'))
+
+
+def classify(category, reference, page_url):
+    # Only http(s) URLs are worth a network lookup. data: URIs are part of
+    # the HTML already, and anything else (empty src, javascript:, blob:)
+    # downloads nothing.
+    reference = reference.strip()
+    if reference.lower().startswith('data:'):
+        return Resource(category, inline_size=encoded_size(reference))
+    if not reference:
+        return Resource(category, inline_size=0)
+    absolute_url = urljoin(page_url, reference)
+    if urlsplit(absolute_url).scheme not in ('http', 'https'):
+        return Resource(category, inline_size=0)
+    return Resource(category, url=absolute_url)
+
+
+def classify_resources(inventory, page_url):
+    resources = []
+    resources += [classify(IMAGE, src, page_url) for src in inventory.images]
+    resources += [classify(IMAGE, url.strip('\'"'), page_url) for url in inventory.background_images]
+    resources += [Resource(IMAGE, inline_size=encoded_size(markup)) for markup in inventory.svgs]
+    resources += [classify(VIDEO, src, page_url) for src in inventory.videos]
+    # count youtube video embeds
+    resources += [classify(VIDEO, src, page_url) for src in inventory.iframes if 'youtube.com' in src]
+    resources += [classify(CSS, href, page_url) for href in inventory.stylesheets]
+    resources += [classify(CSS, url, page_url) for url in inventory.imported_stylesheets]
+    resources += [Resource(CSS, inline_size=encoded_size(markup)) for markup in inventory.inline_styles]
+    resources += [classify(JS, src, page_url) for src in inventory.scripts]
+    resources += [Resource(JS, inline_size=encoded_size(markup)) for markup in inventory.inline_scripts]
+    resources += [classify(FONT, url, page_url) for url in inventory.fonts]
+    return resources
@@ -0,0 +1,350 @@
+import asyncio
+import re
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .cache import SizeCache, stats as cache_stats
+from .client import async_host_slots, get_async_client, get_session
+
+CHUNK_SIZE = 64 * 1024
+CONTENT_RANGE_RE = re.compile(r'bytes\s+\d+-\d+/(\d+)', re.IGNORECASE)
+
+
+@dataclass
+class SizeResult:
+    size: int = 0  # transfer size in bytes, i.e. compressed if the server compresses
+    decoded_size: Optional[int] = None  # size after Content-Encoding is undone, None if unknown
+    etag: str = ''
+    last_modified: str = ''
+    method: str = ''  # 'head', 'range', 'stream' or 'cache'
+    truncated: bool = False  # the streamed body hit the byte cap, size is a lower bound
+    not_modified: bool = False  # the server answered 304 to a revalidation
+    ok: bool = True  # False when the server could not be reached or answered with an error
+
+
+def _content_length(headers):
+    try:
+        return int(headers['Content-Length'])
+    except (KeyError, ValueError):
+        return None
+
+
+def _is_identity(headers):
+    return headers.get('Content-Encoding', 'identity').strip().lower() in ('', 'identity')
+
+
+class _DecodedCounter:
+    # Counts the decoded length of a gzip/deflate body chunk by chunk,
+    # inflating at most CHUNK_SIZE bytes at a time.
+    def __init__(self):
+        self.decompressor = zlib.decompressobj(zlib.MAX_WBITS | 32)  # gzip or zlib header
+        self.size = 0
+
+    def feed(self, chunk):
+        data = chunk
+        while data and self.decompressor is not None:
+            try:
+                self.size += len(self.decompressor.decompress(data, CHUNK_SIZE))
+            except zlib.error:
+                self.decompressor = None
+                return
+            data = self.decompressor.unconsumed_tail
+
+    @property
+    def result(self):
+        return self.size if self.decompressor is not None else None
+
+
+class _BodyCounter:
+    # Counts a body as it arrives, as sent on the wire and decoded, up to
+    # `limit` bytes.
+    def __init__(self, headers, limit):
+        self.headers = headers
+        self.limit = limit
+        self.encoding = headers.get('Content-Encoding', 'identity').strip().lower()
+        self.decoded = _DecodedCounter() if self.encoding in ('gzip', 'x-gzip', 'deflate') else None
+        self.size = 0
+        self.truncated = False
+
+    def feed(self, chunk):
+        # True once the limit is reached and the rest should be left unread
+        self.size += len(chunk)
+        if self.decoded is not None:
+            self.decoded.feed(chunk)
+        self.truncated = self.size >= self.limit
+        return self.truncated
+
+    @property
+    def result(self):
+        if self.encoding in ('', 'identity'):
+            decoded_size = self.size
+        else:
+            decoded_size = self.decoded.result if self.decoded is not None and not self.truncated else None
+        return SizeResult(
+            size=self.size,
+            decoded_size=decoded_size,
+            etag=self.headers.get('ETag', ''),
+            last_modified=self.headers.get('Last-Modified', ''),
+            method='stream',
+            truncated=self.truncated,
+        )
+
+
+def _conditional_headers(entry):
+    headers = {}
+    if entry is not None:
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+    return headers
+
+
+class BaseResourceSizer:
+    """What ResourceSizer and AsyncResourceSizer share.
+
+    Each resource is sized by the cheapest request that gives an answer: a
+    HEAD, then a GET for the first byte (reading the total from
+    Content-Range), then a streamed GET that counts the body without
+    keeping it, up to `stream_limit` bytes. The subclasses make the
+    requests; the answers are read and the persistent cache (see
+    scraper.cache) kept here. The cache is used unless SCRAPER_SIZE_CACHE
+    is off.
+    """
+
+    def __init__(self, session, max_workers=None, timeout=None, cache=None, stream_limit=None):
+        self.session = session
+        self.max_workers = max_workers or getattr(settings, 'SCRAPER_MAX_WORKERS', 16)
+        self.timeout = timeout or getattr(settings, 'SCRAPER_REQUEST_TIMEOUT', 10)
+        self.stream_limit = stream_limit or getattr(settings, 'SCRAPER_STREAM_SIZE_LIMIT', 50 * 1024 * 1024)
+        if cache is None and getattr(settings, 'SCRAPER_SIZE_CACHE', True):
+            cache = SizeCache()
+        self.cache = cache
+
+    def _head_answer(self, response, entry):
+        # The size from a HEAD response, None if it does not give one
+        if response.status_code == 304 and entry is not None:
+            return self._not_modified(entry, 'head')
+        content_length = _content_length(response.headers)
+        if response.status_code < 400 and content_length is not None:
+            return SizeResult(
+                size=content_length,
+                decoded_size=content_length if _is_identity(response.headers) else None,
+                etag=response.headers.get('ETag', ''),
+                last_modified=response.headers.get('Last-Modified', ''),
+                method='head',
+            )
+        return None
+
+    def _range_answer(self, response, entry):
+        # The size from the response to a first byte Range request, None if
+        # the body has to be counted: this one when the server sent all of
+        # it, a new one for a 206 without the total.
+        if response.status_code == 304 and entry is not None:
+            return self._not_modified(entry, 'range')
+        if response.status_code == 206:
+            match = CONTENT_RANGE_RE.match(response.headers.get('Content-Range', ''))
+            if match:
+                total = int(match.group(1))
+                return SizeResult(
+                    size=total,
+                    decoded_size=total if _is_identity(response.headers) else None,
+                    etag=response.headers.get('ETag', ''),
+                    last_modified=response.headers.get('Last-Modified', ''),
+                    method='range',
+                )
+            return None
+        if response.status_code >= 400:
+            return SizeResult(method='range', ok=False)
+        return None
+
+    def _not_modified(self, entry, method):
+        return SizeResult(entry.size, entry.decoded_size, entry.etag, entry.last_modified, method, not_modified=True)
+
+    def _cached(self, unique_urls):
+        # ({url: SizeResult} of the fresh cache entries, {url: entry} of
+        # every entry found, the fresh entries)
+        measured = {}
+        entries = self.cache.lookup(unique_urls) if self.cache else {}
+        fresh = [entry for entry in entries.values() if self.cache.is_fresh(entry)]
+        for entry in fresh:
+            measured[entry.url] = SizeResult(entry.size, entry.decoded_size, entry.etag, entry.last_modified, 'cache')
+        return measured, entries, fresh
+
+    def _remember(self, fresh, results):
+        if self.cache:
+            self.cache.touch(fresh)
+            self.cache.store(results)
+            revalidated = sum(1 for result in results.values() if result.not_modified)
+            cache_stats.record(hits=len(fresh), misses=len(results) - revalidated, revalidated=revalidated)
+
+
+class ResourceSizer(BaseResourceSizer):
+    """Looks up resource sizes concurrently.
+
+    Requests run on a bounded thread pool, each host gets at most
+    `per_host_limit` requests in flight and every request has a timeout, so a
+    page with hundreds of assets is sized in a few round trips instead of one
+    per asset.
+    """
+
+    def __init__(self, max_workers=None, per_host_limit=None, timeout=None, session=None, cache=None, stream_limit=None):
+        super().__init__(session or get_session(), max_workers, timeout, cache, stream_limit)
+        self.per_host_limit = per_host_limit or getattr(settings, 'SCRAPER_PER_HOST_CONNECTIONS', 6)
+        self._host_semaphores = {}
+        self._lock = threading.Lock()
+
+    def _host_semaphore(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._host_semaphores:
+                self._host_semaphores[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._host_semaphores[host]
+
+    def fetch(self, absolute_url, entry=None):
+        # Size one resource over the network; with a cache entry the
+        # requests are conditional.
+        headers = _conditional_headers(entry)
+        with self._host_semaphore(absolute_url):
+            try:
+                response = self.session.head(absolute_url, headers=headers, timeout=self.timeout, allow_redirects=True)
+                result = self._head_answer(response, entry)
+                if result is not None:
+                    return result
+                # No usable HEAD answer (no Content-Length, HEAD rejected, ...)
+                return self._fetch_with_get(absolute_url, headers, entry)
+            except requests.RequestException:
+                return SizeResult(ok=False)
+
+    def _fetch_with_get(self, absolute_url, headers, entry):
+        with self.session.get(absolute_url, headers=dict(headers, Range='bytes=0-0'), timeout=self.timeout, stream=True) as response:
+            result = self._range_answer(response, entry)
+            if result is not None:
+                return result
+            if response.status_code != 206:
+                # The server ignored the Range header and is sending the
+                # whole body, so count it as it arrives.
+                return self._count_body(response)
+
+        # A 206 without the total size ("bytes 0-0/*")
+        with self.session.get(absolute_url, headers=headers, timeout=self.timeout, stream=True) as response:
+            if response.status_code >= 400:
+                return SizeResult(method='stream', ok=False)
+            return self._count_body(response)
+
+    def _count_body(self, response):
+        counter = _BodyCounter(response.headers, self.stream_limit)
+        # decode_content=False hands us the bytes as sent on the wire
+        for chunk in response.raw.stream(CHUNK_SIZE, decode_content=False):
+            if counter.feed(chunk):
+                break
+        return counter.result
+
+    def fetch_size(self, absolute_url):
+        # Returns the size in bytes, or 0 if it cannot be determined or the
+        # server cannot be reached in time.
+        return self.size_all([absolute_url])[absolute_url]
+
+    def size_all(self, absolute_urls):
+        # Each distinct URL is looked up once; returns {url: size in bytes}.
+        return {url: result.size for url, result in self.measure_all(absolute_urls).items()}
+
+    def measure_all(self, absolute_urls):
+        # Like size_all, but returns {url: SizeResult}.
+        unique_urls = list(dict.fromkeys(absolute_urls))
+        if not unique_urls:
+            return {}
+
+        measured, entries, fresh = self._cached(unique_urls)
+        to_fetch = [url for url in unique_urls if url not in measured]
+
+        results = {}
+        if to_fetch:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(to_fetch))) as pool:
+                fetched = pool.map(lambda url: self.fetch(url, entries.get(url)), to_fetch)
+                results = dict(zip(to_fetch, fetched))
+        measured.update(results)
+        self._remember(fresh, results)
+        return measured
+
+
+class AsyncResourceSizer(BaseResourceSizer):
+    """ResourceSizer for the event loop.
+
+    The same requests as ResourceSizer, made with the shared httpx.AsyncClient (see
+    scraper.client.get_async_client) from a coroutine per resource instead
+    of a thread, so the only bounds are `max_workers` in flight per call,
+    the per host limits shared by the event loop (see
+    scraper.client.async_host_slots) and the client's connection limits.
+    The cache is read and written through sync_to_async. Create it inside a
+    coroutine.
+    """
+
+    def __init__(self, client=None, **kwargs):
+        super().__init__(client or get_async_client(), **kwargs)
+
+    async def afetch(self, absolute_url, entry=None):
+        headers = _conditional_headers(entry)
+        async with async_host_slots(absolute_url):
+            try:
+                response = await self.session.head(absolute_url, headers=headers, timeout=self.timeout, follow_redirects=True)
+                result = self._head_answer(response, entry)
+                if result is not None:
+                    return result
+                return await self._afetch_with_get(absolute_url, headers, entry)
+            except httpx.HTTPError:
+                return SizeResult(ok=False)
+
+    async def _afetch_with_get(self, absolute_url, headers, entry):
+        request = self.session.stream('GET', absolute_url, headers=dict(headers, Range='bytes=0-0'), timeout=self.timeout, follow_redirects=True)
+        async with request as response:
+            result = self._range_answer(response, entry)
+            if result is not None:
+                return result
+            if response.status_code != 206:
+                return await self._acount_body(response)
+
+        request = self.session.stream('GET', absolute_url, headers=headers, timeout=self.timeout, follow_redirects=True)
+        async with request as response:
+            if response.status_code >= 400:
+                return SizeResult(method='stream', ok=False)
+            return await self._acount_body(response)
+
+    async def _acount_body(self, response):
+        counter = _BodyCounter(response.headers, self.stream_limit)
+        # aiter_raw() is the body as sent on the wire
+        async for chunk in response.aiter_raw(CHUNK_SIZE):
+            if counter.feed(chunk):
+                break
+        return counter.result
+
+    async def asize_all(self, absolute_urls):
+        return {url: result.size for url, result in (await self.ameasure_all(absolute_urls)).items()}
+
+    async def ameasure_all(self, absolute_urls):
+        unique_urls = list(dict.fromkeys(absolute_urls))
+        if not unique_urls:
+            return {}
+
+        measured, entries, fresh = await sync_to_async(self._cached)(unique_urls)
+        to_fetch = [url for url in unique_urls if url not in measured]
+
+        in_flight = asyncio.Semaphore(self.max_workers)
+
+        async def fetch(url):
+            async with in_flight:
+                return await self.afetch(url, entries.get(url))
+
+        results = dict(zip(to_fetch, await asyncio.gather(*(fetch(url) for url in to_fetch))))
+        measured.update(results)
+        await sync_to_async(self._remember)(fresh, results)
+        return measured
@@ -1,3 +1,911 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+import weakref
+from dataclasses import asdict
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from urllib.parse import urlsplit
 
-# Create your tests here.
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.urls import include, path, reverse
+from django.utils import timezone
+from urllib3 import HTTPResponse
+
+from reports.charts import data_version
+from reports.models import CarbonFootprintReport, DailyCarbonRollup, PageReport, WebsiteReport
+from reports.rollups import rebuild_rollups
+from reports.stats import refresh_summaries, website_stats
+from .bulk import save_in_bulk
+from .benchmark import FakeSite, percentile
+from .cache import SizeCache, stats as cache_stats
+from .client import build_retry, close_async_client, get_async_client, get_session, reset_session, stats as connection_stats
+from .crawl import Crawler, HostRateLimiter, normalize_url
+from .css import MIN_CACHED_LENGTH, StylesheetCrawl, parse_stylesheet, stats as css_stats
+from .extract import PageInventory
+from .instrumentation import AnalysisRecorder, RecordingSession, recording
+from .jobs import claim_next_job, run_job
+from .models import AnalysisJob, AnalysisMetrics, CachedResourceSize
+from .parsers import PARSERS, get_parser
+from .resources import IMAGE, classify_resources
+from .sizing import AsyncResourceSizer, ResourceSizer
+from .views import AsyncWebParser, NotHTMLError, WebParser, analyze_async
+
+# The async analyze view is only routed when SCRAPER_ASYNC_ANALYZE is on
+urlpatterns = [
+    path('analyze-async/', analyze_async, name='analyze_async'),
+    path('', include('core.urls')),
+]
+
+
+# Start pages that cannot be analyzed
+UNAVAILABLE_PAGES = {
+    '/missing': (b'<html>Not found</html>', 'text/html', 404),
+    '/file.zip': (b'x' * 1000, 'application/zip'),
+}
+
+
+class FakeSiteScrapeTests(TestCase):
+    # WebParser end to end against the local fake web server, no network needed
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+
+    def scrape(self, site, path='/page-0'):
+        web_parser = WebParser(self.user, site.url(path))
+        return web_parser, web_parser.scrape_page()
+
+    def test_scrape_page(self):
+        with FakeSite({'images': 3, 'scripts': 2, 'videos': 1, 'links': 4}, asset_size=1000, video_size=5000) as site:
+            web_parser, website_report = self.scrape(site)
+            hits = dict(site.hits)
+
+        page = PageReport.objects.get(website=website_report)
+        self.assertEqual(page.num_images, 3)
+        self.assertEqual(page.num_videos, 1)
+        self.assertEqual(website_report.pages, 4)  # the links on the page
+        # The page, then a HEAD per asset
+        self.assertEqual(hits, {'GET': 1, 'HEAD': 6})
+        metrics = web_parser.metrics.as_fields()
+        self.assertEqual(metrics['requests'], 7)
+        self.assertGreater(metrics['sizing_ms'], 0)
+        self.assertTrue(website_report.metrics)
+
+    def test_missing_content_length(self):
+        options = {'images': 2, 'videos': 1}
+        with FakeSite(options, asset_size=1000, video_size=5000, missing_content_length=1) as site:
+            _, with_range = self.scrape(site)
+            self.assertEqual(site.hits['range'], 3)
+        with FakeSite(options, asset_size=1000, video_size=5000, missing_content_length=1, honor_range=False) as site:
+            _, streamed = self.scrape(site)
+        # Both fallbacks find the same sizes
+        self.assertEqual(with_range.page_size, streamed.page_size)
+        self.assertGreater(with_range.page_size, 0)
+
+    def test_start_page_errors(self):
+        with FakeSite(files=UNAVAILABLE_PAGES) as site:
+            with self.assertRaises(requests.HTTPError):
+                WebParser(self.user, site.url('/missing'))
+            with self.assertRaises(NotHTMLError):
+                WebParser(self.user, site.url('/file.zip'))
+
+    @override_settings(SCRAPER_CRAWL_DELAY=0)
+    def test_crawl_skips_downloads(self):
+        start = '<a href="/a.zip">A</a><a href="/b.zip">B</a><a href="/page-1">1</a><a href="/page-2">2</a>'
+        download = (b'x' * 3 * 1024 * 1024, 'application/zip')
+        files = {'/start': (start.encode(), 'text/html'), '/a.zip': download, '/b.zip': download}
+        with FakeSite({'images': 1}, asset_size=1000, files=files) as site:
+            web_parser = WebParser(self.user, site.url('/start'))
+            website_report = web_parser.crawl(max_pages=3)
+
+        # The downloads neither use up the page budget nor get read
+        urls = PageReport.objects.filter(website=website_report).values_list('url', flat=True)
+        self.assertEqual(sorted(urls), [site.url('/page-1'), site.url('/page-2'), site.url('/start')])
+        self.assertLess(web_parser.metrics.as_fields()['bytes_fetched'], 1024 * 1024)
+
+    @override_settings(SCRAPER_CRAWL_DELAY=0, SCRAPER_CRAWL_MAX_PAGE_SIZE=100)
+    def test_crawl_skips_large_pages(self):
+        with FakeSite({'links': 3}) as site:
+            website_report = WebParser(self.user, site.url('/page-0')).crawl(max_pages=3)
+        self.assertEqual(website_report.pages, 1)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([5], 99), 5)
+        self.assertIsNone(percentile([], 50))
+
+
+ICON = """<SVG viewBox='0 0 24 24'><svg x=1><g/></svg><style>.s { fill: red }</style><path d="M0 0"/></SVG>"""
+MIXED_PAGE = f"""<!DOCTYPE html><html><head>
+<style media=print>a {{ color: red }}</style>
+<script type=module>if (1 < 2 && "&amp;") {{ document.write('<svg></svg>') }}</script>
+<script async src="/app.js?v=1&amp;lang=en"></script><script data-src=/lazy.js></script>
+</head><body>{ICON}<!-- <svg>commented out</svg> --><svg/>
+<img src=a.png><video src="/v.mp4"></video><iframe src="https://www.youtube.com/embed/x"></iframe>
+<link rel=stylesheet href=/s.css><a href="/about">About</a><a href="https://social.example/x">x</a>
+</body></html>"""
+
+
+class CrawlerTests(TestCase):
+    def crawl(self, site, start_url='https://example.com/', **options):
+        # Crawls {url: [links]} with no delay; returns the URLs visited and
+        # those fetched
+        fetched = []
+
+        def fetch_page(url):
+            fetched.append(url)
+            return PageInventory(links=site[url]) if url in site else None
+
+        # One worker, so pages are fetched in queue order
+        pages = Crawler(fetch_page, delay=0, max_workers=1, **dict({'max_pages': 10}, **options)).crawl(start_url, PageInventory(links=site[start_url]))
+        return [url for url, _ in pages], fetched
+
+    def test_normalize_url(self):
+        for url in ['HTTPS://Example.COM', 'https://example.com:443/', 'https://example.com/#top']:
+            with self.subTest(url=url):
+                self.assertEqual(normalize_url(url), 'https://example.com/')
+        self.assertEqual(normalize_url('http://example.com:8080/a?b=1#c'), 'http://example.com:8080/a?b=1')
+
+    def test_each_page_is_fetched_once(self):
+        site = {
+            'https://example.com/': ['/a', 'https://EXAMPLE.com/a#intro', 'https://example.com:443/a', '/', '/b'],
+            'https://example.com/a': ['/b', '/'],
+            'https://example.com/b': [],
+        }
+        visited, fetched = self.crawl(site)
+        self.assertEqual(visited, ['https://example.com/', 'https://example.com/a', 'https://example.com/b'])
+        self.assertEqual(fetched, ['https://example.com/a', 'https://example.com/b'])
+
+    def test_same_origin_only(self):
+        site = {
+            'https://example.com/': ['https://other.com/', 'http://example.com/a', 'https://sub.example.com/', 'mailto:a@example.com', '/b'],
+            'https://example.com/b': [],
+        }
+        self.assertEqual(self.crawl(site)[1], ['https://example.com/b'])
+
+    def test_max_depth(self):
+        site = {
+            'https://example.com/': ['/1'],
+            'https://example.com/1': ['/2'],
+            'https://example.com/2': ['/3'],
+            'https://example.com/3': [],
+        }
+        for max_depth, last in [(0, '/'), (1, '/1'), (2, '/2')]:
+            with self.subTest(max_depth=max_depth):
+                visited, _ = self.crawl(site, max_depth=max_depth)
+                self.assertEqual(visited[-1], 'https://example.com' + last)
+                self.assertEqual(len(visited), max_depth + 1)
+
+    def test_rate_limiter_spacing(self):
+        limiter = HostRateLimiter(0.5)
+        with mock.patch('scraper.crawl.time.monotonic', return_value=100.0):
+            waits = [limiter.reserve(url) for url in ['https://a.com/1', 'https://a.com/2', 'https://b.com/', 'https://a.com/3']]
+        self.assertEqual(waits, [0, 0.5, 0, 1.0])
+        # A slot in the past is not waited for
+        with mock.patch('scraper.crawl.time.monotonic', return_value=200.0):
+            self.assertEqual(limiter.reserve('https://a.com/4'), 0)
+
+    @override_settings(SCRAPER_CRAWL_DELAY=0)
+    def test_origin_after_redirects(self):
+        # localhost redirects to 127.0.0.1, whose page links absolutely
+        with FakeSite() as site:
+            site.files['/start'] = (f'<a href="{site.url("/page-1")}">1</a><a href="{site.url("/page-2")}">2</a>'.encode(), 'text/html')
+            site.redirects['/'] = site.url('/start')
+            start_url = f'http://localhost:{urlsplit(site.url()).port}/'
+            website_report = WebParser(User.objects.create_user('alice'), start_url).crawl(max_pages=3)
+        urls = PageReport.objects.filter(website=website_report).values_list('url', flat=True)
+        self.assertEqual(sorted(urls), [site.url('/page-1'), site.url('/page-2'), site.url('/start')])
+        self.assertEqual(website_report.url, start_url)
+
+
+class ParserBackendTests(TestCase):
+    def parse_all(self, content):
+        return {name: get_parser(name).parse(content, 'https://example.com/') for name in PARSERS}
+
+    def test_backends_agree(self):
+        inventories = self.parse_all(MIXED_PAGE.encode())
+        expected = asdict(inventories['stream'])
+        for name, inventory in inventories.items():
+            with self.subTest(parser=name):
+                self.assertEqual(asdict(inventory), expected)
+
+    def test_inline_markup_as_written(self):
+        inventory = get_parser('stream').parse(MIXED_PAGE.encode(), 'https://example.com/')
+        # The nested <svg> and the <style> in it are part of the icon only
+        self.assertEqual(inventory.svgs, [ICON, '<svg/>'])
+        self.assertEqual(inventory.inline_styles, ['<style media=print>a { color: red }</style>'])
+        self.assertEqual(inventory.scripts, ['/app.js?v=1&lang=en'])
+        self.assertEqual(len(inventory.inline_scripts), 2)
+        self.assertTrue(inventory.inline_scripts[0].startswith('<script type=module>'))
+
+        resources = classify_resources(inventory, 'https://example.com/')
+        sizes = [resource.inline_size for resource in resources if resource.category == IMAGE and resource.is_inline]
+        self.assertEqual(sizes, [len(ICON.encode()), len(b'<svg/>')])
+
+    def test_page_size_from_inline_markup(self):
+        # Everything on the page is inline, so its size is exactly the bytes
+        # of the inline markup, whichever backend parsed it
+        dot = 'data:image/gif;base64,R0lGODlhAQABAAAAACw='
+        script = '<script>window.ready = true</script>'
+        style = '<style>p { margin: 0 }</style>'
+        page = f'<html><head>{script}{style}</head><body>{ICON}<img src="{dot}"></body></html>'
+        expected = len(ICON) + len(dot) + len(script) + len(style)
+        user = User.objects.create_user('alice', password='secret')
+        with FakeSite(files={'/page': (page.encode(), 'text/html')}) as site:
+            for name in PARSERS:
+                with self.subTest(parser=name), override_settings(SCRAPER_HTML_PARSER=name):
+                    website_report = WebParser(user, site.url('/page')).scrape_page()
+                    self.assertAlmostEqual(website_report.page_size, expected / 1024)
+                    self.assertEqual(website_report.num_images, 2)
+            self.assertEqual(dict(site.hits), {'GET': len(PARSERS)})
+
+    def test_unclosed_svg(self):
+        for name, inventory in self.parse_all(b'<p>Icon: <svg><path d="M0 0"></p>').items():
+            with self.subTest(parser=name):
+                self.assertEqual(inventory.svgs, ['<svg><path d="M0 0"></p>'])
+
+
+class AsyncWebParserTests(TestCase):
+    # The event loop path against the same fake server
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+
+    async def scrape(self, site, path='/page-0', max_pages=1):
+        try:
+            web_parser = await AsyncWebParser.create(self.user, site.url(path))
+            return web_parser, await web_parser.acrawl(max_pages)
+        finally:
+            await close_async_client()
+
+    async def test_scrape_page(self):
+        with FakeSite({'images': 3, 'scripts': 2, 'videos': 1, 'links': 4}, asset_size=1000, video_size=5000) as site:
+            web_parser, website_report = await self.scrape(site)
+            hits = dict(site.hits)
+
+        page = await PageReport.objects.aget(website=website_report)
+        self.assertEqual(page.num_images, 3)
+        self.assertEqual(page.num_videos, 1)
+        self.assertEqual(website_report.pages, 4)
+        self.assertEqual(hits, {'GET': 1, 'HEAD': 6})
+        metrics = await AnalysisMetrics.objects.aget(website=website_report)
+        self.assertEqual(metrics.requests, 7)
+        self.assertGreater(metrics.bytes_fetched, 0)
+        self.assertGreater(metrics.parse_ms, 0)
+        self.assertGreater(metrics.queries, 0)
+
+    def test_no_sync_entry_points(self):
+        for name in ['parse_web_page', 'fetch_page', 'fetch_stylesheet', 'get_resource_size', 'scrape_page', 'crawl', 'build_reports']:
+            self.assertFalse(hasattr(AsyncWebParser, name), name)
+        for name in ['fetch', 'fetch_size', 'size_all', 'measure_all']:
+            self.assertFalse(hasattr(AsyncResourceSizer, name), name)
+
+    async def test_start_page_errors(self):
+        with FakeSite(files=UNAVAILABLE_PAGES) as site:
+            try:
+                with self.assertRaises(httpx.HTTPStatusError):
+                    await AsyncWebParser.create(self.user, site.url('/missing'))
+                with self.assertRaises(NotHTMLError):
+                    await AsyncWebParser.create(self.user, site.url('/file.zip'))
+            finally:
+                await close_async_client()
+
+    async def test_same_sizes_as_the_sync_parser(self):
+        options = {'images': 4, 'stylesheets': 1, 'videos': 1, 'svgs': 2}
+        with override_settings(SCRAPER_SIZE_CACHE=False), FakeSite(options, asset_size=1000, video_size=5000, missing_content_length=0.5) as site:
+            _, website_report = await self.scrape(site)
+            sync_report = await sync_to_async(lambda: WebParser(self.user, site.url('/page-0')).scrape_page())()
+        self.assertEqual(website_report.page_size, sync_report.page_size)
+        self.assertEqual(website_report.carbon_footprint_score, sync_report.carbon_footprint_score)
+
+    async def test_missing_content_length(self):
+        options = {'images': 2, 'videos': 1}
+        with FakeSite(options, asset_size=1000, video_size=5000, missing_content_length=1, honor_range=False) as site:
+            _, streamed = await self.scrape(site)
+            self.assertEqual(site.hits['range'], 3)
+        self.assertEqual(streamed.page_size, (2 * 1000 + 5000) / 1024)
+
+    @override_settings(SCRAPER_CRAWL_DELAY=0)
+    async def test_crawl(self):
+        with FakeSite({'images': 1, 'links': 4}, asset_size=1000) as site:
+            _, website_report = await self.scrape(site, max_pages=3)
+        self.assertEqual(website_report.pages, 3)
+        self.assertEqual(await PageReport.objects.filter(website=website_report).acount(), 3)
+
+    async def test_concurrent_analyses_keep_their_metrics(self):
+        async def analyze(site):
+            web_parser = await AsyncWebParser.create(self.user, site.url('/page-0'))
+            await web_parser.ascrape_page()
+            return web_parser.metrics.as_fields()
+
+        with FakeSite({'images': 2}, latency=0.01) as small, FakeSite({'images': 9}, latency=0.01) as large:
+            try:
+                fields = await asyncio.gather(analyze(small), analyze(large))
+            finally:
+                await close_async_client()
+        self.assertEqual([each['requests'] for each in fields], [3, 10])
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AnalyzeAsyncViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+
+    async def test_analyze(self):
+        await self.async_client.aforce_login(self.user)
+        with FakeSite({'images': 1}) as site:
+            try:
+                response = await self.async_client.post('/analyze-async/', {'url': site.url('/page-0'), 'max_pages': '1'})
+            finally:
+                await close_async_client()
+        website_report = await PageReport.objects.select_related('website').aget(website__user=self.user)
+        self.assertRedirects(response, f'/reports/show-website-report/{website_report.website_id}/', fetch_redirect_response=False)
+
+    async def test_errors(self):
+        response = await self.async_client.get('/analyze-async/')
+        self.assertEqual(response.status_code, 302)
+
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.post('/analyze-async/', {'url': 'not a url'})
+        self.assertContains(response, 'Invalid URL')
+        with FakeSite() as site:
+            url = site.url('/page-0')
+        try:
+            response = await self.async_client.post('/analyze-async/', {'url': url})
+        finally:
+            await close_async_client()
+        self.assertContains(response, 'Could not fetch')
+        with FakeSite(files=UNAVAILABLE_PAGES) as site:
+            try:
+                response = await self.async_client.post('/analyze-async/', {'url': site.url('/file.zip')})
+            finally:
+                await close_async_client()
+        self.assertContains(response, 'is not an HTML page')
+
+
+STYLED_PAGE = (
+    '<html><head><link rel="stylesheet" href="/css/main.css">'
+    '<style>@import "/css/extra.css"; .hero { background: url(/img/hero.png) }</style></head>'
+    '<body><img src="/img/a.png"></body></html>'
+)
+STYLESHEETS = {
+    # base.css imports main.css back
+    '/css/main.css': "@import url('/css/base.css'); @font-face { font-family: x; src: url(/fonts/x.woff2) format('woff2') }"
+                     " .a { background-image: url('../img/bg.png') }",
+    '/css/base.css': "@import 'main.css'; @media screen { .b { background: url(/img/bg.png) no-repeat } }",
+    '/css/extra.css': '.c { list-style-image: url(/img/dot.gif) }',
+}
+
+
+class StylesheetStageTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        cache.clear()
+        css_stats.reset()
+
+    def styled_site(self, **files):
+        files = dict({'/page-0': STYLED_PAGE, **STYLESHEETS}, **files)
+        return FakeSite(asset_size=1000, files={
+            path: (body.encode(), 'text/css' if path.endswith('.css') else 'text/html') for path, body in files.items()
+        })
+
+    def test_parse_stylesheet(self):
+        parsed = parse_stylesheet(
+            "@import url('a.css'); @font-face { src: url(f.woff2), url('f.woff') }"
+            " @font-face { src: local(g), url(g.woff2) format('woff2'), url(g.ttf) }"
+            " body { background: url(b.png) } @media print { .x { background-image: url(\"c.png\") } }"
+            " @supports (display: grid) { .y { mask: url(d.svg) } }"
+        )
+        self.assertEqual(parsed.imports, ['a.css'])
+        self.assertEqual(parsed.fonts, ['f.woff2', 'g.woff2'])
+        self.assertEqual(parsed.images, ['b.png', 'c.png', 'd.svg'])
+
+    def test_stylesheets_imports_and_fonts(self):
+        with self.styled_site() as site:
+            web_parser = WebParser(self.user, site.url('/page-0'))
+            website_report = web_parser.scrape_page()
+            hits = dict(site.hits)
+            inventory = web_parser.inventory
+            self.assertEqual(inventory.background_images, [site.url(path) for path in ['/img/hero.png', '/img/bg.png', '/img/dot.gif']])
+            self.assertEqual(inventory.fonts, [site.url('/fonts/x.woff2')])
+            self.assertEqual(inventory.imported_stylesheets, [site.url('/css/extra.css'), site.url('/css/base.css')])
+
+        # Each stylesheet is read once, the images and font only sized
+        self.assertEqual(hits, {'GET': 4, 'HEAD': 5})
+        self.assertEqual(web_parser.metrics.as_fields()['requests'], 9)
+        self.assertEqual(website_report.num_images, 4)
+        inline_style = STYLED_PAGE[STYLED_PAGE.index('<style>'):STYLED_PAGE.index('</head>')]
+        expected = 5 * 1000 + sum(len(body) for body in STYLESHEETS.values()) + len(inline_style)
+        self.assertAlmostEqual(website_report.page_size, expected / 1024)
+
+    def test_data_urls_are_not_fetched(self):
+        dot = 'data:image/gif;base64,R0lGODlhAQABAAAAACw='
+        page = f'<html><head><link rel="stylesheet" href="/a.css"><style>.x {{ background: url({dot}) }}</style></head></html>'
+        stylesheet = f".y {{ background: url('{dot}') }} @font-face {{ src: url(data:font/woff2;base64,d09GMgABAAAAAA==) }}"
+        with self.styled_site(**{'/page-0': page, '/a.css': stylesheet}) as site:
+            web_parser = WebParser(self.user, site.url('/page-0'))
+            website_report = web_parser.scrape_page()
+            hits = dict(site.hits)
+
+        self.assertEqual(web_parser.inventory.background_images, [])
+        self.assertEqual(web_parser.inventory.fonts, [])
+        self.assertEqual(hits, {'GET': 2})
+        # The embedded images and font count once, in the CSS they are part of
+        inline_style = page[page.index('<style>'):page.index('</head>')]
+        self.assertAlmostEqual(website_report.page_size, (len(stylesheet) + len(inline_style)) / 1024)
+        self.assertEqual(website_report.num_images, 0)
+
+    async def test_async_parser_reads_the_same_css(self):
+        with self.styled_site() as site:
+            try:
+                web_parser = await AsyncWebParser.create(self.user, site.url('/page-0'))
+                website_report = await web_parser.ascrape_page()
+            finally:
+                await close_async_client()
+            hits = dict(site.hits)
+        self.assertEqual(hits, {'GET': 4, 'HEAD': 5})
+        self.assertEqual(website_report.num_images, 4)
+        self.assertEqual(len(web_parser.inventory.fonts), 1)
+
+    def test_shared_stylesheets_are_parsed_once(self):
+        framework = '.btn { background: url(/img/btn.png) }' + ' ' * MIN_CACHED_LENGTH
+        for _ in range(2):
+            # A new server each time, so the same CSS comes from another URL
+            with self.styled_site(**{'/css/extra.css': framework}) as site:
+                web_parser = WebParser(self.user, site.url('/page-0'))
+                web_parser.scrape_page()
+                self.assertIn(site.url('/img/btn.png'), web_parser.inventory.background_images)
+        self.assertEqual(css_stats.as_dict()['misses'], 1)
+        self.assertEqual(css_stats.as_dict()['hits'], 1)
+
+    def test_crawl_limits(self):
+        inventory = PageInventory(stylesheets=['a.css', 'b.css'])
+        crawl = StylesheetCrawl('https://example.com/', inventory, max_depth=0, max_stylesheets=1)
+        self.assertEqual(crawl.next_urls(), ['https://example.com/a.css'])
+        crawl.add('https://example.com/a.css', parse_stylesheet("@import 'c.css';"), size=100)
+        self.assertEqual(crawl.next_urls(), [])
+        crawl.apply(inventory)
+        # Imported stylesheets are still sized when the limits stop the crawl
+        self.assertEqual(inventory.imported_stylesheets, ['https://example.com/c.css'])
+        self.assertEqual(crawl.sizes, {'https://example.com/a.css': 100})
+
+
+@override_settings(SCRAPER_SIZE_CACHE=False)
+class ResourceSizerTests(TestCase):
+    def assets(self, site, count=6):
+        return [site.url(f'/assets/image-{i}.png') for i in range(count)]
+
+    def test_per_host_limit(self):
+        sizer = ResourceSizer(max_workers=16, per_host_limit=2)
+        with FakeSite(asset_size=1000, latency=0.05) as site, FakeSite(asset_size=1000, latency=0.05) as other:
+            sizes = sizer.size_all(self.assets(site, 8) + self.assets(other, 8))
+            self.assertEqual(site.max_in_flight, 2)
+            self.assertEqual(other.max_in_flight, 2)
+        self.assertEqual(set(sizes.values()), {1000})
+
+    def test_fallbacks(self):
+        # HEAD when it gives a length, else the total of a first byte Range
+        # request, else the streamed body
+        cases = [
+            ({}, 'head', {'HEAD': 6}),
+            ({'missing_content_length': 1}, 'range', {'HEAD': 6, 'range': 6}),
+            ({'missing_content_length': 1, 'honor_range': False}, 'stream', {'HEAD': 6, 'range': 6}),
+        ]
+        for options, method, hits in cases:
+            with self.subTest(method=method), FakeSite(asset_size=1000, **options) as site:
+                results = ResourceSizer().measure_all(self.assets(site))
+                self.assertEqual({(result.size, result.method) for result in results.values()}, {(1000, method)})
+                self.assertEqual(dict(site.hits), hits)
+
+    @override_settings(SCRAPER_HTTP_BACKOFF_FACTOR=0)
+    def test_error_statuses_are_not_cached(self):
+        reset_session()  # with the settings above
+        self.addCleanup(reset_session)
+        files = {'/gone.png': (b'', 'text/html', 404), '/busy.png': (b'', 'text/html', 503)}
+        for honor_range in [True, False]:
+            with self.subTest(honor_range=honor_range), FakeSite(files=files, honor_range=honor_range) as site:
+                urls = [site.url('/gone.png'), site.url('/busy.png')]
+                results = ResourceSizer(cache=SizeCache()).measure_all(urls)
+                self.assertEqual([(results[url].ok, results[url].size) for url in urls], [(False, 0), (False, 0)])
+                self.assertFalse(CachedResourceSize.objects.exists())
+
+    def test_unreachable(self):
+        with FakeSite() as site:
+            url = site.url('/assets/image.png')
+        result = ResourceSizer(timeout=1).measure_all([url])[url]
+        self.assertFalse(result.ok)
+        self.assertEqual(result.size, 0)
+
+
+@override_settings(SCRAPER_SIZE_CACHE=False)
+class ConnectionReuseTests(TestCase):
+    def setUp(self):
+        # A session of its own, so no connection is left from other tests
+        reset_session()
+        self.addCleanup(reset_session)
+        connection_stats.reset()
+
+    def test_keep_alive_connections_are_reused(self):
+        with FakeSite(asset_size=1000) as site:
+            urls = [site.url(f'/assets/image-{i}.png') for i in range(6)]
+            ResourceSizer(per_host_limit=1).size_all(urls)
+            self.assertEqual(connection_stats.as_dict(), {'requests': 6, 'connections_opened': 1, 'connections_reused': 5})
+            # The next analysis starts on the same connection
+            WebParser(User.objects.create_user('alice'), site.url('/page-0'))
+        self.assertEqual(connection_stats.as_dict(), {'requests': 7, 'connections_opened': 1, 'connections_reused': 6})
+
+    def test_connections_without_keep_alive(self):
+        # Bodies without a length end with the connection
+        with FakeSite(asset_size=1000, missing_content_length=1, honor_range=False) as site:
+            ResourceSizer(per_host_limit=1).size_all([site.url(f'/assets/image-{i}.png') for i in range(3)])
+        stats = connection_stats.as_dict()
+        self.assertEqual(stats['requests'], 6)
+        self.assertEqual(stats['connections_opened'], 3)
+
+    def test_retry_after_is_capped(self):
+        retry = build_retry().new(total=1)  # as after a first retry
+        for header, wait in [('3600', 5), ('2', 2)]:
+            with self.subTest(header=header):
+                self.assertEqual(retry.get_retry_after(HTTPResponse(status=503, headers={'Retry-After': header})), wait)
+        self.assertIsNone(retry.get_retry_after(HTTPResponse(status=503)))
+
+    def test_stats_reset(self):
+        connection_stats.record_request()
+        connection_stats.record_connection()
+        connection_stats.reset()
+        self.assertEqual(connection_stats.as_dict(), {'requests': 0, 'connections_opened': 0, 'connections_reused': 0})
+
+
+class AnalysisRecorderTests(TestCase):
+    BODY = (b'x' * 5000, 'application/octet-stream')
+
+    def test_streamed_bytes_are_counted_on_close(self):
+        recorder = AnalysisRecorder()
+        session = RecordingSession(get_session(), recorder)
+        with FakeSite(files={'/body': self.BODY}) as site:
+            with session.get(site.url('/body'), stream=True) as response:
+                response.raw.read(1000)
+                self.assertEqual(recorder.as_fields()['bytes_fetched'], 0)
+        # Counted, and the response is not kept for it
+        self.assertEqual(recorder.requests, 1)
+        self.assertEqual(recorder.bytes_fetched, 1000)
+        response_ref = weakref.ref(response)
+        del response
+        self.assertIsNone(response_ref())
+
+    async def test_async_bytes_are_counted_on_close(self):
+        recorder = AnalysisRecorder()
+        try:
+            with FakeSite(files={'/body': self.BODY}) as site, recording(recorder):
+                async with get_async_client().stream('GET', site.url('/body')) as response:
+                    await response.aread()
+                await get_async_client().get(site.url('/body'))
+        finally:
+            await close_async_client()
+        self.assertEqual(recorder.requests, 2)
+        self.assertEqual(recorder.bytes_fetched, 10000)
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers):
+        self.status_code = status_code
+        self.headers = headers
+
+
+class FakeSession:
+    # Answers HEAD requests for {url: (size, etag)}, 304 when the ETag matches
+    def __init__(self, assets):
+        self.assets = assets
+        self.requests = []
+
+    def head(self, url, headers=None, **kwargs):
+        self.requests.append((url, headers or {}))
+        if url not in self.assets:
+            raise requests.ConnectionError(url)
+        size, etag = self.assets[url]
+        if (headers or {}).get('If-None-Match') == etag:
+            return FakeResponse(304, {'ETag': etag})
+        return FakeResponse(200, {'Content-Length': str(size), 'ETag': etag})
+
+
+class SizeCacheTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        clock = mock.patch('scraper.cache.timezone.now', lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+        cache_stats.reset()
+        self.session = FakeSession({
+            'https://example.com/a.png': (100, '"a1"'),
+            'https://example.com/b.png': (200, '"b1"'),
+            'https://example.com/c.png': (300, '"c1"'),
+        })
+
+    def sizer(self, **options):
+        return ResourceSizer(session=self.session, cache=SizeCache(**dict({'ttl': 60}, **options)))
+
+    def measure(self, *urls, **options):
+        self.session.requests = []
+        return self.sizer(**options).measure_all(urls)
+
+    def test_fresh_entries_need_no_requests(self):
+        self.assertEqual(self.measure('https://example.com/a.png')['https://example.com/a.png'].method, 'head')
+        self.now += timedelta(seconds=59)
+        result = self.measure('https://example.com/a.png')['https://example.com/a.png']
+        self.assertEqual((result.size, result.method), (100, 'cache'))
+        self.assertEqual(self.session.requests, [])
+        self.assertEqual(CachedResourceSize.objects.get().hits, 1)
+
+    def test_expired_entries_are_revalidated(self):
+        self.measure('https://example.com/a.png')
+        self.now += timedelta(seconds=61)
+        result = self.measure('https://example.com/a.png')['https://example.com/a.png']
+        self.assertTrue(result.not_modified)
+        self.assertEqual(result.size, 100)
+        self.assertEqual(self.session.requests, [('https://example.com/a.png', {'If-None-Match': '"a1"'})])
+        # The 304 starts a new TTL
+        self.assertEqual(CachedResourceSize.objects.get().fetched_at, self.now)
+        self.now += timedelta(seconds=59)
+        self.assertEqual(self.measure('https://example.com/a.png')['https://example.com/a.png'].method, 'cache')
+
+    def test_changed_resources_are_sized_again(self):
+        self.measure('https://example.com/a.png')
+        self.session.assets['https://example.com/a.png'] = (150, '"a2"')
+        self.now += timedelta(seconds=61)
+        result = self.measure('https://example.com/a.png')['https://example.com/a.png']
+        self.assertFalse(result.not_modified)
+        entry = CachedResourceSize.objects.get()
+        self.assertEqual((entry.size, entry.etag), (150, '"a2"'))
+
+    def test_least_recently_used_are_evicted(self):
+        self.measure('https://example.com/a.png', 'https://example.com/b.png', max_entries=2)
+        self.now += timedelta(seconds=1)
+        self.measure('https://example.com/a.png', max_entries=2)  # a is used again, b is not
+        self.now += timedelta(seconds=1)
+        self.measure('https://example.com/c.png', max_entries=2)
+        urls = set(CachedResourceSize.objects.values_list('url', flat=True))
+        self.assertEqual(urls, {'https://example.com/a.png', 'https://example.com/c.png'})
+        self.assertEqual(cache_stats.as_dict()['evicted'], 1)
+
+    def test_failed_lookups_are_not_cached(self):
+        self.measure('https://example.com/missing.png')
+        self.assertFalse(CachedResourceSize.objects.exists())
+
+    def test_stats(self):
+        self.measure('https://example.com/a.png', 'https://example.com/b.png')
+        self.now += timedelta(seconds=30)
+        self.measure('https://example.com/a.png')
+        self.now += timedelta(seconds=60)
+        self.measure('https://example.com/b.png')
+        self.assertEqual(
+            cache_stats.as_dict(),
+            {'hits': 1, 'misses': 2, 'revalidated': 1, 'evicted': 0, 'hit_ratio': 0.5},
+        )
+        cache_stats.reset()
+        self.assertEqual(cache_stats.as_dict()['hit_ratio'], 0.0)
+
+
+class AnalysisJobTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+
+    def stale(self, job, **fields):
+        AnalysisJob.objects.filter(id=job.id).update(
+            status=AnalysisJob.RUNNING,
+            started_at=timezone.now() - timedelta(hours=1),
+            **fields,
+        )
+
+    def test_claim_oldest_first(self):
+        first = AnalysisJob.objects.create(user=self.user, url='https://example.com/1')
+        second = AnalysisJob.objects.create(user=self.user, url='https://example.com/2')
+        job = claim_next_job()
+        self.assertEqual(job, first)
+        self.assertEqual(job.status, AnalysisJob.RUNNING)
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNotNone(job.started_at)
+        self.assertEqual(claim_next_job(), second)
+        self.assertIsNone(claim_next_job())
+
+    @override_settings(SCRAPER_JOB_LEASE_TIMEOUT=60, SCRAPER_JOB_MAX_ATTEMPTS=2)
+    def test_stale_jobs_are_requeued_then_failed(self):
+        job = AnalysisJob.objects.create(user=self.user, url='https://example.com/')
+        self.stale(job, attempts=1)
+        # The worker died: another one takes the job over
+        self.assertEqual(claim_next_job(), job)
+        job.refresh_from_db()
+        self.assertEqual(job.attempts, 2)
+
+        self.stale(job)
+        self.assertIsNone(claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual(job.status, AnalysisJob.FAILED)
+        self.assertTrue(job.error)
+
+    def test_run_job_failure(self):
+        # requests has no adapter for ftp://, so the analysis fails at once
+        AnalysisJob.objects.create(user=self.user, url='ftp://example.com/')
+        with self.assertLogs('scraper.jobs', 'ERROR'):
+            run_job(claim_next_job())
+        job = AnalysisJob.objects.get()
+        self.assertEqual(job.status, AnalysisJob.FAILED)
+        self.assertIn('InvalidSchema', job.error)
+        self.assertIsNotNone(job.finished_at)
+        self.assertIsNone(job.website)
+
+    def test_run_job_after_losing_the_lease(self):
+        AnalysisJob.objects.create(user=self.user, url='ftp://example.com/')
+        job = claim_next_job()
+        # Released and claimed again by another worker meanwhile
+        AnalysisJob.objects.filter(id=job.id).update(started_at=timezone.now() + timedelta(seconds=1))
+        with self.assertLogs('scraper.jobs', 'WARNING') as logs:
+            run_job(job)
+        self.assertIn('lease expired', logs.output[-1])
+        self.assertEqual(AnalysisJob.objects.get().status, AnalysisJob.RUNNING)
+
+    @override_settings(SCRAPER_JOB_LEASE_TIMEOUT=60)
+    def test_listing_ignores_stale_jobs(self):
+        job = AnalysisJob.objects.create(user=self.user, url='https://example.com/')
+        self.client.force_login(self.user)
+        self.assertTrue(self.client.get(reverse('list_website_reports')).context['has_active_jobs'])
+        self.stale(job)
+        self.assertFalse(self.client.get(reverse('list_website_reports')).context['has_active_jobs'])
+
+    def test_analyze_view_enqueues(self):
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(reverse('analyze'), {'url': 'example.com', 'max_pages': '3'})
+        self.assertRedirects(response, reverse('list_website_reports'), fetch_redirect_response=False)
+        job = AnalysisJob.objects.get()
+        self.assertEqual((job.url, job.max_pages, job.status), ('https://example.com', 3, AnalysisJob.QUEUED))
+        # The in-process workers are started once the job is committed
+        self.assertEqual(len(callbacks), 1)
+
+    @override_settings(SCRAPER_JOBS_IN_PROCESS=False)
+    def test_analyze_view_leaves_jobs_to_the_workers(self):
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(reverse('analyze'), {'url': 'https://example.com/'})
+        self.assertEqual(AnalysisJob.objects.get().max_pages, 1)
+        self.assertEqual(callbacks, [])
+
+    def test_invalid_url_is_not_queued(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('analyze'), {'url': 'not a url'})
+        self.assertContains(response, 'Invalid URL')
+        self.assertFalse(AnalysisJob.objects.exists())
+
+
+@override_settings(SCRAPER_SIZE_CACHE=False)
+class BulkAnalysisTests(TestCase):
+    # The bulk paths save with bulk_create, which sends no signals, so the
+    # rollups, website summaries and chart data version are kept up to date
+    # by save_in_bulk itself
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('alice', password='secret')
+
+    def assert_consistent(self):
+        rollups = lambda: {
+            (rollup.website_url, rollup.count, round(rollup.carbon_footprint_score, 9))
+            for rollup in DailyCarbonRollup.objects.filter(user=self.user)
+        }
+        incremental = rollups()
+        self.assertTrue(incremental)
+        rebuild_rollups(self.user)
+        self.assertEqual(rollups(), incremental)
+
+        websites = WebsiteReport.objects.filter(user=self.user)
+        saved = {website.id: website_stats(website) for website in websites}
+        refresh_summaries(list(saved))
+        for website in websites:
+            for field, value in website_stats(website).items():
+                self.assertAlmostEqual(saved[website.id][field], value, msg=field)
+
+    def test_save_in_bulk(self):
+        version = data_version(self.user.id)
+        with FakeSite({'images': 2, 'links': 2}, asset_size=1000) as site:
+            analyses = []
+            for page_path, max_pages in [('/page-0', 1), ('/page-1', 3)]:
+                web_parser = WebParser(self.user, site.url(page_path))
+                analyses.append((*web_parser.build_reports(max_pages, 1), web_parser.metrics))
+        with self.captureOnCommitCallbacks(execute=True):
+            save_in_bulk(analyses)
+
+        self.assertEqual(WebsiteReport.objects.count(), 2)
+        # /page-1 links to itself and /page-0
+        self.assertEqual(PageReport.objects.count(), 3)
+        self.assertEqual(CarbonFootprintReport.objects.count(), 3)
+        self.assertEqual(AnalysisMetrics.objects.count(), 2)
+        self.assertGreater(AnalysisMetrics.objects.first().save_ms, 0)
+        self.assertNotEqual(data_version(self.user.id), version)
+        self.assert_consistent()
+
+    def test_analyze_urls_command(self):
+        out = StringIO()
+        with FakeSite({'images': 1}, asset_size=1000) as site:
+            urls = [site.url('/page-0'), 'not a url', site.url('/page-1'), site.url('/page-2')]
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command('analyze_urls', *urls, user='alice', workers=2, batch_size=2, json=True, stdout=out)
+        results = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(sorted(result['status'] for result in results), ['error', 'ok', 'ok', 'ok'])
+        self.assertEqual([result['completed'] for result in results if result['status'] == 'error'], [1])
+        reports = {result['website_report'] for result in results if result['status'] == 'ok'}
+        self.assertEqual(set(WebsiteReport.objects.values_list('id', flat=True)), reports)
+        self.assert_consistent()
+
+    def test_analyze_urls_command_errors(self):
+        with self.assertRaisesMessage(CommandError, "User 'bob' does not exist."):
+            call_command('analyze_urls', 'https://example.com', user='bob')
+        with self.assertRaisesMessage(CommandError, 'No URLs given.'):
+            call_command('analyze_urls', user='alice')
+
+    def test_batch_endpoint(self):
+        self.client.force_login(self.user)
+        version = data_version(self.user.id)
+        with FakeSite({'images': 1}, asset_size=1000) as site:
+            body = f"# analyzed together\n{site.url('/page-0')}\n\n{site.url('/page-1')}\n"
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('analyze_batch') + '?workers=2', body, content_type='text/plain')
+                lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        results = [json.loads(line) for line in lines]
+        self.assertEqual(sorted(result['url'] for result in results), [site.url('/page-0'), site.url('/page-1')])
+        self.assertEqual({result['status'] for result in results}, {'ok'})
+        self.assertNotEqual(data_version(self.user.id), version)
+        self.assert_consistent()
+
+    def test_batch_endpoint_rejects_bad_input(self):
+        url = reverse('analyze_batch')
+        self.assertEqual(self.client.post(url, 'https://example.com', content_type='text/plain').status_code, 401)
+        self.client.force_login(self.user)
+        for body, content_type, error in [
+            ('', 'text/plain', 'No URLs given'),
+            ('{', 'application/json', 'Invalid JSON'),
+            ('{"urls": "https://example.com"}', 'application/json', '"urls" must be a list of strings'),
+        ]:
+            with self.subTest(error=error):
+                response = self.client.post(url, body, content_type=content_type)
+                self.assertEqual((response.status_code, response.json()['error']), (400, error))
+
+
+class BenchmarkScraperCommandTests(TestCase):
+    def test_results_and_baseline(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            options = dict(pages=2, warmup=0, images=2, scripts=1, stylesheets=1, svgs=1, videos=0, paragraphs=1)
+            call_command('benchmark_scraper', output=output, stdout=StringIO(), **options)
+            with open(output) as f:
+                results = json.load(f)
+            self.assertEqual(results['config']['pages'], 2)
+            self.assertEqual(results['requests_per_page'], 5)
+            # The stylesheets are read for the CSS stage, the other assets only sized
+            self.assertEqual(results['server_hits'], {'GET': 4, 'HEAD': 6})
+            self.assertEqual(results['connections']['requests'], 10)
+            self.assertEqual(set(results['size_cache']), {'hits', 'misses', 'revalidated', 'evicted', 'hit_ratio'})
+
+            out = StringIO()
+            call_command('benchmark_scraper', baseline=output, stdout=out, **options)
+            self.assertIn('Compared with the baseline', out.getvalue())
+            self.assertIn('connections  ', out.getvalue())
+            self.assertNotIn('other options', out.getvalue())
+        # The benchmark's reports were rolled back
+        self.assertFalse(User.objects.filter(username='benchmark-scraper').exists())
+
+    def test_concurrency(self):
+        out = StringIO()
+        options = dict(pages=4, warmup=0, images=2, scripts=0, stylesheets=0, svgs=0, videos=0, links=1, paragraphs=1)
+        call_command('benchmark_scraper', concurrency=4, sites=2, stdout=out, **options)
+        self.assertIn('4 at a time on the event loop', out.getvalue())
+        self.assertIn('server  GET 4  HEAD 8', out.getvalue())
@@ -1,6 +1,12 @@
+from django.conf import settings
 from django.urls import path 
 from . import views
 
+# Under ASGI the async view runs analyses on the event loop instead of
+# queueing them for the job threads
+analyze = views.analyze_async if getattr(settings, 'SCRAPER_ASYNC_ANALYZE', False) else views.analyze
+
 urlpatterns = [
-    path('', views.analyze, name='analyze'),
-]
\ No newline at end of file
+    path('', analyze, name='analyze'),
+    path('batch/', views.analyze_batch, name='analyze_batch'),
+]
@@ -1,56 +1,57 @@
+import json
+import httpx
 import requests
-import cssutils
-import re 
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect
-from bs4 import BeautifulSoup
+from django.views.decorators.http import require_POST
 from urllib.parse import urljoin
 from reports.models import WebsiteReport, PageReport, ImageReport, VideoReport, CarbonFootprintReport
+from reports.carbon import get_carbon_model
+from reports.stats import summarize
 from django.core.exceptions import ValidationError
 from django.core.validators import URLValidator
+from .bulk import analyze_urls, read_urls, save_in_bulk
+from .client import async_host_slots, get_session
+from .crawl import Crawler
+from .css import aanalyze_stylesheets, analyze_stylesheets
+from .instrumentation import AnalysisRecorder, RecordingSession, recording, wire_bytes
+from .jobs import enqueue_analysis
+from .parsers import get_parser
+from .resources import CSS, FONT, IMAGE, JS, VIDEO, classify_resources
+from .sizing import CHUNK_SIZE, AsyncResourceSizer, ResourceSizer
+
+class BaseWebParser:
+    """What WebParser and AsyncWebParser share: turning the pages' inventories
+    and the sizes in self.size_memo into reports. The subclasses fetch and
+    size, with requests on threads or with httpx on the event loop.
+    """
 
-class WebParser:
     def __init__(self, user, url):
         self.user = user
         self.url = url
-        self.soup = self.parse_web_page()
-    
-    def parse_web_page(self):
-        response = requests.get(self.url)
-        soup = BeautifulSoup(response.content, 'html.parser')
-        return soup
+        # The start page's URL after redirects, which its links are relative
+        # to and the crawl stays on the origin of
+        self.page_url = url
+        # Timings, requests and queries of this analysis, saved with the report
+        self.metrics = AnalysisRecorder()
+        # Sizes in bytes by absolute URL, so a resource is only sized once per analysis
+        self.size_memo = {}
+        # Fetched stylesheets by URL, for stylesheets shared by crawled pages
+        self.stylesheet_memo = {}
+        self.inventory = None
 
+    # (energy in kilowatt-hours, carbon footprint) of transferring size_in_kb
     def calculate_carbon_footprint(self, size_in_kb):
-        CARBON_INTENSITY = 441.3  # estimated grams of CO2e per kilowatt-hour
-        GIGABYTE_TO_BYTES = 1073741824
-        AVERAGE_KILO_WATT_HOUR_PER_GB = 1.805
+        carbon_model = get_carbon_model()
+        return float(carbon_model.energy(size_in_kb)), float(carbon_model.carbon_footprint(size_in_kb))
 
-        size_in_bytes = size_in_kb * 1024  # Convert size from KB to bytes
-        energy_usage = size_in_bytes * (AVERAGE_KILO_WATT_HOUR_PER_GB / GIGABYTE_TO_BYTES)  
-        
-        # in kilowatt-hours
-        carbon_footprint = energy_usage * CARBON_INTENSITY  # in kilograms of CO2e
-        return energy_usage, carbon_footprint
-    
     # Get background images from CSS
     def get_background_images(self):
-        css = cssutils.parseString(self.soup.text)
-        background_images = []
-        for rule in css:
-            if rule.type == rule.STYLE_RULE:
-                style = rule.style
-                if 'background-image' in style:
-                    bg_img = style['background-image']
-                    url_match = re.search(r'url\((.*?)\)', bg_img)
-                    if url_match:
-                        background_images.append(url_match.group(1))
-        return background_images
+        return self.inventory.background_images
     
-    def get_resource_size(self, resource_url, unit='KB'):
-        absolute_url = urljoin(self.url, resource_url)
-        response = requests.head(absolute_url)
-        content_length = response.headers.get('Content-Length', 0)
-        size_in_bytes = int(content_length)
-
+    def convert_size(self, size_in_bytes, unit='KB'):
         if unit.upper() == 'MB':
             size_in_mb = size_in_bytes / (1024 * 1024)
             return size_in_mb
@@ -60,142 +61,440 @@ class WebParser:
         else:
             raise ValueError("Invalid unit. Supported units are 'KB' and 'MB'.")
 
+    # {resource_url: size} of resources already in self.size_memo
+    def memoized_sizes(self, resource_urls, unit='KB'):
+        return {
+            resource_url: self.convert_size(self.size_memo[urljoin(self.page_url, resource_url)], unit)
+            for resource_url in resource_urls
+        }
+
     def calculate_score(self, carbon_footprint, max_carbon_footprint=100):
         score = max(0, 100 * (1 - carbon_footprint / max_carbon_footprint))
         return score
         
-    def scrape_page(self):
-        page_size = 0.0
-        num_images = 0
+    # Size classified resources: inline ones from their bytes in the HTML,
+    # external ones from self.size_memo, which the subclasses fill in one
+    # concurrent wave. Returns {category: total size in KB} and the number of videos found.
+    def size_resources(self, resources):
+        sizes = self.memoized_sizes([resource.url for resource in resources if not resource.is_inline])
+        totals = {IMAGE: 0.0, VIDEO: 0.0, CSS: 0.0, JS: 0.0, FONT: 0.0}
         num_videos = 0
-        total_js_size = 0
-        total_css_size = 0
-        total_image_size = 0.0
-        total_video_size = 0.0
+        for resource in resources:
+            if resource.is_inline:
+                size = self.convert_size(resource.inline_size)
+            else:
+                size = sizes[resource.url]
+            if resource.category == VIDEO:
+                if size <= 0:
+                    continue
+                num_videos += 1
+            totals[resource.category] += size
+        return totals, num_videos
 
-        website_report = WebsiteReport.objects.create(
-            user = self.user,
-            url = self.url,
-            pages = len(self.soup.find_all('a')),
-        )
+    # The reports of the pages, once their resources are in self.size_memo
+    def assemble_reports(self, pages, num_pages, resources):
+        with self.metrics.phase('build'):
+            website_report = WebsiteReport(
+                user = self.user,
+                url = self.url,
+                pages = num_pages,
+            )
+            page_reports = [
+                self.build_page_reports(website_report, page_url, inventory, resources[page_url])
+                for page_url, inventory in pages
+            ]
+            return summarize(website_report, page_reports), page_reports
 
-        num_images += len(self.soup.find_all('img')) + len(self.get_background_images()) + len(self.soup.find_all('svg'))
-
-        for img_tag in self.soup.find_all('img'):
-            img_url = img_tag.get('src', '')
-            img_size = self.get_resource_size(img_url)
-            total_image_size += img_size
-            page_size += img_size
-
-        for img_url in self.get_background_images():
-            img_size = self.get_resource_size(img_url)
-            total_image_size += img_size
-            page_size += img_size
-
-        for svg_tag in self.soup.find_all('svg'):
-            svg_size = self.get_resource_size(str(svg_tag))
-            total_image_size += svg_size
-            page_size += svg_size
-
-        for video_tag in self.soup.find_all('video'):
-            video_url = video_tag.get('src', '')
-            video_size = self.get_resource_size(video_url)
-            if video_size > 0:
-                total_video_size += video_size
-                page_size += video_size
-                num_videos += 1
-        
-        # count youtube video embeds
-        for iframe_tag in self.soup.find_all('iframe'):
-            iframe_src = iframe_tag.get('src', '')
-            if 'youtube.com' in iframe_src:
-                video_size = self.get_resource_size(iframe_src)
-                if video_size > 0:
-                    total_video_size += video_size
-                    page_size += video_size
-                    num_videos += 1
-        
-        # Calculate CSS size
-        for link_tag in self.soup.find_all('link', rel='stylesheet'):
-            css_url = link_tag.get('href', '')
-            css_size = self.get_resource_size(css_url)
-            total_css_size += css_size
-            page_size += css_size
-
-        # Calculate JS size
-        for script_tag in self.soup.find_all('script'):
-            js_url = script_tag.get('src', '')
-            if js_url:  # External JS file
-                js_size = self.get_resource_size(js_url)
-                total_js_size += js_size
-                page_size += js_size
-            else:  # Inline JS
-                js_size = self.get_resource_size(str(script_tag))
-                total_js_size += js_size
-                page_size += js_size
-
-        page_report = PageReport.objects.create(
+    def save_reports(self, website_report, page_reports):
+        # One INSERT per report table however many pages were crawled
+        save_in_bulk([(website_report, page_reports, self.metrics)])
+        return website_report
+
+    def build_page_reports(self, website_report, page_url, inventory, resources=None):
+        if resources is None:
+            resources = classify_resources(inventory, page_url)
+        num_images = inventory.num_images
+        totals, num_videos = self.size_resources(resources)
+        total_image_size = totals[IMAGE]
+        total_video_size = totals[VIDEO]
+        page_size = sum(totals.values())
+
+        page_report = PageReport(
             user = self.user,
             website = website_report,
+            url = page_url,
             page_size = page_size,
             num_images = num_images,
             num_videos = num_videos,
-            num_external_resources = len(self.soup.find_all('link')),
-            num_internal_links = len(self.soup.find_all('a', href=self.url)),
-            num_external_links = len(self.soup.find_all('a', href=lambda x: x and self.url not in x)),
-            num_social_media_links = len(self.soup.find_all('a', href=lambda x: x and 'social' in x)),
+            num_external_resources = inventory.num_link_tags,
+            num_internal_links = inventory.num_internal_links,
+            num_external_links = inventory.num_external_links,
+            num_social_media_links = inventory.num_social_media_links,
         )
 
-        ImageReport.objects.create(
+        image_report = ImageReport(
             user = self.user,
             page = page_report,
             total_size = total_image_size,
             format = "jpeg",  
         )
 
-        VideoReport.objects.create(
+        video_report = VideoReport(
             user = self.user,
             page = page_report,
             total_size = total_video_size,
             format = "mp4",  
         )
 
-        total_energy_usage, _ = self.calculate_carbon_footprint(page_size)
-        _, carbon_footprint_images = self.calculate_carbon_footprint(total_image_size)
-        _, carbon_footprint_videos = self.calculate_carbon_footprint(total_video_size)
-        _, carbon_footprint_other = self.calculate_carbon_footprint(page_size - total_image_size - total_video_size)
-
-        carbon_footprint_score, _ = self.calculate_carbon_footprint(page_size)
-
-        CarbonFootprintReport.objects.create(
+        carbon_model = get_carbon_model()
+        carbon_footprint_report = CarbonFootprintReport(
             user=self.user,
             page=page_report,
-            total_energy_usage=total_energy_usage,
-            carbon_footprint_score=carbon_footprint_score,
-            carbon_footprint_images=carbon_footprint_images,
-            carbon_footprint_videos=carbon_footprint_videos,
-            carbon_footprint_other=carbon_footprint_other,
+            model_version=carbon_model.version,
+            **carbon_model.score_page(page_size, total_image_size, total_video_size),
         )
 
-        # Set the computed page_size in the PageReport model, then save it
-        page_report.page_size = page_size
-        page_report.save()
+        return page_report, image_report, video_report, carbon_footprint_report
+
+
+class WebParser(BaseWebParser):
+    def __init__(self, user, url):
+        super().__init__(user, url)
+        self.session = RecordingSession(get_session(), self.metrics)
+        self.sizer = ResourceSizer(session=self.session)
+        self.inventory = self.parse_web_page()
+    
+    # Parse the page into a PageInventory with the configured parser backend.
+    # Raises requests.HTTPError for an error status and NotHTMLError for
+    # anything but HTML, before reading the body.
+    def parse_web_page(self):
+        with self.metrics.phase('fetch'):
+            with self.session.get(self.url, timeout=self.sizer.timeout, stream=True) as response:
+                response.raise_for_status()
+                check_html(response)
+                content = response.content
+                self.page_url = response.url
+        with self.metrics.phase('parse'):
+            return get_parser().parse(content, self.page_url)
+
+    # Fetch and parse another page of the site, None if it is not HTML.
+    # Runs on the crawler's threads, inside the crawl phase.
+    def fetch_page(self, url):
+        with recording(self.metrics):
+            # Sites link to downloads too: the headers decide before any
+            # of the body is read
+            with self.session.get(url, timeout=self.sizer.timeout, stream=True) as response:
+                if not response.ok or 'html' not in response.headers.get('Content-Type', 'text/html'):
+                    return None
+                content = read_limited(response, page_size_limit())
+            if content is None:
+                return None
+            return get_parser().parse(content, url)
+
+    # (CSS text, wire size in bytes) of a stylesheet, None if it cannot be
+    # read or is too large to parse. Runs on the stylesheet stage's threads.
+    def fetch_stylesheet(self, url):
+        if url not in self.stylesheet_memo:
+            result = None
+            try:
+                with self.session.get(url, timeout=self.sizer.timeout, stream=True) as response:
+                    if response.ok and 'html' not in response.headers.get('Content-Type', ''):
+                        content = read_limited(response, css_size_limit())
+                        if content is not None:
+                            result = content.decode('utf-8', 'replace'), wire_bytes(response)
+            except requests.RequestException:
+                pass
+            self.stylesheet_memo[url] = result
+        return self.stylesheet_memo[url]
+
+    # Follow the stylesheets and @imports of each page for the background
+    # images and fonts they load. The stylesheets fetched need no sizing.
+    def analyze_css(self, pages):
+        for page_url, inventory in pages:
+            crawl = analyze_stylesheets(page_url, inventory, self.fetch_stylesheet, max_workers=self.sizer.max_workers)
+            self.size_memo.update(crawl.sizes)
+
+    def get_resource_size(self, resource_url, unit='KB'):
+        absolute_url = urljoin(self.page_url, resource_url)
+        return self.convert_size(self.sizer.fetch_size(absolute_url), unit)
+
+    # Size many resources in one concurrent wave, returns {resource_url: size}
+    def get_resource_sizes(self, resource_urls, unit='KB'):
+        absolute_urls = {resource_url: urljoin(self.page_url, resource_url) for resource_url in resource_urls}
+        self.size_memo.update(self.sizer.size_all(url for url in absolute_urls.values() if url not in self.size_memo))
+        return self.memoized_sizes(resource_urls, unit)
+
+    def scrape_page(self):
+        return self.save_reports(*self.build_reports())
+
+    # Crawl same-origin pages from the start page and report on each of them
+    def crawl(self, max_pages=None, max_depth=None):
+        return self.save_reports(*self.build_reports(max_pages or 1, max_depth))
+
+    # Analyze the page, or crawl up to max_pages pages of the site, and
+    # return the unsaved WebsiteReport, with its totals filled in, and a
+    # (page, image, video, carbon footprint) report tuple per page, so
+    # several analyses can be saved together with their self.metrics.
+    def build_reports(self, max_pages=1, max_depth=None):
+        if max_pages > 1:
+            with self.metrics.phase('crawl'):
+                pages = Crawler(self.fetch_page, max_pages=max_pages, max_depth=max_depth).crawl(self.page_url, self.inventory)
+            num_pages = len(pages)
+        else:
+            pages = [(self.page_url, self.inventory)]
+            num_pages = self.inventory.num_links
+        with self.metrics.phase('css'):
+            self.analyze_css(pages)
+
+        # Size the resources of every page in one wave; assets shared
+        # between pages are only sized once.
+        with self.metrics.phase('build'):
+            resources = {page_url: classify_resources(inventory, page_url) for page_url, inventory in pages}
+        with self.metrics.phase('sizing'):
+            self.get_resource_sizes(external_urls(resources))
+        return self.assemble_reports(pages, num_pages, resources)
+
+# Bytes of CSS read at most to parse a stylesheet
+def css_size_limit():
+    return getattr(settings, 'SCRAPER_CSS_MAX_SIZE', 2 * 1024 * 1024)
+
+class NotHTMLError(ValueError):
+    pass
+
+# Raises NotHTMLError unless the response is an HTML page
+def check_html(response):
+    content_type = response.headers.get('Content-Type', 'text/html')
+    if 'html' not in content_type:
+        raise NotHTMLError(f'{response.url} is {content_type}, not HTML')
+
+# Bytes of HTML read at most to parse a crawled page
+def page_size_limit():
+    return getattr(settings, 'SCRAPER_CRAWL_MAX_PAGE_SIZE', 5 * 1024 * 1024)
+
+# The body of a streamed response, None when it is larger than limit bytes
+def read_limited(response, limit):
+    content = bytearray()
+    for chunk in response.iter_content(CHUNK_SIZE):
+        content += chunk
+        if len(content) > limit:
+            return None
+    return bytes(content)
+
+async def aread_limited(response, limit):
+    content = bytearray()
+    async for chunk in response.aiter_bytes(CHUNK_SIZE):
+        content += chunk
+        if len(content) > limit:
+            return None
+    return bytes(content)
+
+# URLs of the resources that are sized over the network
+def external_urls(resources):
+    return [
+        resource.url for page_resources in resources.values()
+        for resource in page_resources if not resource.is_inline
+    ]
+
+
+# Parsing is CPU bound, so on the event loop it runs in a worker thread
+async def parse_page(content, url):
+    return await sync_to_async(get_parser().parse, thread_sensitive=False)(content, url)
+
+
+class AsyncWebParser(BaseWebParser):
+    """WebParser for async views.
+
+    Pages and assets are fetched with the shared httpx client of the event
+    loop, pages are parsed in worker threads and the reports are saved
+    through sync_to_async, so under ASGI one process overlaps the requests
+    of many analyses instead of holding a thread for each. Create it with
+    `await AsyncWebParser.create(user, url)`, then await ascrape_page() or
+    acrawl().
+    """
+
+    def __init__(self, user, url):
+        # Fetches nothing, create() does
+        super().__init__(user, url)
+        self.sizer = AsyncResourceSizer()
+
+    @classmethod
+    async def create(cls, user, url):
+        web_parser = cls(user, url)
+        web_parser.inventory = await web_parser.aparse_web_page()
+        return web_parser
+
+    # parse_web_page(), raising httpx.HTTPStatusError for an error status
+    async def aparse_web_page(self):
+        with self.metrics.phase('fetch'):
+            async with async_host_slots(self.url):
+                async with self.sizer.session.stream('GET', self.url, timeout=self.sizer.timeout, follow_redirects=True) as response:
+                    response.raise_for_status()
+                    check_html(response)
+                    content = await response.aread()
+                    self.page_url = str(response.url)
+        with self.metrics.phase('parse'):
+            return await parse_page(content, self.page_url)
+
+    async def afetch_page(self, url):
+        async with async_host_slots(url):
+            async with self.sizer.session.stream('GET', url, timeout=self.sizer.timeout, follow_redirects=True) as response:
+                if response.status_code >= 400 or 'html' not in response.headers.get('Content-Type', 'text/html'):
+                    return None
+                content = await aread_limited(response, page_size_limit())
+        if content is None:
+            return None
+        return await parse_page(content, url)
+
+    async def afetch_stylesheet(self, url):
+        if url not in self.stylesheet_memo:
+            result = None
+            try:
+                async with async_host_slots(url):
+                    async with self.sizer.session.stream('GET', url, timeout=self.sizer.timeout, follow_redirects=True) as response:
+                        if response.status_code < 400 and 'html' not in response.headers.get('Content-Type', ''):
+                            content = await aread_limited(response, css_size_limit())
+                            if content is not None:
+                                result = content.decode('utf-8', 'replace'), wire_bytes(response)
+            except httpx.HTTPError:
+                pass
+            self.stylesheet_memo[url] = result
+        return self.stylesheet_memo[url]
+
+    async def aanalyze_css(self, pages):
+        for page_url, inventory in pages:
+            crawl = await aanalyze_stylesheets(page_url, inventory, self.afetch_stylesheet)
+            self.size_memo.update(crawl.sizes)
+
+    async def aget_resource_sizes(self, resource_urls, unit='KB'):
+        absolute_urls = {resource_url: urljoin(self.page_url, resource_url) for resource_url in resource_urls}
+        self.size_memo.update(await self.sizer.asize_all(url for url in absolute_urls.values() if url not in self.size_memo))
+        return self.memoized_sizes(resource_urls, unit)
+
+    async def ascrape_page(self):
+        return await self.asave_reports(*await self.abuild_reports())
+
+    async def acrawl(self, max_pages=None, max_depth=None):
+        return await self.asave_reports(*await self.abuild_reports(max_pages or 1, max_depth))
+
+    async def abuild_reports(self, max_pages=1, max_depth=None):
+        if max_pages > 1:
+            with self.metrics.phase('crawl'):
+                crawler = Crawler(self.afetch_page, max_pages=max_pages, max_depth=max_depth)
+                pages = await crawler.acrawl(self.page_url, self.inventory)
+            num_pages = len(pages)
+        else:
+            pages = [(self.page_url, self.inventory)]
+            num_pages = self.inventory.num_links
+        with self.metrics.phase('css'):
+            await self.aanalyze_css(pages)
+
+        with self.metrics.phase('build'):
+            resources = {page_url: classify_resources(inventory, page_url) for page_url, inventory in pages}
+        with self.metrics.phase('sizing'):
+            await self.aget_resource_sizes(external_urls(resources))
+        # Every external size is memoized now, so building the reports
+        # makes no requests
+        return self.assemble_reports(pages, num_pages, resources)
+
+    async def asave_reports(self, website_report, page_reports):
+        # The reports are saved in one transaction, which the async ORM
+        # cannot open, so this runs on the sync thread
+        return await sync_to_async(self.save_reports)(website_report, page_reports)
+
+# Add https:// if the URL has no scheme and validate it, raises ValidationError
+def clean_url(url):
+    url = 'https://' + url if not url.startswith(('http://', 'https://')) else url
+    URLValidator()(url)
+    return url
+
+# The URL and number of pages posted to the analyze form, raises
+# ValidationError for an invalid URL
+def read_analyze_form(data, crawl_max_pages):
+    url = clean_url(data.get('url', ''))
+    # More than one page crawls the site from this URL
+    try:
+        max_pages = int(data.get('max_pages') or 1)
+    except ValueError:
+        max_pages = 1
+    return url, min(max(max_pages, 1), crawl_max_pages)
 
 def analyze(request):    
     # user must be logged in to access this page
     if not request.user.is_authenticated:
         return redirect('login')
-    # if the user is logged in and the request is POST, then scrape the page
+    crawl_max_pages = getattr(settings, 'SCRAPER_CRAWL_MAX_PAGES', 10)
+    # if the user is logged in and the request is POST, then queue the page for analysis
     if request.method == 'POST':
-        url = request.POST.get('url')
-        url = 'https://' + url if not url.startswith('https') else url
-        # Validate the URL
-        validate = URLValidator()
         try:
-            validate(url)
+            url, max_pages = read_analyze_form(request.POST, crawl_max_pages)
         except ValidationError:
-            return render(request, 'scraper/scrape.html', {'error': 'Invalid URL'})
-        web_parser = WebParser(request.user, url)
-        web_parser.scrape_page()
+            return render(request, 'scraper/scrape.html', {'error': 'Invalid URL', 'crawl_max_pages': crawl_max_pages})
+        enqueue_analysis(request.user, url, max_pages=max_pages)
         return redirect('list_website_reports')
-    return render(request, 'scraper/scrape.html')
+    return render(request, 'scraper/scrape.html', {'crawl_max_pages': crawl_max_pages})
+
+# analyze() for ASGI deployments (SCRAPER_ASYNC_ANALYZE): the analysis runs
+# on the event loop while the request waits, then shows the report.
+async def analyze_async(request):
+    user = await request.auser()
+    if not user.is_authenticated:
+        return redirect('login')
+    crawl_max_pages = getattr(settings, 'SCRAPER_CRAWL_MAX_PAGES', 10)
+    # The context processors read request.user, which queries synchronously
+    arender = sync_to_async(render)
+    if request.method == 'POST':
+        try:
+            url, max_pages = read_analyze_form(request.POST, crawl_max_pages)
+        except ValidationError:
+            return await arender(request, 'scraper/scrape.html', {'error': 'Invalid URL', 'crawl_max_pages': crawl_max_pages})
+        try:
+            web_parser = await AsyncWebParser.create(user, url)
+            website_report = await web_parser.acrawl(max_pages)
+        except httpx.HTTPError:
+            return await arender(request, 'scraper/scrape.html', {'error': f'Could not fetch {url}', 'crawl_max_pages': crawl_max_pages})
+        except NotHTMLError:
+            return await arender(request, 'scraper/scrape.html', {'error': f'{url} is not an HTML page', 'crawl_max_pages': crawl_max_pages})
+        return redirect('show_website_report', report_id=website_report.id)
+    return await arender(request, 'scraper/scrape.html', {'crawl_max_pages': crawl_max_pages})
+
+
+# Batch analysis API. Takes a JSON body {"urls": [...], "workers": 8,
+# "max_pages": 1} or a text/plain body with one URL per line (workers and
+# max_pages then come from the query string), and streams one JSON object
+# per line as each URL is done.
+@require_POST
+def analyze_batch(request):
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    options = request.GET
+    if request.content_type == 'application/json':
+        try:
+            options = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid JSON'}, status=400)
+        if not isinstance(options, dict):
+            return JsonResponse({'error': 'Expected a JSON object'}, status=400)
+        urls = options.get('urls')
+        if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+            return JsonResponse({'error': '"urls" must be a list of strings'}, status=400)
+    else:
+        urls = list(read_urls(request.body.decode(request.encoding or 'utf-8').splitlines()))
+
+    if not urls:
+        return JsonResponse({'error': 'No URLs given'}, status=400)
+    max_urls = getattr(settings, 'SCRAPER_BULK_MAX_URLS', 5000)
+    if len(urls) > max_urls:
+        return JsonResponse({'error': f'At most {max_urls} URLs per batch'}, status=400)
+    try:
+        workers = int(options.get('workers') or getattr(settings, 'SCRAPER_BULK_WORKERS', 8))
+        max_pages = int(options.get('max_pages') or 1)
+    except (TypeError, ValueError):
+        return JsonResponse({'error': '"workers" and "max_pages" must be numbers'}, status=400)
+    workers = min(max(workers, 1), getattr(settings, 'SCRAPER_BULK_MAX_WORKERS', 16))
+    max_pages = min(max(max_pages, 1), getattr(settings, 'SCRAPER_CRAWL_MAX_PAGES', 10))
+
+    results = analyze_urls(request.user, urls, workers=workers, max_pages=max_pages)
+    return StreamingHttpResponse(
+        (json.dumps(result) + '\n' for result in results),
+        content_type='application/x-ndjson',
+    )